@@ -1,70 +1,82 @@
-from flask import Flask, jsonify, request, send_from_directory, url_for
+from flask import Flask, Request, abort, g, jsonify, request, send_from_directory, url_for
 from flask_cors import CORS
 import os
-import sqlite3
-import bcrypt
 from datetime import datetime, timedelta
 import jwt
-import random
-import string
 import json
-import mimetypes
-from uuid import uuid4
 from collections import defaultdict
+from concurrent.futures import TimeoutError as FutureTimeout
 import re
-import tempfile
-from werkzeug.utils import secure_filename
-from PIL import Image
-
-try:
-    import easyocr
-    import numpy as np
-    # Initialize easyOCR reader once at module level (first use downloads models)
-    try:
-        ocr_reader = easyocr.Reader(['en'])
-    except Exception:
-        ocr_reader = None
-except ImportError:
-    easyocr = None
-    ocr_reader = None
+import sqlite3
+import threading
+import base64
+import hashlib
+import mimetypes
+import posixpath
+from werkzeug.security import safe_join
+
+from auth import AuthError, require_auth
+from crud import apply_balance_changes, get_balance_summary
+from receipt_ocr import ocr_available
+from ocr_jobs import OcrQueueFull
+from passwords import PasswordBusy, hash_password, replace_password, verify_password
+import attachment_store
+import auth
+import change_log
+import events
+import join_codes
+import ocr_cache
+import ocr_jobs
+import passwords
+import thumbnails
+from splitting import compute_custom_splits, SplitError
+from migrations import is_current, migrate
+import db
 
-try:
-    from pdf2image import convert_from_path
-except ImportError:
-    convert_from_path = None
+class UploadRequest(Request):
+    """
+    Streams multipart file parts straight into attachment_store staging
+    files instead of werkzeug's spooled temp files, so uploads are hashed,
+    size-capped and type-checked while they arrive.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            # An empty file input; the views ignore it
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        staged = attachment_store.StagedUpload(filename)
+        self.environ.setdefault('centsible.staged_uploads', []).append(staged)
+        return staged
 
-from crud import get_net_balances, get_user_balances
-from splitting import compute_custom_splits, SplitError
 
 # instance of Flask
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # This is for frontend communication
 CORS(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+app.config['DATABASE'] = db.DATABASE_PATH
+db.init_app(app)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_ROOT = os.path.join(BASE_DIR, 'uploads')
-ALLOWED_ATTACHMENT_EXTENSIONS = {
-    'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'heic', 'heif', 'pdf'
-}
-RECEIPT_KEYWORDS = [
-    'total amount',
-    'grand total',
-    'balance due',
-    'amount due',
-    'net total',
-    'final amount',
-    'payable amount',
-    'total'
-]
-# Words to exclude - these are intermediate totals, not final totals
-EXCLUDE_KEYWORDS = [
-    'subtotal',
-    'sub-total',
-    'sub total'
-]
+UPLOAD_ROOT = attachment_store.UPLOAD_ROOT
+ALLOWED_ATTACHMENT_EXTENSIONS = attachment_store.ALLOWED_EXTENSIONS
+# Uploaded files never change once written (uuid or content-hash names),
+# so browsers may keep them for a year without revalidating
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600
+# Behind nginx, set to an internal location aliased to UPLOAD_ROOT to let it
+# send the bytes; USE_X_SENDFILE=1 does the same for Apache/lighttpd
+UPLOADS_ACCEL_PREFIX = os.environ.get('UPLOADS_ACCEL_PREFIX')
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0').lower() in ('1', 'true')
+# /metrics exposes server internals and needs no login, so it is off by default
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0').lower() in ('1', 'true')
+# Requests with a larger body are refused before any of it is read
+app.config['MAX_CONTENT_LENGTH'] = attachment_store.MAX_REQUEST_BYTES
+# Activity feeds are paged; clients can ask for up to ACTIVITY_MAX_PAGE_SIZE items
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_MAX_PAGE_SIZE = 100
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
 
 @app.route('/ping', methods=['GET'])
@@ -97,41 +109,202 @@ def home():
     }), 200
 
 
+def upload_etag(filename, path):
+    """Blobs are named by their SHA-256, which makes a strong validator as is."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if filename.startswith('blobs/') and re.fullmatch(r'[0-9a-f]{64}', stem):
+        return stem
+    stat = os.stat(path)
+    return f'{int(stat.st_mtime)}-{stat.st_size}'
+
+
 @app.route('/uploads/<path:filename>', methods=['GET'])
 def serve_upload(filename):
-    """Serve uploaded attachments."""
-    return send_from_directory(UPLOAD_ROOT, filename, as_attachment=False)
+    """
+    Serve uploaded attachments with a strong ETag, immutable caching and
+    Range support. The body goes out through the server's file wrapper
+    (sendfile), or is handed to the front-end proxy when configured.
+    """
+    filename = posixpath.normpath(filename)
+    parts = filename.split('/')
+    if filename.startswith('/') or '..' in parts:
+        abort(404)
+    # Staging areas hold uploads that are still being processed, and kept
+    # originals may still carry EXIF/GPS metadata
+    if parts[0] in ('tmp', 'originals') or parts[:2] == ['blobs', 'tmp']:
+        abort(404)
+    return send_upload(filename)
+
+
+@app.route('/api/attachments/<int:attachment_id>/thumbnail/<key>', methods=['GET'])
+def serve_thumbnail(attachment_id, key):
+    """
+    Small preview of an attachment: a WebP thumbnail for images, a PNG of
+    the first page for PDFs. Generated on first request if the upload-time
+    job has not produced it (e.g. attachments from before thumbnails).
+    Like /uploads this is unauthenticated, so the URL carries the content
+    key to keep it unguessable. Rendering goes through the thumbnail
+    workers, which also collapse concurrent requests for the same one.
+    """
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT file_path, mime_type, content_hash FROM expense_attachments WHERE attachment_id = ?',
+        (attachment_id,)
+    ).fetchone()
+    conn.close()
+    if row is None or thumbnails.thumbnail_key(row) != key:
+        abort(404)
+    future = thumbnails.schedule(os.path.join(UPLOAD_ROOT, row['file_path']), key, row['mime_type'])
+    if future is None:
+        # Already generated, or a type without previews
+        relative_path = thumbnails.thumbnail_relative_path(key, row['mime_type'])
+    else:
+        try:
+            relative_path = future.result(timeout=thumbnails.THUMBNAIL_REQUEST_WAIT)
+        except FutureTimeout:
+            response = jsonify({'error': 'Thumbnail is still being generated'})
+            response.headers['Retry-After'] = '2'
+            return response, 503
+        except Exception as e:
+            print(f"Error generating thumbnail for attachment {attachment_id}: {str(e)}")
+            relative_path = None
+    if relative_path is None:
+        abort(404)
+    return send_upload(relative_path)
+
+
+def send_upload(filename):
+    """Send a file under UPLOAD_ROOT with the validators and caching described above."""
+    path = safe_join(UPLOAD_ROOT, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    etag = upload_etag(filename, path)
+
+    if UPLOADS_ACCEL_PREFIX:
+        response = app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = UPLOADS_ACCEL_PREFIX.rstrip('/') + '/' + filename
+        response.set_etag(etag)
+        response = response.make_conditional(request)
+    else:
+        response = send_from_directory(
+            UPLOAD_ROOT, filename, as_attachment=False,
+            etag=etag, max_age=UPLOAD_CACHE_MAX_AGE, conditional=True
+        )
+    response.cache_control.public = True
+    response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@app.before_request
+def parse_uploads():
+    """
+    Read multipart bodies before the view runs, so an oversized or
+    disallowed file is answered with its own status rather than being
+    caught by the view's generic error handling.
+    """
+    if request.method == 'POST' and request.mimetype == 'multipart/form-data':
+        request.files
+
+
+@app.teardown_request
+def discard_staged_uploads(exc=None):
+    attachment_store.discard_staged(request.environ)
+
+
+@app.errorhandler(413)
+@app.errorhandler(attachment_store.UnsupportedUpload)
+def upload_rejected(error):
+    if error.code == 413 and not isinstance(error, attachment_store.UploadTooLarge):
+        message = 'Upload is too large.'
+    else:
+        message = error.description
+    return jsonify({'error': message}), error.code
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Runtime metrics (connection pool usage, OCR queue depth and latency).
+    Only served with METRICS_ENABLED=1.
+    """
+    if not METRICS_ENABLED:
+        abort(404)
+    return jsonify({
+        'db_pool': db.get_pool().stats(),
+        'ocr_jobs': ocr_jobs.stats(),
+        'ocr_cache': ocr_cache.stats(),
+        'auth': auth.stats(),
+        'passwords': passwords.stats(),
+        'events': events.stats()
+    }), 200
+
+# Databases already brought up to date by this process
+_migrated_databases = set()
+_migrate_lock = threading.Lock()
+
+
+@app.before_request
+def apply_pending_migrations():
+    """
+    Upgrade the schema before the first request against a database, however
+    the app was started (python3 app.py, flask run, gunicorn, ...).
+    """
+    database = db.get_pool().database
+    if database in _migrated_databases:
+        return
+    with _migrate_lock:
+        if database in _migrated_databases:
+            return
+        conn = db.get_pool().acquire()
+        try:
+            if not is_current(conn):
+                migrate(conn)
+        finally:
+            conn.close()
+        _migrated_databases.add(database)
 
 # Database helper functions
 def get_db_connection():
-    conn = sqlite3.connect('test.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the pooled connection bound to the current request."""
+    return db.get_db()
 
 
-def ensure_expense_attachment_table():
-    """Ensure the attachment table exists for older databases."""
-    conn = get_db_connection()
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS expense_attachments (
-            attachment_id INTEGER PRIMARY KEY NOT NULL,
-            expense_id INTEGER NOT NULL,
-            file_path TEXT NOT NULL,
-            original_filename TEXT,
-            mime_type TEXT,
-            is_receipt INTEGER DEFAULT 0,
-            ocr_total NUMERIC,
-            created_at TEXT,
-            FOREIGN KEY (expense_id) REFERENCES expenses(expense_id) ON DELETE CASCADE
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
+def group_versions_etag(user_id, versions):
+    """
+    Weak ETag for a group read endpoint. groups.version moves on every write
+    that changes what the endpoint returns (see migration 10), so the caller,
+    the URL and the versions of the groups covered identify the response.
+    """
+    key = f'{user_id}:{request.url}:{versions}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
 
-ensure_expense_attachment_table()
+def not_modified(etag):
+    """A 304 for etag if the client already has it, else None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(app.response_class(status=304), etag)
+
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    # Cached per user, revalidated on every page view
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def membership_version(conn, user_id, group_id):
+    """The group's version if user_id is an active member, else None."""
+    row = conn.execute(
+        """
+        SELECT g.version
+        FROM members m
+        JOIN groups g ON g.group_id = m.group_id
+        WHERE m.user_id = ? AND m.group_id = ? AND m.deleted_at IS NULL
+        """,
+        (user_id, group_id)
+    ).fetchone()
+    return row['version'] if row else None
 
 
 def allowed_attachment(filename):
@@ -142,97 +315,6 @@ def allowed_attachment(filename):
     )
 
 
-def extract_amount_from_line(line):
-    """Extract decimal amount from a string."""
-    if not line:
-        return None
-    matches = re.findall(r'(-?\d[\d,]*(?:\.\d{1,2})?)', line.replace(',', ''))
-    for match in matches:
-        try:
-            value = float(match)
-            if value >= 0:
-                return round(value, 2)
-        except ValueError:
-            continue
-    return None
-
-
-def find_total_amount_in_text(text):
-    """Search multiline text for keywords and return the amount next to them."""
-    if not text:
-        return None
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    for idx, raw_line in enumerate(lines):
-        line = raw_line.lower()
-        # Skip lines that contain excluded keywords (like subtotal)
-        if any(exclude_word in line for exclude_word in EXCLUDE_KEYWORDS):
-            continue
-        for keyword in RECEIPT_KEYWORDS:
-            if keyword in line:
-                amount = extract_amount_from_line(raw_line)
-                if amount is not None:
-                    return amount
-                if idx + 1 < len(lines):
-                    next_amount = extract_amount_from_line(lines[idx + 1])
-                    if next_amount is not None:
-                        return next_amount
-    return None
-
-
-def run_receipt_ocr(file_path):
-    """Run OCR against a receipt file and try to detect the total amount."""
-    if ocr_reader is None:
-        return None, 'OCR is unavailable (easyocr not installed)'
-    text_chunks = []
-    try:
-        if file_path.lower().endswith('.pdf'):
-            if convert_from_path is None:
-                return None, 'PDF OCR requires pdf2image; please install it.'
-            images = convert_from_path(file_path, fmt='png', first_page=1, last_page=1)
-            for image in images:
-                # Convert PIL Image to numpy array for easyOCR
-                img_array = np.array(image)
-                # easyOCR returns [(bbox, text, confidence), ...], extract text (index 1)
-                results = ocr_reader.readtext(img_array)
-                text = '\n'.join([result[1] for result in results])
-                text_chunks.append(text)
-        else:
-            with Image.open(file_path) as img:
-                # Convert PIL Image to numpy array for easyOCR
-                img_array = np.array(img)
-                # easyOCR returns [(bbox, text, confidence), ...], extract text (index 1)
-                results = ocr_reader.readtext(img_array)
-                text = '\n'.join([result[1] for result in results])
-                text_chunks.append(text)
-    except Exception as exc:
-        return None, f'OCR failed: {exc}'
-
-    combined_text = '\n'.join(text_chunks)
-    amount = find_total_amount_in_text(combined_text)
-    if amount is None:
-        return None, 'Could not find a recognizable total on the receipt.'
-    return amount, None
-
-
-def save_attachment_file(expense_id, file_storage):
-    """Persist attachment to disk and return metadata dict."""
-    original_name = secure_filename(file_storage.filename or '')
-    extension = os.path.splitext(original_name)[1]
-    unique_name = f"{uuid4().hex}{extension}"
-    expense_dir = os.path.join(UPLOAD_ROOT, 'expenses', str(expense_id))
-    os.makedirs(expense_dir, exist_ok=True)
-    destination = os.path.join(expense_dir, unique_name)
-    file_storage.save(destination)
-    relative_path = os.path.relpath(destination, UPLOAD_ROOT)
-    mime_type = file_storage.mimetype or mimetypes.guess_type(original_name)[0] or 'application/octet-stream'
-    return {
-        'relative_path': relative_path.replace('\\', '/'),
-        'mime_type': mime_type,
-        'original_name': original_name or unique_name,
-        'absolute_path': destination
-    }
-
-
 def parse_json_field(raw_value, default_value):
     """Parse JSON arrays/objects coming from multipart forms."""
     if raw_value in (None, '', 'null', 'undefined'):
@@ -296,16 +378,339 @@ def map_attachment_row(row):
         'mime_type': row['mime_type'],
         'is_receipt': bool(row['is_receipt']),
         'ocr_total': float(row['ocr_total']) if row['ocr_total'] is not None else None,
-        'url': url_for('serve_upload', filename=row['file_path'], _external=True)
+        'url': url_for('serve_upload', filename=row['file_path'], _external=True),
+        'thumbnail_url': thumbnail_url(row['attachment_id'], row)
     }
 
-def hash_password(password):
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-def verify_password(password, hashed):
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+def thumbnail_url(attachment_id, row):
+    """Preview URL for images and PDFs; None for types without a preview."""
+    if thumbnails.thumbnail_relative_path('', row['mime_type']) is None:
+        return None
+    key = thumbnails.thumbnail_key(row)
+    return url_for('serve_thumbnail', attachment_id=attachment_id, key=key, _external=True)
+
+def parse_page_limit():
+    """Read ?limit= and clamp it to the server-side page size bounds."""
+    limit = request.args.get('limit', type=int) or ACTIVITY_PAGE_SIZE
+    return max(1, min(limit, ACTIVITY_MAX_PAGE_SIZE))
+
+
+def encode_activity_cursor(item):
+    """Opaque cursor for the (date, type, id) key of the last item on a page."""
+    raw = json.dumps([item['activity_date'], item['kind'], item['item_id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_activity_cursor(cursor):
+    """Inverse of encode_activity_cursor. Raises ValueError for malformed cursors."""
+    try:
+        activity_date, kind, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(activity_date, str) or kind not in ('expense', 'payment') or not isinstance(item_id, int):
+        raise ValueError('Invalid cursor')
+    return activity_date, kind, item_id
+
+
+def parse_activity_date_range():
+    """
+    Read inclusive ?from= / ?to= dates (YYYY-MM-DD).
+    Returns (lower, upper_exclusive) strings; raises ValueError if malformed.
+    """
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    lower = upper = None
+    if date_from:
+        lower = datetime.strptime(date_from, '%Y-%m-%d').date().isoformat()
+    if date_to:
+        upper = (datetime.strptime(date_to, '%Y-%m-%d').date() + timedelta(days=1)).isoformat()
+    return lower, upper
+
+
+def fetch_activity_page(conn, expense_filter, payment_filter, limit, cursor_key=None, date_range=(None, None)):
+    """
+    Return one page of (kind, item_id, activity_date) keys, newest first,
+    merged from expenses and payments in SQL, plus the cursor for the next page.
+
+    expense_filter / payment_filter are (sql, params) WHERE fragments for the
+    e / p aliases, or None to leave that type out. Items are ordered by
+    (date, type, id) so the cursor is a stable position even when several
+    items share a timestamp.
+    """
+    expense_date = "COALESCE(NULLIF(e.date, ''), e.created_at)"
+    arms = []
+    params = []
+    for kind, row_filter, date_sql, id_sql, table in (
+        ('expense', expense_filter, expense_date, 'e.expense_id', 'expenses e'),
+        ('payment', payment_filter, 'p.paid_at', 'p.payment_id', 'payments p'),
+    ):
+        if row_filter is None:
+            continue
+        where_sql, where_params = row_filter
+        conditions = [where_sql]
+        arm_params = list(where_params)
+        if date_range[0]:
+            conditions.append(f'{date_sql} >= ?')
+            arm_params.append(date_range[0])
+        if date_range[1]:
+            conditions.append(f'{date_sql} < ?')
+            arm_params.append(date_range[1])
+        if cursor_key:
+            conditions.append(f"({date_sql}, '{kind}', {id_sql}) < (?, ?, ?)")
+            arm_params.extend(cursor_key)
+        arms.append(
+            f"SELECT '{kind}' AS kind, {id_sql} AS item_id, {date_sql} AS activity_date "
+            f"FROM {table} WHERE " + ' AND '.join(f'({c})' for c in conditions)
+        )
+        params.extend(arm_params)
+
+    if not arms:
+        return [], None
+
+    page_query = f"""
+        SELECT kind, item_id, activity_date FROM (
+            {' UNION ALL '.join(arms)}
+        )
+        ORDER BY activity_date DESC, kind DESC, item_id DESC
+        LIMIT ?
+    """
+    page = conn.execute(page_query, params + [limit + 1]).fetchall()
+    next_cursor = encode_activity_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def load_expense_details(conn, expenses):
+    """Fetch splits and attachments for one page of expense rows."""
+    expense_splits_map = defaultdict(list)
+    expense_attachments_map = defaultdict(list)
+    if not expenses:
+        return expense_splits_map, expense_attachments_map
+
+    expense_ids = [expense['expense_id'] for expense in expenses]
+    placeholders_expenses = ','.join(['?' for _ in expense_ids])
+    splits_query = f"""
+        SELECT es.expense_id, es.user_id, es.amount, es.status, u.username
+        FROM expense_splits es
+        JOIN users u ON es.user_id = u.id
+        WHERE es.expense_id IN ({placeholders_expenses})
+        ORDER BY es.expense_id, u.username
+    """
+    payer_lookup = {expense['expense_id']: expense['paid_by'] for expense in expenses}
+    split_rows = conn.execute(splits_query, expense_ids).fetchall()
+    for split in split_rows:
+        status = split['status'] or ('payer' if split['user_id'] == payer_lookup.get(split['expense_id']) else 'owes')
+        expense_splits_map[split['expense_id']].append({
+            'user_id': split['user_id'],
+            'name': split['username'],
+            'amount': float(split['amount']),
+            'status': status
+        })
+
+    attachments_query = f"""
+        SELECT attachment_id, expense_id, file_path, original_filename, mime_type, is_receipt, ocr_total, content_hash
+        FROM expense_attachments
+        WHERE expense_id IN ({placeholders_expenses})
+        ORDER BY created_at DESC
+    """
+    attachment_rows = conn.execute(attachments_query, expense_ids).fetchall()
+    for attachment in attachment_rows:
+        expense_attachments_map[attachment['expense_id']].append(map_attachment_row(attachment))
+    return expense_splits_map, expense_attachments_map
+
+def format_expense_activity(expense, splits, attachments, user_id):
+    """Activity item for an expense row (with paid_by_name), as the group feed shows it."""
+    return {
+        'id': f"expense_{expense['expense_id']}",
+        'type': 'expense',
+        'description': expense['description'],
+        'amount': float(expense['amount']),
+        'paid_by': expense['paid_by_name'],
+        'paid_by_id': expense['paid_by'],
+        'date': expense['date'] or expense['created_at'],
+        'category': expense['category'] or '',
+        'is_my_expense': expense['paid_by'] == user_id,
+        'memo': expense['note'] or '',
+        'split_method': expense['split_method'] or '',
+        'splits': splits,
+        'attachments': attachments
+    }
+
+
+def format_payment_activity(payment, user_id):
+    """Activity item for a payment row (with paid_by_name and paid_to_name)."""
+    return {
+        'id': f"payment_{payment['payment_id']}",
+        'type': 'payment',
+        'description': f"Payment from {payment['paid_by_name']} to {payment['paid_to_name']}",
+        'amount': float(payment['amount']),
+        'paid_by': payment['paid_by_name'],
+        'paid_by_id': payment['paid_by'],
+        'paid_to': payment['paid_to_name'],
+        'paid_to_id': payment['paid_to'],
+        'date': payment['paid_at'],
+        'is_my_payment': payment['paid_by'] == user_id,
+        'is_paid_to_me': payment['paid_to'] == user_id,
+        'memo': '',
+        'splits': [],
+        'attachments': []
+    }
+
+
+def load_activity_item(conn, kind, item_id):
+    """One activity item by id, not yet personalised (see personalize_event)."""
+    if kind == 'expense':
+        expense = conn.execute(
+            """
+            SELECT e.expense_id, e.description, e.amount, e.paid_by, e.created_at, e.date, e.category,
+                   e.note, e.split_method,
+                   u.username as paid_by_name
+            FROM expenses e
+            JOIN users u ON e.paid_by = u.id
+            WHERE e.expense_id = ?
+            """,
+            (item_id,)
+        ).fetchone()
+        splits_map, attachments_map = load_expense_details(conn, [expense])
+        return format_expense_activity(expense, splits_map.get(item_id, []), attachments_map.get(item_id, []), None)
+    payment = conn.execute(
+        """
+        SELECT p.payment_id, p.paid_by, p.paid_to, p.amount, p.paid_at,
+               u1.username as paid_by_name, u2.username as paid_to_name
+        FROM payments p
+        JOIN users u1 ON p.paid_by = u1.id
+        JOIN users u2 ON p.paid_to = u2.id
+        WHERE p.payment_id = ?
+        """,
+        (item_id,)
+    ).fetchone()
+    return format_payment_activity(payment, None)
+
+
+def load_balance_rows(conn, group_id, pairs):
+    """
+    Current balance between each (user, user) pair, in the shape of
+    /api/groups/<id>/balances rows. Settled pairs come back with amount 0.
+    """
+    rows = []
+    for pair in sorted({(min(a, b), max(a, b)) for a, b in pairs if a != b}):
+        row = conn.execute(
+            """
+            SELECT bp.amount, lo.username AS lo_name, hi.username AS hi_name
+            FROM balance_pairs bp
+            JOIN users lo ON lo.id = bp.user_lo
+            JOIN users hi ON hi.id = bp.user_hi
+            WHERE bp.group_id = ? AND bp.user_lo = ? AND bp.user_hi = ?
+            """,
+            (group_id, pair[0], pair[1])
+        ).fetchone()
+        if row is None:
+            continue
+        lender, borrower = (pair[0], row['lo_name']), (pair[1], row['hi_name'])
+        if row['amount'] < 0:
+            # Positive amounts mean user_hi owes user_lo
+            lender, borrower = borrower, lender
+        rows.append({
+            'lender_id': lender[0],
+            'lender_name': lender[1],
+            'borrower_id': borrower[0],
+            'borrower_name': borrower[1],
+            'amount': abs(float(row['amount']))
+        })
+    return rows
+
+
+def balance_changes_for_log(conn, group_id, pairs):
+    """change_log entries for the current balance of each pair, keyed '<user_lo>:<user_hi>'."""
+    changes = []
+    for row in load_balance_rows(conn, group_id, pairs):
+        key = f"{min(row['lender_id'], row['borrower_id'])}:{max(row['lender_id'], row['borrower_id'])}"
+        changes.append(('balance', key, 'update', dict(row, group_id=group_id)))
+    return changes
+
+
+def member_change(user_id, username, group_id, group_name, joined_at):
+    """change_log entry for a user joining (or creating) a group."""
+    return ('member', user_id, 'insert', {
+        'group_id': group_id,
+        'group_name': group_name,
+        'user_id': user_id,
+        'username': username,
+        'joined_at': joined_at
+    })
+
+
+def publish_group_event(conn, group_id, event_type, activity=None, pairs=(), member=None):
+    """
+    Push what a write changed to the group's event stream and to each
+    member's. Call after commit, before closing conn. Only the deltas are
+    sent: the new activity item (activity is its (kind, id)), the balance
+    rows that moved, the member who joined, and (on user streams) the
+    member's new totals. Everything is loaded in here, so a failure cannot
+    turn the committed write into an error response.
+    """
+    try:
+        data = {
+            'group_id': group_id,
+            'activity': load_activity_item(conn, *activity) if activity else None,
+            'balances': load_balance_rows(conn, group_id, pairs),
+            'member': member
+        }
+        events.publish(events.group_channel(group_id), event_type, data)
+
+        member_ids = [row['user_id'] for row in conn.execute(
+            'SELECT user_id FROM members WHERE group_id = ? AND deleted_at IS NULL', (group_id,)
+        )]
+        changed = {user for pair in pairs for user in pair}
+        totals = {}
+        for user in changed:
+            net, owed_by_me, owed_to_me = conn.execute(
+                """
+                SELECT COALESCE(SUM(net), 0), COALESCE(SUM(owed_by_me), 0), COALESCE(SUM(owed_to_me), 0)
+                FROM user_balance_summary
+                WHERE user_id = ?
+                """,
+                (user,)
+            ).fetchone()
+            totals[user] = {
+                'net_balance': round(float(net), 2),
+                'owed_by_me': round(float(owed_by_me), 2),
+                'owed_to_me': round(float(owed_to_me), 2)
+            }
+        for member_id in member_ids:
+            events.publish(events.user_channel(member_id), event_type, dict(data, balance=totals.get(member_id)))
+    except Exception as e:
+        # The write already committed; clients catch up on their next reload
+        print(f"Error publishing {event_type} for group {group_id}: {str(e)}")
+
+
+def personalize_event(user_id):
+    """Stream transform filling in the viewer-relative flags of activity items."""
+    def transform(event):
+        activity = event['data'].get('activity')
+        if not activity:
+            return event
+        activity = dict(activity)
+        if activity['type'] == 'expense':
+            activity['is_my_expense'] = activity['paid_by_id'] == user_id
+        else:
+            activity['is_my_payment'] = activity['paid_by_id'] == user_id
+            activity['is_paid_to_me'] = activity['paid_to_id'] == user_id
+        return dict(event, data=dict(event['data'], activity=activity))
+    return transform
+
+
+def event_stream_response(channels, user_id):
+    """Streaming text/event-stream response for the given channels."""
+    response = app.response_class(
+        events.stream(channels, request.headers.get('Last-Event-ID'), personalize_event(user_id)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 
 def generate_token(user_id):
     """Generate JWT token for user"""
@@ -315,84 +720,14 @@ def generate_token(user_id):
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
-def generate_join_code():
-    """Generate a unique 4-digit alphanumeric join code"""
-    while True:
-        # Generate 4-character code with uppercase letters and numbers
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        
-        # Check if code already exists
-        conn = get_db_connection()
-        existing = conn.execute(
-            'SELECT 1 FROM groups WHERE join_code = ?', (code,)
-        ).fetchone()
-        conn.close()
-        
-        if not existing:
-            return code
-
 def consolidate_balances(conn, group_id, lender_id, borrower_id, amount):
     """
     Consolidate balances between two users in a group.
-    If a balance already exists, update it. If it would result in 0 or negative,
-    handle the reversal appropriately.
+    Positive amounts mean the borrower owes the lender more; negative amounts
+    (payments) reduce the debt. The pair is stored as one signed row, so this
+    is a single upsert whichever direction the existing balance runs.
     """
-    # Check if there's an existing balance in either direction
-    existing_lender_to_borrower = conn.execute(
-        'SELECT balance_id, amount FROM balances WHERE group_id = ? AND lender = ? AND borrower = ?',
-        (group_id, lender_id, borrower_id)
-    ).fetchone()
-    
-    existing_borrower_to_lender = conn.execute(
-        'SELECT balance_id, amount FROM balances WHERE group_id = ? AND lender = ? AND borrower = ?',
-        (group_id, borrower_id, lender_id)
-    ).fetchone()
-    
-    now = datetime.now().isoformat()
-    
-    if existing_lender_to_borrower:
-        # Update existing balance in the same direction
-        new_amount = existing_lender_to_borrower['amount'] + amount
-        if new_amount <= 0:
-            # Delete the balance if it becomes zero or negative
-            conn.execute(
-                'DELETE FROM balances WHERE balance_id = ?',
-                (existing_lender_to_borrower['balance_id'],)
-            )
-        else:
-            # Update the balance
-            conn.execute(
-                'UPDATE balances SET amount = ?, updated_at = ? WHERE balance_id = ?',
-                (new_amount, now, existing_lender_to_borrower['balance_id'])
-            )
-    elif existing_borrower_to_lender:
-        # There's a balance in the opposite direction
-        existing_amount = existing_borrower_to_lender['amount']
-        if amount >= existing_amount:
-            # New amount is greater than or equal to existing, reverse the direction
-            new_amount = amount - existing_amount
-            conn.execute(
-                'DELETE FROM balances WHERE balance_id = ?',
-                (existing_borrower_to_lender['balance_id'],)
-            )
-            if new_amount > 0:
-                conn.execute(
-                    'INSERT INTO balances (group_id, lender, borrower, amount, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
-                    (group_id, lender_id, borrower_id, new_amount, now, now)
-                )
-        else:
-            # New amount is less than existing, reduce the existing balance
-            new_amount = existing_amount - amount
-            conn.execute(
-                'UPDATE balances SET amount = ?, updated_at = ? WHERE balance_id = ?',
-                (new_amount, now, existing_borrower_to_lender['balance_id'])
-            )
-    else:
-        # No existing balance, create new one
-        conn.execute(
-            'INSERT INTO balances (group_id, lender, borrower, amount, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
-            (group_id, lender_id, borrower_id, amount, now, now)
-        )
+    apply_balance_changes(conn, group_id, [(lender_id, borrower_id, amount)])
 
 # Authentication routes
 @app.route('/auth/signup', methods=['POST'])
@@ -424,18 +759,25 @@ def signup():
             'SELECT id FROM users WHERE email = ?', (email,)
         ).fetchone()
         
+        conn.close()
+        
         if existing_user:
-            conn.close()
             return jsonify({'error': 'User with this email already exists'}), 409
         
-        # Create new user
+        # Hashing can wait on the password pool, so no connection is held meanwhile
         password_hash = hash_password(password)
         now = datetime.now().isoformat()
         
-        cursor = conn.execute(
-            'INSERT INTO users (username, email, password_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
-            (name, email, password_hash, now, now)
-        )
+        # Create new user; the UNIQUE email catches a signup that raced this one
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO users (username, email, password_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (name, email, password_hash, now, now)
+            )
+        except sqlite3.IntegrityError:
+            conn.close()
+            return jsonify({'error': 'User with this email already exists'}), 409
         
         user_id = cursor.lastrowid
         conn.commit()
@@ -454,6 +796,8 @@ def signup():
             'token': token
         }), 201
         
+    except PasswordBusy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -486,6 +830,10 @@ def login():
         if not verify_password(password, user['password_hash']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Hashes made at an older BCRYPT_ROUNDS are upgraded after responding
+        if passwords.needs_rehash(user['password_hash']):
+            passwords.rehash_in_background(user['id'], password, user['password_hash'])
+        
         # Generate token
         token = generate_token(user['id'])
         
@@ -499,13 +847,16 @@ def login():
             'token': token
         }), 200
         
+    except PasswordBusy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/auth/verify', methods=['POST'])
 def verify_token():
     """
-    Verify JWT token
+    Verify JWT token. Answered from the token and profile caches, so the
+    check every page makes on load normally costs no database query.
     """
     try:
         data = request.get_json()
@@ -514,57 +865,27 @@ def verify_token():
         if not token:
             return jsonify({'error': 'Token required'}), 400
         
-        # Decode token
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        # Get user info
-        conn = get_db_connection()
-        user = conn.execute(
-            'SELECT id, username, email FROM users WHERE id = ?', (user_id,)
-        ).fetchone()
-        conn.close()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        try:
+            user = auth.authenticate(token)
+        except AuthError as e:
+            return jsonify({'error': e.message}), e.status
         
         return jsonify({
             'valid': True,
-            'user': {
-                'id': user['id'],
-                'name': user['username'],
-                'email': user['email']
-            }
+            'user': user
         }), 200
         
-    except jwt.ExpiredSignatureError:
-        return jsonify({'error': 'Token expired'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/users/profile', methods=['PUT'])
+@require_auth
 def update_profile():
     """
     Update user profile (name and email)
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         data = request.get_json()
         
@@ -623,6 +944,7 @@ def update_profile():
         
         conn.commit()
         conn.close()
+        auth.invalidate_user(user_id)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -637,26 +959,13 @@ def update_profile():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/users/password', methods=['PUT'])
+@require_auth
 def update_password():
     """
     Update user password
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         data = request.get_json()
         
@@ -676,74 +985,51 @@ def update_password():
         user = conn.execute(
             'SELECT password_hash FROM users WHERE id = ?', (user_id,)
         ).fetchone()
+        conn.close()
         
         if not user:
-            conn.close()
             return jsonify({'error': 'User not found'}), 404
         
-        # Check if new password is the same as current password
-        if verify_password(new_password, user['password_hash']):
-            conn.close()
+        # Compare with the current password and hash the new one in a single pool task
+        new_password_hash = replace_password(new_password, user['password_hash'])
+        if new_password_hash is None:
             return jsonify({'error': 'New password must be different from current password'}), 400
         
-        # Hash new password
-        new_password_hash = hash_password(new_password)
-        
         # Update password
         now = datetime.now().isoformat()
-        conn.execute(
+        conn = get_db_connection()
+        updated = conn.execute(
             'UPDATE users SET password_hash = ?, updated_at = ? WHERE id = ?',
             (new_password_hash, now, user_id)
-        )
+        ).rowcount
         
         conn.commit()
         conn.close()
         
+        if not updated:
+            return jsonify({'error': 'User not found'}), 404
+        
         return jsonify({
             'message': 'Password updated successfully'
         }), 200
         
+    except PasswordBusy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/balance', methods=['GET'])
+@require_auth
 def get_balance():
     """
     Get user balance information
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
+        user_id = g.user_id
         
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
-        
-        # Get user's net balance
-        net_balances = get_net_balances()
-        user_balance = net_balances.get(user_id, 0.0)
-        
-        # Get detailed balances for this user
-        user_balances = get_user_balances(user_id)
-        
-        # Calculate amounts owed and owed to user
-        owed_by_me = 0.0  # Amount I owe to others
-        owed_to_me = 0.0  # Amount others owe me
-        
-        for lender, borrower, amount in user_balances:
-            if borrower == user_id:
-                owed_by_me += amount  # I owe this amount
-            elif lender == user_id:
-                owed_to_me += amount  # Others owe me this amount
+        # Net balance, amount I owe and amount owed to me, read from the
+        # per-user summary maintained alongside the balance ledger
+        user_balance, owed_by_me, owed_to_me = get_balance_summary(user_id)
         
         return jsonify({
             'net_balance': round(user_balance, 2),
@@ -756,27 +1042,14 @@ def get_balance():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/unpaid-expenses', methods=['GET'])
+@require_auth
 def get_unpaid_expenses():
     """
     Get unpaid expenses that are 2+ days old for the authenticated user
     Returns expenses grouped by lender with aggregated totals and individual expense details
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         conn = get_db_connection()
         
@@ -800,14 +1073,13 @@ def get_unpaid_expenses():
             JOIN expenses e ON es.expense_id = e.expense_id
             JOIN users u ON e.paid_by = u.id
             JOIN groups g ON e.group_id = g.group_id
-            LEFT JOIN balances b ON b.group_id = e.group_id 
+            JOIN balances b ON b.group_id = e.group_id 
                 AND b.lender = e.paid_by 
                 AND b.borrower = ?
                 AND b.amount > 0
             WHERE es.user_id = ?
                 AND es.status = 'owes'
                 AND COALESCE(e.date, e.created_at) < ?
-                AND b.balance_id IS NOT NULL
             ORDER BY e.paid_by, COALESCE(e.date, e.created_at) DESC
         """
         
@@ -866,118 +1138,84 @@ def get_unpaid_expenses():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/activity', methods=['GET'])
+@require_auth
 def get_recent_activity():
     """
-    Get recent activity for the user (expenses and payments from their groups)
+    Get recent activity for the user (expenses and payments from their groups).
+    Paged with ?limit= and ?cursor=; pass back next_cursor to get older items.
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
+        user_id = g.user_id
         
-        # Verify token
+        limit = parse_page_limit()
+        cursor = request.args.get('cursor')
         try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
-        
-        # Get user's groups
+            cursor_key = decode_activity_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
         conn = get_db_connection()
-        user_groups = conn.execute(
-            'SELECT group_id FROM members WHERE user_id = ? AND deleted_at IS NULL', (user_id,)
-        ).fetchall()
-        
-        if not user_groups:
-            conn.close()
-            return jsonify({'activities': []}), 200
-        
-        group_ids = [group['group_id'] for group in user_groups]
-        
-        # Get recent expenses from user's groups
-        # Use LEFT JOIN with balances to check if user owes money from each expense
-        placeholders = ','.join(['?' for _ in group_ids])
-        expenses_query = f"""
-            SELECT e.expense_id, e.group_id, e.description, e.amount, e.paid_by, e.created_at, e.date, e.category,
-                   e.note, e.split_method,
-                   u.username as paid_by_name, g.group_name,
-                   CASE WHEN b.balance_id IS NOT NULL THEN 1 ELSE 0 END as user_owes
-            FROM expenses e
-            JOIN users u ON e.paid_by = u.id
-            JOIN groups g ON e.group_id = g.group_id
-            LEFT JOIN balances b ON e.group_id = b.group_id 
-                AND e.paid_by = b.lender 
-                AND b.borrower = ?
-                AND b.amount > 0
-            WHERE e.group_id IN ({placeholders})
-            ORDER BY e.created_at DESC
-        """
-        
-        expenses = conn.execute(expenses_query, [user_id] + group_ids).fetchall()
-        
-        # Get recent payments involving the user from their groups
-        payments_query = f"""
-            SELECT p.payment_id, p.paid_by, p.paid_to, p.amount, p.paid_at, p.group_id,
-                   u1.username as paid_by_name, u2.username as paid_to_name, g.group_name
-            FROM payments p
-            JOIN users u1 ON p.paid_by = u1.id
-            JOIN users u2 ON p.paid_to = u2.id
-            JOIN groups g ON p.group_id = g.group_id
-            WHERE (p.paid_by = ? OR p.paid_to = ?) AND p.group_id IN ({placeholders})
-            ORDER BY p.paid_at DESC
-        """
-        
-        payments = conn.execute(payments_query, [user_id, user_id] + group_ids).fetchall()
-        
-        expense_splits_map = defaultdict(list)
-        expense_attachments_map = defaultdict(list)
-        if expenses:
-            expense_ids = [expense['expense_id'] for expense in expenses]
-            placeholders_expenses = ','.join(['?' for _ in expense_ids])
-            splits_query = f"""
-                SELECT es.expense_id, es.user_id, es.amount, es.status, u.username
-                FROM expense_splits es
-                JOIN users u ON es.user_id = u.id
-                WHERE es.expense_id IN ({placeholders_expenses})
-                ORDER BY es.expense_id, u.username
+
+        # Merge expenses and payments in SQL and keep only one page of keys
+        my_groups = 'SELECT group_id FROM members WHERE user_id = ? AND deleted_at IS NULL'
+        page, next_cursor = fetch_activity_page(
+            conn,
+            (f'e.group_id IN ({my_groups})', [user_id]),
+            (f'(p.paid_by = ? OR p.paid_to = ?) AND p.group_id IN ({my_groups})', [user_id, user_id, user_id]),
+            limit,
+            cursor_key
+        )
+
+        expense_ids = [item['item_id'] for item in page if item['kind'] == 'expense']
+        payment_ids = [item['item_id'] for item in page if item['kind'] == 'payment']
+
+        # Full rows (and splits/attachments) only for the items on this page
+        expenses = []
+        if expense_ids:
+            placeholders = ','.join(['?' for _ in expense_ids])
+            expenses_query = f"""
+                SELECT e.expense_id, e.group_id, e.description, e.amount, e.paid_by, e.created_at, e.date, e.category,
+                       e.note, e.split_method,
+                       u.username as paid_by_name, g.group_name,
+                       CASE WHEN b.balance_id IS NOT NULL THEN 1 ELSE 0 END as user_owes
+                FROM expenses e
+                JOIN users u ON e.paid_by = u.id
+                JOIN groups g ON e.group_id = g.group_id
+                LEFT JOIN balances b ON e.group_id = b.group_id 
+                    AND e.paid_by = b.lender 
+                    AND b.borrower = ?
+                    AND b.amount > 0
+                WHERE e.expense_id IN ({placeholders})
             """
-            payer_lookup = {expense['expense_id']: expense['paid_by'] for expense in expenses}
-            split_rows = conn.execute(splits_query, expense_ids).fetchall()
-            for split in split_rows:
-                status = split['status'] or ('payer' if split['user_id'] == payer_lookup.get(split['expense_id']) else 'owes')
-                expense_splits_map[split['expense_id']].append({
-                    'user_id': split['user_id'],
-                    'name': split['username'],
-                    'amount': float(split['amount']),
-                    'status': status
-                })
-            
-            attachments_query = f"""
-                SELECT attachment_id, expense_id, file_path, original_filename, mime_type, is_receipt, ocr_total
-                FROM expense_attachments
-                WHERE expense_id IN ({placeholders_expenses})
-                ORDER BY created_at DESC
+            expenses = conn.execute(expenses_query, [user_id] + expense_ids).fetchall()
+
+        payments = []
+        if payment_ids:
+            placeholders = ','.join(['?' for _ in payment_ids])
+            payments_query = f"""
+                SELECT p.payment_id, p.paid_by, p.paid_to, p.amount, p.paid_at, p.group_id,
+                       u1.username as paid_by_name, u2.username as paid_to_name, g.group_name
+                FROM payments p
+                JOIN users u1 ON p.paid_by = u1.id
+                JOIN users u2 ON p.paid_to = u2.id
+                JOIN groups g ON p.group_id = g.group_id
+                WHERE p.payment_id IN ({placeholders})
             """
-            attachment_rows = conn.execute(attachments_query, expense_ids).fetchall()
-            for attachment in attachment_rows:
-                expense_attachments_map[attachment['expense_id']].append(map_attachment_row(attachment))
+            payments = conn.execute(payments_query, payment_ids).fetchall()
+
+        expense_splits_map, expense_attachments_map = load_expense_details(conn, expenses)
         
         conn.close()
         
         # Format activities
-        activities = []
+        activities_by_key = {}
         
         # Add expenses
         for expense in expenses:
             is_paid_by_me = expense['paid_by'] == user_id
             is_involved = is_paid_by_me or expense['user_owes'] == 1
             
-            activities.append({
+            activities_by_key[('expense', expense['expense_id'])] = {
                 'id': f"expense_{expense['expense_id']}",
                 'type': 'expense',
                 'description': expense['description'],
@@ -994,11 +1232,11 @@ def get_recent_activity():
                 'split_method': expense['split_method'] or '',
                 'splits': expense_splits_map.get(expense['expense_id'], []),
                 'attachments': expense_attachments_map.get(expense['expense_id'], [])
-            })
+            }
         
         # Add payments
         for payment in payments:
-            activities.append({
+            activities_by_key[('payment', payment['payment_id'])] = {
                 'id': f"payment_{payment['payment_id']}",
                 'type': 'payment',
                 'description': f"Payment from {payment['paid_by_name']} to {payment['paid_to_name']}",
@@ -1015,40 +1253,32 @@ def get_recent_activity():
                 'memo': '',
                 'splits': [],
                 'attachments': []
-            })
+            }
         
-        # Sort all activities by date (most recent first)
-        activities.sort(key=lambda x: x['date'], reverse=True)
+        # Keep the page order from SQL (most recent first)
+        activities = [
+            activities_by_key[(item['kind'], item['item_id'])]
+            for item in page
+            if (item['kind'], item['item_id']) in activities_by_key
+        ]
         
         return jsonify({
             'activities': activities,
-            'user_id': user_id
+            'user_id': user_id,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/expenses', methods=['POST'])
+@require_auth
 def add_expense():
     """
     Add a new expense to a group
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         data, attachment_file = extract_expense_payload()
         
@@ -1193,6 +1423,7 @@ def add_expense():
         
         # Persist split breakdown for future activity detail views
         split_rows = []
+        balance_changes = []
         for participant_id in participants:
             participant_id = int(participant_id)
             split_key = str(participant_id)
@@ -1203,7 +1434,7 @@ def add_expense():
             
             # Update balances when the participant owes the payer
             if participant_id != paid_by:
-                consolidate_balances(conn, group_id, paid_by, participant_id, share_amount)
+                balance_changes.append((paid_by, participant_id, share_amount))
         
         # Ensure payer is captured even if not part of participants list
         if paid_by not in participants:
@@ -1215,21 +1446,22 @@ def add_expense():
                 split_rows
             )
 
+        # All participants' balances in one batch
+        apply_balance_changes(conn, group_id, balance_changes, now)
+
         attachment_response = None
         if attachment_file and attachment_file.filename:
             if not allowed_attachment(attachment_file.filename):
                 conn.close()
                 return jsonify({'error': 'Unsupported attachment type. Please upload an image or PDF file.'}), 400
 
-            metadata = save_attachment_file(expense_id, attachment_file)
+            # Identical files are stored once and shared between attachments
+            metadata = attachment_store.save_upload(attachment_file)
+            attachment_store.register_blob(conn, metadata)
             ocr_detected = ocr_total_from_client
-            ocr_error = None
-
-            if is_receipt_attachment and ocr_detected is None:
-                ocr_detected, ocr_error = run_receipt_ocr(metadata['absolute_path'])
 
             attachment_cursor = conn.execute(
-                'INSERT INTO expense_attachments (expense_id, file_path, original_filename, mime_type, is_receipt, ocr_total, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                'INSERT INTO expense_attachments (expense_id, file_path, original_filename, mime_type, is_receipt, ocr_total, created_at, content_hash, size_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
                 (
                     expense_id,
                     metadata['relative_path'],
@@ -1237,7 +1469,9 @@ def add_expense():
                     metadata['mime_type'],
                     1 if is_receipt_attachment else 0,
                     ocr_detected,
-                    now
+                    now,
+                    metadata['content_hash'],
+                    metadata['size_bytes']
                 )
             )
 
@@ -1247,13 +1481,74 @@ def add_expense():
                 'mime_type': metadata['mime_type'],
                 'is_receipt': is_receipt_attachment,
                 'ocr_total': ocr_detected,
-                'url': url_for('serve_upload', filename=metadata['relative_path'], _external=True)
+                'url': url_for('serve_upload', filename=metadata['relative_path'], _external=True),
+                'thumbnail_url': thumbnail_url(attachment_cursor.lastrowid, {
+                    'mime_type': metadata['mime_type'],
+                    'content_hash': metadata['content_hash'],
+                    'file_path': metadata['relative_path']
+                })
             }
-            if ocr_error:
-                attachment_response['ocr_error'] = ocr_error
+        
+        change_log.record(conn, group_id, [
+            ('expense', expense_id, 'insert', {
+                'expense_id': expense_id,
+                'group_id': group_id,
+                'description': description,
+                'amount': amount,
+                'paid_by': paid_by,
+                'note': note,
+                'date': date,
+                'category': category,
+                'currency': currency,
+                'split_method': split_method,
+                'created_at': now
+            })
+        ] + [
+            ('split', f'{split_expense_id}:{split_user_id}', 'insert', {
+                'expense_id': split_expense_id,
+                'user_id': split_user_id,
+                'amount': split_amount,
+                'status': split_status
+            })
+            for split_expense_id, split_user_id, split_amount, split_status, _ in split_rows
+        ] + balance_changes_for_log(
+            conn, group_id, [(lender, borrower) for lender, borrower, _ in balance_changes]
+        ), now)
         
         conn.commit()
+        publish_group_event(
+            conn, group_id, 'expense_added',
+            activity=('expense', expense_id),
+            pairs=[(lender, borrower) for lender, borrower, _ in balance_changes]
+        )
         conn.close()
+
+        if attachment_response:
+            thumbnails.schedule(metadata['absolute_path'], metadata['content_hash'], metadata['mime_type'])
+
+        # Receipt OCR runs in the background once the attachment row exists;
+        # the job fills in ocr_total when it finishes
+        if attachment_response and is_receipt_attachment and ocr_total_from_client is None:
+            if not ocr_available():
+                attachment_response['ocr_error'] = 'OCR is unavailable (easyocr not installed)'
+            else:
+                try:
+                    # Cache key is the uploaded bytes, so a receipt scanned for the
+                    # preview still hits after ingest transcoding
+                    job_id = ocr_jobs.submit_job(
+                        user_id, metadata['absolute_path'], attachment_response['attachment_id'],
+                        content_hash=metadata['source_hash']
+                    )
+                    attachment_response['ocr_job_id'] = job_id
+                    attachment_response['ocr_status_url'] = url_for('get_ocr_job', job_id=job_id, _external=True)
+                    # Receipts already scanned (e.g. for the preview) are answered from the cache
+                    job = ocr_jobs.get_job(job_id, user_id)
+                    if job and job['status'] == 'succeeded':
+                        attachment_response['ocr_total'] = job['detected_total']
+                    elif job and job['status'] == 'failed':
+                        attachment_response['ocr_error'] = job['error']
+                except OcrQueueFull as e:
+                    attachment_response['ocr_error'] = str(e)
         
         return jsonify({
             'message': 'Expense added successfully',
@@ -1275,23 +1570,14 @@ def add_expense():
 
 
 @app.route('/api/expenses/receipt-total', methods=['POST'])
+@require_auth
 def analyze_receipt_total():
     """
-    Run OCR against an uploaded receipt and return the detected total.
+    Queue OCR for an uploaded receipt. Returns 202 with a job id; poll
+    /api/ocr-jobs/<job_id> for the detected total.
     """
     try:
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-
-        token = auth_header.split(' ')[1]
-
-        try:
-            jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
 
         file = request.files.get('receipt')
         is_receipt_flag = request.form.get('is_receipt', 'true').lower() == 'true'
@@ -1302,49 +1588,63 @@ def analyze_receipt_total():
         if not allowed_attachment(file.filename):
             return jsonify({'error': 'Unsupported file type. Upload an image or PDF.'}), 400
 
-        temp_suffix = os.path.splitext(secure_filename(file.filename))[1] or '.tmp'
-        temp_dir = os.path.join(UPLOAD_ROOT, 'tmp')
-        os.makedirs(temp_dir, exist_ok=True)
+        if not is_receipt_flag:
+            return jsonify({'error': 'Not marked as receipt'}), 422
 
-        temp_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=temp_suffix, dir=temp_dir) as tmp:
-                file.save(tmp.name)
-                temp_path = tmp.name
+        if not ocr_available():
+            return jsonify({'error': 'OCR is unavailable (easyocr not installed)'}), 422
 
-            detected_total, error = run_receipt_ocr(temp_path) if is_receipt_flag else (None, 'Not marked as receipt')
-        finally:
-            if temp_path and os.path.exists(temp_path):
+        # The upload is already on disk; the job removes it once OCR has finished
+        temp_path, content_hash = attachment_store.stage_file(file)
+
+        try:
+            job_id = ocr_jobs.submit_job(user_id, temp_path, cleanup=True, content_hash=content_hash)
+        except OcrQueueFull as e:
+            if os.path.exists(temp_path):
                 os.remove(temp_path)
+            return jsonify({'error': str(e)}), 503
 
-        if error or detected_total is None:
-            return jsonify({'error': error or 'Unable to detect a total'}), 422
+        # Cached receipts finish inside submit_job; answer them right away
+        job = ocr_jobs.get_job(job_id, user_id)
+        if job and job['status'] == 'succeeded':
+            return jsonify(job), 200
+        if job and job['status'] == 'failed':
+            return jsonify(job), 422
 
-        return jsonify({'detected_total': detected_total}), 200
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('get_ocr_job', job_id=job_id, _external=True)
+        }), 202
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+
+@app.route('/api/ocr-jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_ocr_job(job_id):
+    """
+    Status and result of a background receipt OCR job
+    """
+    try:
+        user_id = g.user_id
+
+        job = ocr_jobs.get_job(job_id, user_id)
+        if not job:
+            return jsonify({'error': 'OCR job not found'}), 404
+
+        return jsonify(job), 200
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 @app.route('/api/payments', methods=['POST'])
+@require_auth
 def record_payment():
     """
     Record a payment between users
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         data = request.get_json()
         
@@ -1421,7 +1721,25 @@ def record_payment():
         # Payment reduces debt from payer to recipient (paid_to is lender, paid_by is borrower)
         consolidate_balances(conn, group_id, paid_to, paid_by, -amount)
         
+        change_log.record(conn, group_id, [
+            ('payment', payment_id, 'insert', {
+                'payment_id': payment_id,
+                'group_id': group_id,
+                'paid_by': paid_by,
+                'paid_to': paid_to,
+                'amount': amount,
+                'description': description,
+                'currency': currency,
+                'paid_at': now
+            })
+        ] + balance_changes_for_log(conn, group_id, [(paid_to, paid_by)]), now)
+        
         conn.commit()
+        publish_group_event(
+            conn, group_id, 'payment_recorded',
+            activity=('payment', payment_id),
+            pairs=[(paid_to, paid_by)]
+        )
         conn.close()
         
         return jsonify({
@@ -1442,29 +1760,33 @@ def record_payment():
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 @app.route('/api/groups', methods=['GET'])
+@require_auth
 def get_user_groups():
     """
     Get all groups that the user is a member of
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         conn = get_db_connection()
         
+        # The list only changes when one of the user's groups does
+        versions = conn.execute(
+            """
+            SELECT g.group_id, g.version
+            FROM members m
+            JOIN groups g ON g.group_id = m.group_id
+            WHERE m.user_id = ? AND m.deleted_at IS NULL AND g.deleted_at IS NULL
+            ORDER BY g.group_id
+            """,
+            (user_id,)
+        ).fetchall()
+        etag = group_versions_etag(user_id, [tuple(row) for row in versions])
+        cached = not_modified(etag)
+        if cached is not None:
+            conn.close()
+            return cached
+        
         # Get user's groups with member count
         # First, get the groups the user is a member of
         # Then count the members in each of those groups
@@ -1495,48 +1817,38 @@ def get_user_groups():
                 'member_count': group['member_count']
             })
         
-        return jsonify({
+        return with_etag(jsonify({
             'groups': groups_list,
             'user_id': user_id
-        }), 200
+        }), etag)
         
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/groups/<int:group_id>/members', methods=['GET'])
+@require_auth
 def get_group_members(group_id):
     """
     Get all members of a specific group
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         conn = get_db_connection()
         
         # Check if user is member of the group
-        membership = conn.execute(
-            'SELECT 1 FROM members WHERE user_id = ? AND group_id = ? AND deleted_at IS NULL', 
-            (user_id, group_id)
-        ).fetchone()
+        version = membership_version(conn, user_id, group_id)
         
-        if not membership:
+        if version is None:
             conn.close()
             return jsonify({'error': 'You are not a member of this group'}), 403
         
+        etag = group_versions_etag(user_id, version)
+        cached = not_modified(etag)
+        if cached is not None:
+            conn.close()
+            return cached
+        
         # Get group members with user details
         members_query = """
             SELECT u.id, u.username, u.email
@@ -1558,35 +1870,22 @@ def get_group_members(group_id):
                 'email': member['email']
             })
         
-        return jsonify({
+        return with_etag(jsonify({
             'members': members_list,
             'group_id': group_id
-        }), 200
+        }), etag)
         
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/groups', methods=['POST'])
+@require_auth
 def create_group():
     """
     Create a new group
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         data = request.get_json()
         
@@ -1602,8 +1901,8 @@ def create_group():
         
         conn = get_db_connection()
         
-        # Generate unique join code
-        join_code = generate_join_code()
+        # Reserve a join code in the same transaction as the group insert
+        join_code = join_codes.allocate(conn)
         
         # Create group
         now = datetime.now().isoformat()
@@ -1619,6 +1918,9 @@ def create_group():
             'INSERT INTO members (user_id, group_id, joined_at) VALUES (?, ?, ?)',
             (user_id, group_id, now)
         )
+        change_log.record(conn, group_id, [
+            member_change(user_id, g.user['name'], group_id, group_name, now)
+        ], now)
         
         conn.commit()
         conn.close()
@@ -1636,26 +1938,13 @@ def create_group():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/groups/join', methods=['POST'])
+@require_auth
 def join_group():
     """
     Join a group using a join code
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         data = request.get_json()
         
@@ -1665,8 +1954,8 @@ def join_group():
         
         join_code = data['join_code'].strip().upper()
         
-        if len(join_code) != 4:
-            return jsonify({'error': 'Join code must be 4 characters'}), 400
+        if not join_codes.is_valid(join_code):
+            return jsonify({'error': 'Join code must be 4 to 8 letters or digits'}), 400
         
         conn = get_db_connection()
         
@@ -1698,8 +1987,14 @@ def join_group():
             'INSERT INTO members (user_id, group_id, joined_at) VALUES (?, ?, ?)',
             (user_id, group_id, now)
         )
+        change_log.record(conn, group_id, [
+            member_change(user_id, g.user['name'], group_id, group['group_name'], now)
+        ], now)
         
         conn.commit()
+        publish_group_event(conn, group_id, 'member_joined', member={
+            'user_id': user_id, 'username': g.user['name'], 'email': g.user['email']
+        })
         conn.close()
         
         return jsonify({
@@ -1713,39 +2008,29 @@ def join_group():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/groups/<int:group_id>/balances', methods=['GET'])
+@require_auth
 def get_group_balances(group_id):
     """
     Get balance information for all members in a specific group
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        user_id = g.user_id
         
         conn = get_db_connection()
         
         # Verify user is a member of the group
-        membership = conn.execute(
-            'SELECT 1 FROM members WHERE user_id = ? AND group_id = ? AND deleted_at IS NULL', 
-            (user_id, group_id)
-        ).fetchone()
+        version = membership_version(conn, user_id, group_id)
         
-        if not membership:
+        if version is None:
             conn.close()
             return jsonify({'error': 'You are not a member of this group'}), 403
         
+        etag = group_versions_etag(user_id, version)
+        cached = not_modified(etag)
+        if cached is not None:
+            conn.close()
+            return cached
+        
         # Get all members of the group
         members_query = """
             SELECT m.user_id, u.username
@@ -1824,162 +2109,212 @@ def get_group_balances(group_id):
         # Convert to list
         member_list = [member_totals[mid] for mid in member_totals]
         
-        return jsonify({
+        return with_etag(jsonify({
             'group_id': group_id,
             'balances': balances_list,
             'members': member_list
-        }), 200
+        }), etag)
         
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/groups/<int:group_id>/activity', methods=['GET'])
+@require_auth
 def get_group_activity(group_id):
     """
-    Get recent activity for a specific group
+    Get recent activity for a specific group.
+    Paged with ?limit= and ?cursor=, filtered by ?type=expense|payment and
+    inclusive ?from= / ?to= dates (YYYY-MM-DD).
     """
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Authorization token required'}), 401
+        user_id = g.user_id
         
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
+        limit = parse_page_limit()
+        activity_type = request.args.get('type')
+        if activity_type not in (None, '', 'expense', 'payment'):
+            return jsonify({'error': "type must be 'expense' or 'payment'"}), 400
+        try:
+            date_range = parse_activity_date_range()
+        except ValueError:
+            return jsonify({'error': 'from/to must be dates in YYYY-MM-DD format'}), 400
+        cursor = request.args.get('cursor')
         try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            cursor_key = decode_activity_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
         conn = get_db_connection()
         
         # Verify user is a member of the group
-        membership = conn.execute(
-            'SELECT 1 FROM members WHERE user_id = ? AND group_id = ? AND deleted_at IS NULL', 
-            (user_id, group_id)
-        ).fetchone()
+        version = membership_version(conn, user_id, group_id)
         
-        if not membership:
+        if version is None:
             conn.close()
             return jsonify({'error': 'You are not a member of this group'}), 403
         
-        # Get recent expenses for this group
-        expenses_query = """
-            SELECT e.expense_id, e.description, e.amount, e.paid_by, e.created_at, e.date, e.category,
-                   e.note, e.split_method,
-                   u.username as paid_by_name
-            FROM expenses e
-            JOIN users u ON e.paid_by = u.id
-            WHERE e.group_id = ?
-            ORDER BY e.created_at DESC
-        """
-        
-        expenses = conn.execute(expenses_query, (group_id,)).fetchall()
-        
-        # Get recent payments for this group
-        payments_query = """
-            SELECT p.payment_id, p.paid_by, p.paid_to, p.amount, p.paid_at,
-                   u1.username as paid_by_name, u2.username as paid_to_name
-            FROM payments p
-            JOIN users u1 ON p.paid_by = u1.id
-            JOIN users u2 ON p.paid_to = u2.id
-            WHERE p.group_id = ?
-            ORDER BY p.paid_at DESC
-        """
+        etag = group_versions_etag(user_id, version)
+        cached = not_modified(etag)
+        if cached is not None:
+            conn.close()
+            return cached
+        
+        # One page of keys, with the type and date filters applied in SQL
+        page, next_cursor = fetch_activity_page(
+            conn,
+            ('e.group_id = ?', [group_id]) if activity_type != 'payment' else None,
+            ('p.group_id = ?', [group_id]) if activity_type != 'expense' else None,
+            limit,
+            cursor_key,
+            date_range
+        )
         
-        payments = conn.execute(payments_query, (group_id,)).fetchall()
-        
-        expense_splits_map = defaultdict(list)
-        expense_attachments_map = defaultdict(list)
-        if expenses:
-            expense_ids = [expense['expense_id'] for expense in expenses]
-            placeholders_expenses = ','.join(['?' for _ in expense_ids])
-            splits_query = f"""
-                SELECT es.expense_id, es.user_id, es.amount, es.status, u.username
-                FROM expense_splits es
-                JOIN users u ON es.user_id = u.id
-                WHERE es.expense_id IN ({placeholders_expenses})
-                ORDER BY es.expense_id, u.username
+        expense_ids = [item['item_id'] for item in page if item['kind'] == 'expense']
+        payment_ids = [item['item_id'] for item in page if item['kind'] == 'payment']
+        
+        expenses = []
+        if expense_ids:
+            placeholders = ','.join(['?' for _ in expense_ids])
+            expenses_query = f"""
+                SELECT e.expense_id, e.description, e.amount, e.paid_by, e.created_at, e.date, e.category,
+                       e.note, e.split_method,
+                       u.username as paid_by_name
+                FROM expenses e
+                JOIN users u ON e.paid_by = u.id
+                WHERE e.expense_id IN ({placeholders})
             """
-            payer_lookup = {expense['expense_id']: expense['paid_by'] for expense in expenses}
-            split_rows = conn.execute(splits_query, expense_ids).fetchall()
-            for split in split_rows:
-                status = split['status'] or ('payer' if split['user_id'] == payer_lookup.get(split['expense_id']) else 'owes')
-                expense_splits_map[split['expense_id']].append({
-                    'user_id': split['user_id'],
-                    'name': split['username'],
-                    'amount': float(split['amount']),
-                    'status': status
-                })
-            
-            attachments_query = f"""
-                SELECT attachment_id, expense_id, file_path, original_filename, mime_type, is_receipt, ocr_total
-                FROM expense_attachments
-                WHERE expense_id IN ({placeholders_expenses})
-                ORDER BY created_at DESC
+            expenses = conn.execute(expenses_query, expense_ids).fetchall()
+        
+        payments = []
+        if payment_ids:
+            placeholders = ','.join(['?' for _ in payment_ids])
+            payments_query = f"""
+                SELECT p.payment_id, p.paid_by, p.paid_to, p.amount, p.paid_at,
+                       u1.username as paid_by_name, u2.username as paid_to_name
+                FROM payments p
+                JOIN users u1 ON p.paid_by = u1.id
+                JOIN users u2 ON p.paid_to = u2.id
+                WHERE p.payment_id IN ({placeholders})
             """
-            attachment_rows = conn.execute(attachments_query, expense_ids).fetchall()
-            for attachment in attachment_rows:
-                expense_attachments_map[attachment['expense_id']].append(map_attachment_row(attachment))
+            payments = conn.execute(payments_query, payment_ids).fetchall()
+        
+        expense_splits_map, expense_attachments_map = load_expense_details(conn, expenses)
         
         conn.close()
         
         # Format activities
-        activities = []
+        activities_by_key = {}
         
-        # Add expenses
         for expense in expenses:
-            activities.append({
-                'id': f"expense_{expense['expense_id']}",
-                'type': 'expense',
-                'description': expense['description'],
-                'amount': float(expense['amount']),
-                'paid_by': expense['paid_by_name'],
-                'paid_by_id': expense['paid_by'],
-                'date': expense['date'] or expense['created_at'],
-                'category': expense['category'] or '',
-                'is_my_expense': expense['paid_by'] == user_id,
-                'memo': expense['note'] or '',
-                'split_method': expense['split_method'] or '',
-                'splits': expense_splits_map.get(expense['expense_id'], []),
-                'attachments': expense_attachments_map.get(expense['expense_id'], [])
-            })
+            activities_by_key[('expense', expense['expense_id'])] = format_expense_activity(
+                expense,
+                expense_splits_map.get(expense['expense_id'], []),
+                expense_attachments_map.get(expense['expense_id'], []),
+                user_id
+            )
         
-        # Add payments
         for payment in payments:
-            activities.append({
-                'id': f"payment_{payment['payment_id']}",
-                'type': 'payment',
-                'description': f"Payment from {payment['paid_by_name']} to {payment['paid_to_name']}",
-                'amount': float(payment['amount']),
-                'paid_by': payment['paid_by_name'],
-                'paid_by_id': payment['paid_by'],
-                'paid_to': payment['paid_to_name'],
-                'paid_to_id': payment['paid_to'],
-                'date': payment['paid_at'],
-                'is_my_payment': payment['paid_by'] == user_id,
-                'is_paid_to_me': payment['paid_to'] == user_id,
-                'memo': '',
-                'splits': [],
-                'attachments': []
-            })
+            activities_by_key[('payment', payment['payment_id'])] = format_payment_activity(payment, user_id)
         
-        # Sort by date (most recent first)
-        activities.sort(key=lambda x: x['date'], reverse=True)
+        # Keep the page order from SQL (most recent first)
+        activities = [
+            activities_by_key[(item['kind'], item['item_id'])]
+            for item in page
+            if (item['kind'], item['item_id']) in activities_by_key
+        ]
         
-        return jsonify({
+        return with_etag(jsonify({
             'group_id': group_id,
-            'activities': activities
+            'activities': activities,
+            'next_cursor': next_cursor
+        }), etag)
+        
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/sync', methods=['GET'])
+@require_auth
+def sync_changes():
+    """
+    Changes in the caller's groups committed after ?since=<cursor>: expenses,
+    splits, payments, balance rows and memberships, oldest first, with the
+    cursor to send next time. Without since, returns only the current cursor
+    (load the regular endpoints first, then sync from there). 410 means the
+    cursor is older than the log's retention and the client must reload.
+    reload_groups lists groups the caller joined since the cursor, whose
+    earlier history is not in the changes.
+    """
+    try:
+        user_id = g.user_id
+        since = request.args.get('since')
+        limit = request.args.get('limit', type=int) or change_log.SYNC_PAGE_SIZE
+        limit = max(1, min(limit, change_log.SYNC_PAGE_SIZE))
+        
+        conn = get_db_connection()
+        
+        if since is None:
+            cursor = change_log.latest_cursor(conn)
+            conn.close()
+            return jsonify({'changes': [], 'cursor': str(cursor), 'has_more': False, 'reload_groups': []}), 200
+        
+        if not since.isdigit():
+            conn.close()
+            return jsonify({'error': 'Invalid cursor'}), 400
+        since = int(since)
+        
+        if change_log.cursor_expired(conn, since):
+            conn.close()
+            return jsonify({'error': 'Cursor expired. Reload and sync from the new cursor.'}), 410
+        
+        changes, has_more = change_log.changes_for_user(conn, user_id, since, limit)
+        conn.close()
+        
+        return jsonify({
+            'changes': changes,
+            'cursor': str(changes[-1]['change_id'] if changes else since),
+            'has_more': has_more,
+            'reload_groups': [
+                change['group_id'] for change in changes
+                if change['entity'] == 'member' and change['data']['user_id'] == user_id
+            ]
         }), 200
         
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/groups/<int:group_id>/events', methods=['GET'])
+@require_auth
+def stream_group_events(group_id):
+    """
+    Server-Sent Events for one group: expense_added, payment_recorded and
+    member_joined, each with the new activity item and changed balance rows.
+    """
+    user_id = g.user_id
+    conn = get_db_connection()
+    # Checked once; the stream itself holds no connection
+    is_member = membership_version(conn, user_id, group_id) is not None
+    conn.close()
+    if not is_member:
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    return event_stream_response([events.group_channel(group_id)], user_id)
+
+@app.route('/api/events', methods=['GET'])
+@require_auth
+def stream_user_events():
+    """
+    Server-Sent Events for everything in the caller's groups. Events for
+    writes that moved the caller's balances carry their new totals.
+    """
+    return event_stream_response([events.user_channel(g.user_id)], g.user_id)
+
 if __name__ == '__main__':
+    # Bring the database schema up to date before serving requests
+    migrate()
+
+    # Optionally start the OCR workers now so their models load in the
+    # background rather than on the first scanned receipt
+    if os.environ.get('OCR_WARM_UP', 'False').lower() in ('1', 'true'):
+        ocr_jobs.warm_up()
+
     # Run the application
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(
@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+"""
+Content-addressed attachment storage.
+
+Uploads are hashed (SHA-256) while they are written to disk and stored
+once per distinct content under uploads/blobs/<aa>/<bb>/<hash><ext>.
+expense_attachments rows point at the shared blob; the attachment_blobs
+table tracks each blob's size and how many attachments reference it
+(kept up to date by triggers, see migrations.py). Blobs that lose their
+last reference are removed by collect_garbage().
+
+Uploads are streamed: werkzeug writes each multipart file part straight
+into a StagedUpload (see UploadRequest in app.py), which hashes, counts
+and sniffs the bytes as they arrive and aborts the request as soon as a
+file goes over its size cap or turns out not to be an image or PDF.
+
+With ATTACHMENT_TRANSCODE=1, image uploads are re-encoded at ingest:
+resolution capped, EXIF/XMP metadata stripped and saved in the configured
+format and quality. Originals are kept under uploads/originals/ only if
+ATTACHMENT_KEEP_ORIGINALS=1. The reencode command applies the same
+policy to attachments already stored, using a process pool.
+
+Usage:
+    python3 attachment_store.py report     # bytes stored vs. bytes saved
+    python3 attachment_store.py gc         # remove orphaned blobs, files and rows
+    python3 attachment_store.py backfill   # move pre-dedup uploads into the store
+    python3 attachment_store.py reencode [--dry-run] [--workers N]
+"""
+
+import hashlib
+import mimetypes
+import os
+import sys
+import tempfile
+import time
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from PIL import Image, ImageOps
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from db import get_db
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_ROOT = os.environ.get('UPLOAD_ROOT', os.path.join(BASE_DIR, 'uploads'))
+CHUNK_SIZE = 64 * 1024
+ALLOWED_EXTENSIONS = {
+    'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'heic', 'heif', 'pdf'
+}
+# Per-file size caps by kind, and the cap on a whole request body
+MAX_IMAGE_BYTES = int(float(os.environ.get('ATTACHMENT_MAX_IMAGE_MB', '10')) * 1024 * 1024)
+MAX_PDF_BYTES = int(float(os.environ.get('ATTACHMENT_MAX_PDF_MB', '20')) * 1024 * 1024)
+MAX_REQUEST_BYTES = max(MAX_IMAGE_BYTES, MAX_PDF_BYTES) + 1024 * 1024
+# Magic numbers of the formats we accept: (offset, bytes, mime type)
+SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'BM', 'image/bmp'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'%PDF-', 'application/pdf'),
+    (4, b'ftypheic', 'image/heic'),
+    (4, b'ftypheix', 'image/heic'),
+    (4, b'ftypmif1', 'image/heif'),
+    (4, b'ftypmsf1', 'image/heif'),
+]
+SNIFF_BYTES = 16
+# Ingest-time image re-encoding (off by default)
+TRANSCODE_IMAGES = os.environ.get('ATTACHMENT_TRANSCODE', '0').lower() in ('1', 'true')
+TRANSCODE_FORMAT = os.environ.get('ATTACHMENT_TRANSCODE_FORMAT', 'jpeg').lower()
+TRANSCODE_QUALITY = int(os.environ.get('ATTACHMENT_TRANSCODE_QUALITY', '85'))
+# Well above OCR_MAX_EDGE so recognition quality is unaffected
+TRANSCODE_MAX_EDGE = int(os.environ.get('ATTACHMENT_MAX_EDGE', '2400'))
+KEEP_ORIGINALS = os.environ.get('ATTACHMENT_KEEP_ORIGINALS', '0').lower() in ('1', 'true')
+TRANSCODE_OUTPUTS = {
+    'jpeg': ('JPEG', '.jpg', 'image/jpeg'),
+    'webp': ('WEBP', '.webp', 'image/webp'),
+}
+# Still images Pillow can decode; GIFs may be animated and are left alone
+TRANSCODABLE_TYPES = {'image/png', 'image/jpeg', 'image/bmp', 'image/webp'}
+# Files younger than this are never collected: an upload may be on disk
+# before the transaction that references it has committed
+GC_GRACE_SECONDS = int(os.environ.get('ATTACHMENT_GC_GRACE_SECONDS', '3600'))
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    pass
+
+
+class UnsupportedUpload(BadRequest):
+    description = 'Unsupported file type. Upload an image or PDF.'
+
+
+def sniff_mime(head):
+    """Mime type from a file's first bytes, or None if it is not a format we accept."""
+    for offset, signature, mime_type in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime_type
+    return None
+
+
+def _size_cap(mime_type):
+    return MAX_PDF_BYTES if mime_type == 'application/pdf' else MAX_IMAGE_BYTES
+
+
+class StagedUpload:
+    """
+    Writable file werkzeug streams an uploaded file part into. Bytes go
+    straight to a staging file under uploads/blobs/tmp while being hashed,
+    counted against the size cap and sniffed, so an oversized or
+    disallowed file is rejected without buffering the rest of the body.
+    """
+
+    def __init__(self, filename):
+        name = secure_filename(filename or '')
+        self.extension = os.path.splitext(name)[1].lower()
+        if self.extension.lstrip('.') not in ALLOWED_EXTENSIONS:
+            raise UnsupportedUpload()
+        guessed = mimetypes.guess_type(name)[0]
+        self.limit = _size_cap(guessed)
+        self.mime_type = None
+        self.size = 0
+        self.kept = False
+        self._head = b''
+        self._digest = hashlib.sha256()
+        staging_dir = os.path.join(UPLOAD_ROOT, 'blobs', 'tmp')
+        os.makedirs(staging_dir, exist_ok=True)
+        # Keep the real extension: OCR tells PDFs from images by it
+        fd, self.path = tempfile.mkstemp(dir=staging_dir, prefix='upload-', suffix=self.extension)
+        self._file = os.fdopen(fd, 'w+b')
+
+    def __getattr__(self, name):
+        # read/readline/seek/close etc. go to the staging file
+        return getattr(self._file, name)
+
+    def _sniff(self):
+        self.mime_type = sniff_mime(self._head)
+        # The stored extension decides how OCR reads the file, so it must agree
+        if self.mime_type is None or (self.mime_type == 'application/pdf') != (self.extension == '.pdf'):
+            self.discard()
+            raise UnsupportedUpload()
+        self.limit = _size_cap(self.mime_type)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.mime_type is None:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        if self.size > self.limit:
+            self.discard()
+            raise UploadTooLarge(
+                f'File is too large. The limit is {self.limit // (1024 * 1024)} MB.'
+            )
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def seek(self, offset, whence=0):
+        # werkzeug rewinds once the part is complete; short files are sniffed here
+        if self.mime_type is None:
+            self._sniff()
+        return self._file.seek(offset, whence)
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+    def keep(self):
+        """Hand the staged file to the caller, who becomes responsible for it."""
+        self.kept = True
+        self._file.close()
+        return self.path
+
+    def discard(self):
+        self._file.close()
+        if not self.kept and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def stage_file(file_storage):
+    """
+    Return (path, content_hash) of an upload on disk under uploads/blobs/tmp.
+    Streamed uploads are already there; anything else is copied once.
+    """
+    if isinstance(file_storage.stream, StagedUpload):
+        staged = file_storage.stream
+        return staged.keep(), staged.content_hash
+    staging_dir = os.path.join(UPLOAD_ROOT, 'blobs', 'tmp')
+    os.makedirs(staging_dir, exist_ok=True)
+    extension = os.path.splitext(secure_filename(file_storage.filename or ''))[1]
+    temp_path, content_hash, _ = _write_hashed(file_storage.stream, staging_dir, extension)
+    return temp_path, content_hash
+
+
+def blob_relative_path(content_hash, extension=''):
+    """Where a blob lives, relative to UPLOAD_ROOT."""
+    return '/'.join(['blobs', content_hash[:2], content_hash[2:4], content_hash + extension.lower()])
+
+
+def _write_hashed(stream, directory, suffix='.part'):
+    """Copy a stream into a temp file in directory, hashing as it goes."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcode_image(source_path, directory, output_format=None, quality=None, max_edge=None):
+    """
+    Re-encode an image with metadata stripped and its long edge capped.
+    Returns (temp_path, content_hash, size, mime_type, extension) for the
+    new file in directory, or None when the original should be kept: it
+    cannot be decoded, or re-encoding would not make it smaller and there
+    is no metadata to strip.
+    """
+    pil_format, extension, mime_type = TRANSCODE_OUTPUTS[output_format or TRANSCODE_FORMAT]
+    quality = quality or TRANSCODE_QUALITY
+    max_edge = max_edge or TRANSCODE_MAX_EDGE
+    try:
+        with Image.open(source_path) as img:
+            if img.format == 'JPEG':
+                # Decode at reduced scale when the cap allows it
+                img.draft('RGB', (max_edge, max_edge))
+            exif = img.getexif()
+            has_metadata = bool(exif) or any(key in img.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+            icc_profile = img.info.get('icc_profile')
+            # Bake the orientation into the pixels before the EXIF tag is dropped
+            img = ImageOps.exif_transpose(img)
+            has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+            if has_alpha and pil_format == 'JPEG':
+                # JPEG has no alpha: flatten onto white like a printed receipt
+                background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+                img = Image.alpha_composite(background, img.convert('RGBA')).convert('RGB')
+            elif img.mode not in ('RGB', 'L'):
+                img = img.convert('RGBA' if has_alpha else 'RGB')
+            resized = max(img.size) > max_edge
+            if resized:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=3.0)
+    except Exception:
+        return None
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=extension)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            options = {'quality': quality}
+            if icc_profile:
+                options['icc_profile'] = icc_profile
+            if pil_format == 'JPEG':
+                options.update(optimize=True, progressive=True)
+            else:
+                options['method'] = 4
+            img.save(out, pil_format, **options)
+        size = os.path.getsize(temp_path)
+        if size >= os.path.getsize(source_path) and not (has_metadata or resized):
+            os.remove(temp_path)
+            return None
+        return temp_path, _hash_file(temp_path), size, mime_type, extension
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _keep_original(temp_path, content_hash, extension):
+    """Move an original that was transcoded away to uploads/originals/, if policy says so."""
+    if not KEEP_ORIGINALS:
+        os.remove(temp_path)
+        return
+    destination = os.path.join(UPLOAD_ROOT, 'originals', blob_relative_path(content_hash, extension)[len('blobs/'):])
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(temp_path, destination)
+
+
+def save_upload(file_storage):
+    """
+    Store an uploaded file and return its metadata dict.
+    Identical content already in the store is reused rather than written again.
+    """
+    original_name = secure_filename(file_storage.filename or '')
+    extension = os.path.splitext(original_name)[1]
+    mime_type = file_storage.mimetype or mimetypes.guess_type(original_name)[0] or 'application/octet-stream'
+    if isinstance(file_storage.stream, StagedUpload):
+        # Already on disk and hashed while the request body streamed in
+        staged = file_storage.stream
+        temp_path, content_hash, size = staged.keep(), staged.content_hash, staged.size
+        mime_type = staged.mime_type or mime_type
+    else:
+        staging_dir = os.path.join(UPLOAD_ROOT, 'blobs', 'tmp')
+        os.makedirs(staging_dir, exist_ok=True)
+        temp_path, content_hash, size = _write_hashed(file_storage.stream, staging_dir)
+
+    # The hash of what the user sent; the OCR cache is keyed by it
+    source_hash = content_hash
+    if TRANSCODE_IMAGES and mime_type in TRANSCODABLE_TYPES:
+        result = transcode_image(temp_path, os.path.dirname(temp_path))
+        if result is not None:
+            _keep_original(temp_path, content_hash, extension)
+            temp_path, content_hash, size, mime_type, extension = result
+
+    relative_path = blob_relative_path(content_hash, extension)
+    destination = os.path.join(UPLOAD_ROOT, relative_path)
+    deduplicated = os.path.exists(destination)
+    if deduplicated:
+        os.remove(temp_path)
+        # Touch it so a concurrent GC pass sees it as fresh
+        os.utime(destination)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(temp_path, destination)
+
+    return {
+        'relative_path': relative_path,
+        'mime_type': mime_type,
+        'original_name': original_name or content_hash + extension,
+        'absolute_path': destination,
+        'content_hash': content_hash,
+        'size_bytes': size,
+        'source_hash': source_hash,
+        'deduplicated': deduplicated
+    }
+
+
+def discard_staged(environ):
+    """Teardown hook: remove staged uploads the request handler did not keep."""
+    for staged in environ.pop('centsible.staged_uploads', []):
+        staged.discard()
+
+
+def register_blob(conn, metadata):
+    """
+    Record a stored blob before an attachment row references it.
+    Call inside the same transaction as the expense_attachments insert.
+    """
+    conn.execute(
+        """
+        INSERT INTO attachment_blobs (content_hash, file_path, size_bytes, ref_count, created_at)
+        VALUES (?, ?, ?, 0, ?)
+        ON CONFLICT(content_hash) DO NOTHING
+        """,
+        (metadata['content_hash'], metadata['relative_path'], metadata['size_bytes'], datetime.now().isoformat())
+    )
+    # Reuse the path already on record in case this upload had another extension
+    row = conn.execute(
+        'SELECT file_path FROM attachment_blobs WHERE content_hash = ?', (metadata['content_hash'],)
+    ).fetchone()
+    if row['file_path'] != metadata['relative_path']:
+        duplicate = metadata['absolute_path']
+        metadata['relative_path'] = row['file_path']
+        metadata['absolute_path'] = os.path.join(UPLOAD_ROOT, row['file_path'])
+        if os.path.exists(duplicate) and os.path.exists(metadata['absolute_path']):
+            os.remove(duplicate)
+    return metadata
+
+
+def _is_old(path, now):
+    try:
+        return now - os.path.getmtime(path) > GC_GRACE_SECONDS
+    except OSError:
+        return False
+
+
+def collect_garbage(conn, dry_run=False):
+    """
+    Remove unreferenced blobs (rows and files), attachment rows whose
+    expense is gone, and stray files under uploads/ that nothing points at.
+    Returns a summary dict.
+    """
+    now = time.time()
+    summary = {'attachment_rows': 0, 'blob_rows': 0, 'files': 0, 'bytes_freed': 0}
+
+    orphaned_attachments = conn.execute(
+        """
+        SELECT attachment_id FROM expense_attachments a
+        WHERE NOT EXISTS (SELECT 1 FROM expenses e WHERE e.expense_id = a.expense_id)
+        """
+    ).fetchall()
+    summary['attachment_rows'] = len(orphaned_attachments)
+    if not dry_run:
+        conn.executemany(
+            'DELETE FROM expense_attachments WHERE attachment_id = ?',
+            [(row['attachment_id'],) for row in orphaned_attachments]
+        )
+
+    dead_blobs = conn.execute(
+        'SELECT content_hash, file_path, size_bytes FROM attachment_blobs WHERE ref_count <= 0'
+    ).fetchall()
+    for blob in dead_blobs:
+        path = os.path.join(UPLOAD_ROOT, blob['file_path'])
+        if not _is_old(path, now) and os.path.exists(path):
+            continue
+        summary['blob_rows'] += 1
+        if not dry_run:
+            conn.execute(
+                'DELETE FROM attachment_blobs WHERE content_hash = ? AND ref_count <= 0',
+                (blob['content_hash'],)
+            )
+    if not dry_run:
+        conn.commit()
+
+    # Files on disk that no blob or legacy attachment row refers to
+    referenced = {row[0] for row in conn.execute('SELECT file_path FROM attachment_blobs')}
+    referenced.update(row[0] for row in conn.execute('SELECT file_path FROM expense_attachments'))
+    for folder in ('blobs', 'expenses'):
+        for directory, _, files in os.walk(os.path.join(UPLOAD_ROOT, folder)):
+            for name in files:
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, UPLOAD_ROOT).replace('\\', '/')
+                if relative in referenced or not _is_old(path, now):
+                    continue
+                summary['files'] += 1
+                summary['bytes_freed'] += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+    return summary
+
+
+def storage_report(conn):
+    """Unique bytes on disk versus the bytes that would be stored without dedup."""
+    blobs = conn.execute(
+        """
+        SELECT COUNT(*) AS blobs,
+               COALESCE(SUM(size_bytes), 0) AS stored_bytes,
+               COALESCE(SUM(size_bytes * ref_count), 0) AS referenced_bytes,
+               COALESCE(SUM(ref_count), 0) AS references_total
+        FROM attachment_blobs
+        WHERE ref_count > 0
+        """
+    ).fetchone()
+    legacy = conn.execute(
+        'SELECT COUNT(*) FROM expense_attachments WHERE content_hash IS NULL'
+    ).fetchone()[0]
+    return {
+        'blobs': blobs['blobs'],
+        'attachments': blobs['references_total'],
+        'stored_bytes': blobs['stored_bytes'],
+        'logical_bytes': blobs['referenced_bytes'],
+        'bytes_saved': blobs['referenced_bytes'] - blobs['stored_bytes'],
+        'legacy_attachments': legacy,
+    }
+
+
+def backfill(conn):
+    """Hash uploads saved before dedup and repoint their rows at the blob store."""
+    moved = 0
+    rows = conn.execute(
+        'SELECT attachment_id, file_path FROM expense_attachments WHERE content_hash IS NULL'
+    ).fetchall()
+    for row in rows:
+        source = os.path.join(UPLOAD_ROOT, row['file_path'])
+        if not os.path.exists(source):
+            continue
+        staging_dir = os.path.join(UPLOAD_ROOT, 'blobs', 'tmp')
+        os.makedirs(staging_dir, exist_ok=True)
+        with open(source, 'rb') as stream:
+            temp_path, content_hash, size = _write_hashed(stream, staging_dir)
+        relative_path = blob_relative_path(content_hash, os.path.splitext(source)[1])
+        destination = os.path.join(UPLOAD_ROOT, relative_path)
+        if os.path.exists(destination):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(temp_path, destination)
+        metadata = register_blob(conn, {
+            'content_hash': content_hash,
+            'relative_path': relative_path,
+            'absolute_path': destination,
+            'size_bytes': size,
+        })
+        # The update trigger moves the reference onto the blob
+        conn.execute(
+            'UPDATE expense_attachments SET file_path = ?, content_hash = ?, size_bytes = ? WHERE attachment_id = ?',
+            (metadata['relative_path'], content_hash, size, row['attachment_id'])
+        )
+        conn.commit()
+        os.remove(source)
+        moved += 1
+    return moved
+
+
+def reencode(conn, dry_run=False, workers=None):
+    """
+    Apply the transcode policy to images already stored (blobs and
+    pre-dedup files under uploads/expenses/), decoding in a process pool.
+    Rows move to the re-encoded blob; superseded blobs are left for gc.
+    Returns a summary of disk and bandwidth savings.
+    """
+    summary = {
+        'files': 0, 'skipped': 0,
+        'bytes_before': 0, 'bytes_after': 0,
+        # Every attachment row is downloaded separately, even when shared
+        'served_bytes_before': 0, 'served_bytes_after': 0,
+    }
+    rows = conn.execute(
+        """
+        SELECT file_path, mime_type, content_hash, COUNT(*) AS refs
+        FROM expense_attachments
+        GROUP BY file_path
+        """
+    ).fetchall()
+    candidates = [
+        row for row in rows
+        if row['mime_type'] in TRANSCODABLE_TYPES and os.path.exists(os.path.join(UPLOAD_ROOT, row['file_path']))
+    ]
+    staging_dir = os.path.join(UPLOAD_ROOT, 'blobs', 'tmp')
+    os.makedirs(staging_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                transcode_image, os.path.join(UPLOAD_ROOT, row['file_path']), staging_dir,
+                TRANSCODE_FORMAT, TRANSCODE_QUALITY, TRANSCODE_MAX_EDGE
+            ): row
+            for row in candidates
+        }
+        for future in as_completed(futures):
+            row = futures[future]
+            result = future.result()
+            if result is None:
+                summary['skipped'] += 1
+                continue
+            temp_path, content_hash, size, mime_type, extension = result
+            source = os.path.join(UPLOAD_ROOT, row['file_path'])
+            source_size = os.path.getsize(source)
+            summary['files'] += 1
+            summary['bytes_before'] += source_size
+            summary['bytes_after'] += size
+            summary['served_bytes_before'] += source_size * row['refs']
+            summary['served_bytes_after'] += size * row['refs']
+            if dry_run:
+                os.remove(temp_path)
+                continue
+
+            relative_path = blob_relative_path(content_hash, extension)
+            destination = os.path.join(UPLOAD_ROOT, relative_path)
+            if os.path.exists(destination):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(temp_path, destination)
+            metadata = register_blob(conn, {
+                'content_hash': content_hash,
+                'relative_path': relative_path,
+                'absolute_path': destination,
+                'size_bytes': size,
+            })
+            # The update trigger moves the references onto the new blob
+            conn.execute(
+                """
+                UPDATE expense_attachments
+                SET file_path = ?, content_hash = ?, size_bytes = ?, mime_type = ?
+                WHERE file_path = ?
+                """,
+                (metadata['relative_path'], content_hash, size, mime_type, row['file_path'])
+            )
+            conn.commit()
+
+            original_extension = os.path.splitext(source)[1]
+            if row['content_hash'] is None:
+                # Pre-dedup files belong to this row alone
+                _keep_original(source, _hash_file(source), original_extension)
+            elif KEEP_ORIGINALS:
+                # A blob may be picked up again by a concurrent upload; gc removes it later
+                _keep_original(shutil.copy2(source, staging_dir), row['content_hash'], original_extension)
+
+    summary['bytes_saved'] = summary['bytes_before'] - summary['bytes_after']
+    summary['served_bytes_saved'] = summary['served_bytes_before'] - summary['served_bytes_after']
+    return summary
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'report'
+    connection = get_db()
+    try:
+        if command == 'gc':
+            result = collect_garbage(connection, dry_run='--dry-run' in sys.argv)
+            print(
+                f"Removed {result['attachment_rows']} orphaned attachment rows, "
+                f"{result['blob_rows']} unreferenced blobs and {result['files']} files "
+                f"({result['bytes_freed']} bytes)."
+            )
+        elif command == 'backfill':
+            print(f"Moved {backfill(connection)} attachments into the blob store.")
+        elif command == 'reencode':
+            workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else None
+            result = reencode(connection, dry_run='--dry-run' in sys.argv, workers=workers)
+            print(f"Re-encoded {result['files']} images ({result['skipped']} left as they were).")
+            print(
+                f"Disk:      {result['bytes_before']} -> {result['bytes_after']} bytes "
+                f"({result['bytes_saved']} saved)"
+            )
+            print(
+                f"Bandwidth: {result['served_bytes_before']} -> {result['served_bytes_after']} bytes "
+                f"per view of every attachment ({result['served_bytes_saved']} saved)"
+            )
+        elif command == 'report':
+            report = storage_report(connection)
+            for key, value in report.items():
+                print(f"{key:<20}{value}")
+        else:
+            print('Usage: python3 attachment_store.py [report|gc [--dry-run]|backfill|reencode [--dry-run] [--workers N]]')
+            sys.exit(1)
+    finally:
+        connection.close()
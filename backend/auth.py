@@ -0,0 +1,149 @@
+"""
+Request authentication for the API.
+
+@require_auth reads the Bearer token, verifies it and puts the caller on
+flask.g (g.user_id and g.user, a {'id', 'name', 'email'} profile) before
+the view runs. Verified tokens are kept in a bounded LRU until they
+expire, so repeat requests skip the JWT signature check, and profiles are
+cached for a short while so most requests never touch the users table.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import jwt
+from flask import current_app, g, jsonify, request
+
+from db import get_db, get_pool
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_PROFILE_CACHE_SIZE = 10000
+# Other workers may update a profile; bound how stale a cached one can get
+AUTH_PROFILE_TTL_SECONDS = 300
+
+
+class AuthError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ExpiringLRU:
+    """Thread-safe LRU mapping whose entries each carry an expiry time."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+_tokens = ExpiringLRU(AUTH_TOKEN_CACHE_SIZE)
+_profiles = ExpiringLRU(AUTH_PROFILE_CACHE_SIZE)
+
+
+def decode_token(token):
+    """User id for a valid token. Raises AuthError for expired or invalid ones."""
+    user_id = _tokens.get(token)
+    if user_id is not None:
+        return user_id
+    try:
+        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        user_id = payload['user_id']
+    except jwt.ExpiredSignatureError:
+        raise AuthError('Token expired')
+    except (jwt.InvalidTokenError, KeyError):
+        raise AuthError('Invalid token')
+    # Tokens without an expiry are still re-checked now and then
+    _tokens.put(token, user_id, payload.get('exp', time.time() + AUTH_PROFILE_TTL_SECONDS))
+    return user_id
+
+
+def get_profile(user_id):
+    """Cached {'id', 'name', 'email'} for a user. Raises AuthError(404) if the user is gone."""
+    # Keyed by database too, so repointing the pool (tests, scripts) cannot serve stale users
+    key = (get_pool().database, user_id)
+    profile = _profiles.get(key)
+    if profile is not None:
+        return profile
+    user = get_db().execute(
+        'SELECT id, username, email FROM users WHERE id = ?', (user_id,)
+    ).fetchone()
+    if user is None:
+        raise AuthError('User not found', 404)
+    profile = {'id': user['id'], 'name': user['username'], 'email': user['email']}
+    _profiles.put(key, profile, time.time() + AUTH_PROFILE_TTL_SECONDS)
+    return profile
+
+
+def invalidate_user(user_id):
+    """Drop a cached profile after the user's name or email changed."""
+    _profiles.pop((get_pool().database, user_id))
+
+
+def authenticate(token):
+    """Verify a token and set g.user_id and g.user."""
+    g.user_id = decode_token(token)
+    g.user = get_profile(g.user_id)
+    return g.user
+
+
+def require_auth(view):
+    """Reject the request with 401 unless it carries a valid Bearer token."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'Authorization token required'}), 401
+        try:
+            authenticate(auth_header.split(' ')[1])
+        except AuthError as e:
+            return jsonify({'error': e.message}), e.status
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def stats():
+    return {'tokens': _tokens.stats(), 'profiles': _profiles.stats()}
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark login throughput and tail latency under mixed load.
+
+Runs the app on a threaded local server against a scratch database. Login
+threads sign in continuously while reader threads fetch /api/groups.
+Both run with bcrypt inline on the request threads and with bcrypt in
+the password pool. Reports logins per second and p50/p99 latency for
+logins and for the other requests sharing the server.
+
+Usage:
+    python3 bench_login.py [seconds] [--logins N] [--readers N] [--rounds N]
+"""
+
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import db
+import passwords
+from migrations import migrate
+
+import app as centsible
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def request(base, path, body=None, token=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base + path, data=data, method='POST' if body is not None else 'GET')
+    req.add_header('Content-Type', 'application/json')
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    started = time.perf_counter()
+    with urllib.request.urlopen(req) as response:
+        payload = json.loads(response.read())
+    return payload, (time.perf_counter() - started) * 1000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_mode(base, token, seconds, login_threads, reader_threads):
+    deadline = time.monotonic() + seconds
+    logins, reads = [], []
+
+    def login_loop():
+        while time.monotonic() < deadline:
+            logins.append(request(base, '/auth/login', {'email': 'bench@example.com', 'password': 'secret1'})[1])
+
+    def read_loop():
+        while time.monotonic() < deadline:
+            reads.append(request(base, '/api/groups', token=token)[1])
+
+    threads = [threading.Thread(target=login_loop) for _ in range(login_threads)]
+    threads += [threading.Thread(target=read_loop) for _ in range(reader_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return logins, reads
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'--logins': 8, '--readers': 4, '--rounds': passwords.BCRYPT_ROUNDS}
+    for name in options:
+        if name in args:
+            index = args.index(name)
+            options[name] = int(args[index + 1])
+            del args[index:index + 2]
+    seconds = float(args[0]) if args else 10
+    passwords.BCRYPT_ROUNDS = options['--rounds']
+
+    scratch = tempfile.mkdtemp(prefix='login-bench-')
+    server = None
+    try:
+        db.configure_pool(os.path.join(scratch, 'bench.db'))
+        conn = db.get_pool().acquire()
+        with open(SCHEMA_PATH) as f:
+            conn.executescript(f.read())
+        migrate(conn)
+        conn.close()
+
+        server = make_server('127.0.0.1', 0, centsible.app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_port}'
+        token = request(base, '/auth/signup', {'name': 'bench', 'email': 'bench@example.com', 'password': 'secret1'})[0]['token']
+
+        print(
+            f"{seconds:.0f}s per mode, {options['--logins']} login threads, "
+            f"{options['--readers']} reader threads, bcrypt cost {passwords.BCRYPT_ROUNDS}, "
+            f"{passwords.PASSWORD_WORKERS} pool workers"
+        )
+        print(f"{'mode':<8}{'logins/s':>10}{'login p50':>12}{'login p99':>12}{'other p50':>12}{'other p99':>12}")
+        pool_workers = passwords.PASSWORD_WORKERS
+        for label, workers in (('inline', 0), ('pool', pool_workers)):
+            passwords.PASSWORD_WORKERS = workers
+            if workers:
+                # Start the workers before timing
+                passwords.verify_password('secret1', passwords.hash_password('secret1'))
+            logins, reads = run_mode(base, token, seconds, options['--logins'], options['--readers'])
+            print(
+                f"{label:<8}{len(logins) / seconds:>10.1f}"
+                f"{statistics.median(logins):>10.0f}ms{percentile(logins, 99):>10.0f}ms"
+                f"{statistics.median(reads):>10.1f}ms{percentile(reads, 99):>10.1f}ms"
+            )
+    finally:
+        if server is not None:
+            server.shutdown()
+        passwords.shutdown()
+        db.configure_pool()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark OCR micro-batching: throughput versus tail latency.
+
+Submits a burst of distinct receipts through ocr_jobs for several
+(batch size, window) settings against a scratch database and reports jobs
+per second alongside p50/p99 submit-to-finish latency. Without easyocr
+installed the jobs fail fast, so only the dispatch overhead is measured.
+
+Usage:
+    python3 bench_ocr_batching.py [receipts] [--workers N]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+import db
+import ocr_jobs
+from migrations import migrate
+from receipt_ocr import ocr_available
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+SETTINGS = [(1, 0), (4, 10), (8, 20), (16, 50)]
+
+
+def make_receipts(directory, count):
+    """Small distinct receipts (distinct bytes, so the OCR cache never hits)."""
+    paths = []
+    for index in range(count):
+        image = Image.new('L', (800, 1400), 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(20):
+            draw.text((60, 80 + line * 50), f'ITEM {line:02d}    {line + index}.50', fill=0)
+        draw.text((60, 1250), f'TOTAL    {100 + index}.25', fill=0)
+        path = os.path.join(directory, f'receipt_{index}.png')
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def run_setting(paths, user_id, batch_size, window_ms):
+    ocr_jobs.OCR_BATCH_SIZE = batch_size
+    ocr_jobs.OCR_BATCH_WINDOW_MS = window_ms
+    ocr_jobs._latencies.clear()
+    before = ocr_jobs.stats()
+    # Start the workers (and load their models) before timing
+    for future in ocr_jobs.warm_up():
+        future.result()
+
+    started = time.perf_counter()
+    for path in paths:
+        ocr_jobs.submit_job(user_id, path)
+    while ocr_jobs.stats()['pending']:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    stats = ocr_jobs.stats()
+    ocr_jobs.shutdown()
+    batches = stats['batches'] - before['batches']
+    mean_batch = (stats['batched_jobs'] - before['batched_jobs']) / batches if batches else 0
+    return len(paths) / elapsed, stats['total_ms'], mean_batch
+
+
+def main():
+    args = sys.argv[1:]
+    if '--workers' in args:
+        index = args.index('--workers')
+        ocr_jobs.OCR_JOB_WORKERS = int(args[index + 1])
+        del args[index:index + 2]
+    count = int(args[0]) if args else 32
+
+    scratch = tempfile.mkdtemp(prefix='ocr-batch-bench-')
+    try:
+        db.configure_pool(os.path.join(scratch, 'bench.db'))
+        conn = db.get_pool().acquire()
+        with open(SCHEMA_PATH) as f:
+            conn.executescript(f.read())
+        migrate(conn)
+        user_id = conn.execute(
+            "INSERT INTO users (username, email, password_hash) VALUES ('bench', 'bench@example.com', 'x')"
+        ).lastrowid
+        conn.commit()
+        conn.close()
+
+        paths = make_receipts(scratch, count)
+        if not ocr_available():
+            print('Note: easyocr is not installed; jobs fail fast and only dispatch overhead is measured.')
+        print(f"{count} receipts, {ocr_jobs.OCR_JOB_WORKERS} workers")
+        print(f"{'batch':>6}{'window':>9}{'jobs/s':>10}{'p50':>10}{'p99':>10}{'mean batch':>12}")
+        for batch_size, window_ms in SETTINGS:
+            throughput, total, mean_batch = run_setting(paths, user_id, batch_size, window_ms)
+            print(
+                f"{batch_size:>6}{window_ms:>7}ms{throughput:>10.1f}"
+                f"{total['p50']:>8.0f}ms{total['p99']:>8.0f}ms{mean_batch:>12.2f}"
+            )
+            # Results from one setting must not be served from cache in the next
+            conn = db.get_pool().acquire()
+            conn.execute('DELETE FROM ocr_cache')
+            conn.commit()
+            conn.close()
+    finally:
+        db.configure_pool()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
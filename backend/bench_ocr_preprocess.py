@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark the OCR image preprocessing stage.
+
+For every receipt in a fixture directory, measures the OCR path with
+preprocessing off and on: median latency, the size of the image handed to
+easyocr and the peak resident memory of the process. Each mode runs in a
+fresh interpreter so peak memory is not shared between them. Recognition
+is included when easyocr is installed; otherwise only image preparation
+is timed.
+
+Without a directory a set of synthetic 12 MP receipt photos is generated.
+
+Usage:
+    python3 bench_ocr_preprocess.py [fixture_dir] [--runs N]
+"""
+
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+import receipt_ocr
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff')
+
+
+def make_fixtures(directory, count=4):
+    """Write synthetic phone-sized receipts, alternating RGB JPEG and RGBA PNG."""
+    paths = []
+    for index in range(count):
+        image = Image.new('RGB', (3024, 4032), (235, 230, 220))
+        draw = ImageDraw.Draw(image)
+        y = 200
+        for line in range(40):
+            draw.text((300, y), f'ITEM {line:02d} ............ {line + 1}.99', fill=(40, 40, 40))
+            y += 80
+        draw.text((300, y + 100), f'TOTAL ............ {100 + index}.45', fill=(0, 0, 0))
+        if index % 2:
+            path = os.path.join(directory, f'receipt_{index}.png')
+            image.convert('RGBA').save(path)
+        else:
+            path = os.path.join(directory, f'receipt_{index}.jpg')
+            image.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def prepare(img, preprocess):
+    """The image easyocr would receive (as PIL, so numpy is optional here)."""
+    if preprocess:
+        return receipt_ocr.preprocess_image(img)
+    img.load()
+    return img
+
+
+def run_worker(preprocess, runs, paths):
+    """Time every fixture in this process and print the results as JSON."""
+    receipt_ocr.OCR_PREPROCESS = preprocess
+    reader = receipt_ocr.get_reader()
+    latencies = []
+    pixels = []
+    for path in paths:
+        for _ in range(runs):
+            started = time.perf_counter()
+            with receipt_ocr._open_for_ocr(path) as img:
+                if reader is not None:
+                    array = receipt_ocr._image_for_ocr(img)
+                    reader.readtext(array)
+                    pixels.append(array.shape[0] * array.shape[1])
+                else:
+                    prepared = prepare(img, preprocess)
+                    pixels.append(prepared.size[0] * prepared.size[1])
+            latencies.append(time.perf_counter() - started)
+    print(json.dumps({
+        'latencies': latencies,
+        'pixels': pixels,
+        'ocr': reader is not None,
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    args = sys.argv[1:]
+    runs = 3
+    if '--runs' in args:
+        index = args.index('--runs')
+        runs = int(args[index + 1])
+        del args[index:index + 2]
+
+    if args and args[0] == '--worker':
+        run_worker(args[1] == 'on', runs, args[2:])
+        return
+
+    if args:
+        fixture_dir = args[0]
+        paths = sorted(
+            os.path.join(fixture_dir, name) for name in os.listdir(fixture_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    else:
+        fixture_dir = tempfile.mkdtemp(prefix='ocr-bench-')
+        paths = make_fixtures(fixture_dir)
+    if not paths:
+        print(f'No images found in {fixture_dir}')
+        sys.exit(1)
+
+    print(f"{len(paths)} receipts, {runs} runs each, max edge {receipt_ocr.OCR_MAX_EDGE}px")
+    header_printed = False
+    for label, mode in (('original', 'off'), ('preprocessed', 'on')):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', mode, '--runs', str(runs)] + paths,
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if not header_printed:
+            if not result['ocr']:
+                print('Note: easyocr is not installed; timing image preparation only.')
+            print(f"{'mode':<16}{'median latency':>16}{'OCR input':>14}{'peak RSS':>12}")
+            header_printed = True
+        megapixels = statistics.median(result['pixels']) / 1e6
+        print(
+            f"{label:<16}{statistics.median(result['latencies']) * 1000:>13.1f} ms"
+            f"{megapixels:>11.1f} MP{result['peak_rss_mb']:>9.1f} MB"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the backend.
+
+Imports app.py in fresh interpreters and reports the median wall time,
+with OCR left lazy (the default) and with the OCR model loaded eagerly
+the way app.py used to do it at import time.
+
+Usage:
+    python3 bench_startup.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = [
+    ('import app (lazy OCR)', 'import app'),
+    ('import app + load OCR model', 'import app, receipt_ocr; receipt_ocr.warm_up()'),
+]
+
+
+def time_import(code, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, check=True)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sys.path.insert(0, BACKEND_DIR)
+    from receipt_ocr import ocr_available
+    if not ocr_available():
+        print('Note: easyocr is not installed, so both scenarios skip the model load.')
+
+    print(f"{'scenario':<32}{'median':>10}{'min':>10}{'max':>10}")
+    for label, code in SCENARIOS:
+        samples = time_import(code, runs)
+        print(f"{label:<32}{statistics.median(samples):>9.3f}s{min(samples):>9.3f}s{max(samples):>9.3f}s")
+
+
+if __name__ == '__main__':
+    main()
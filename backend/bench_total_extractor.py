@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the receipt total extractor.
+
+Times find_total_amount_in_text against the previous implementation
+(lowercase each line, then substring checks against every keyword and
+exclusion) over the regression corpus in fixtures/receipt_texts.json,
+and checks that both give the same answers.
+
+Usage:
+    python3 bench_total_extractor.py [repeats]
+"""
+
+import json
+import os
+import re
+import sys
+import timeit
+
+from receipt_ocr import EXCLUDE_KEYWORDS, RECEIPT_KEYWORDS, find_total_amount_in_text
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'receipt_texts.json')
+
+
+def legacy_extract_amount_from_line(line):
+    if not line:
+        return None
+    matches = re.findall(r'(-?\d[\d,]*(?:\.\d{1,2})?)', line.replace(',', ''))
+    for match in matches:
+        try:
+            value = float(match)
+            if value >= 0:
+                return round(value, 2)
+        except ValueError:
+            continue
+    return None
+
+
+def legacy_find_total_amount_in_text(text):
+    if not text:
+        return None
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    for idx, raw_line in enumerate(lines):
+        line = raw_line.lower()
+        if any(exclude_word in line for exclude_word in EXCLUDE_KEYWORDS):
+            continue
+        for keyword in RECEIPT_KEYWORDS:
+            if keyword in line:
+                amount = legacy_extract_amount_from_line(raw_line)
+                if amount is not None:
+                    return amount
+                if idx + 1 < len(lines):
+                    next_amount = legacy_extract_amount_from_line(lines[idx + 1])
+                    if next_amount is not None:
+                        return next_amount
+    return None
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CORPUS_PATH) as f:
+        texts = [case['text'] for case in json.load(f)]
+    # A long receipt: totals sit at the bottom after many item lines
+    texts.append('\n'.join(f'ITEM {i:03d} ........ {i}.99' for i in range(300)) + '\nTOTAL 1,234.56')
+
+    for text in texts:
+        assert find_total_amount_in_text(text) == legacy_find_total_amount_in_text(text), text
+
+    print(f"{len(texts)} receipt texts x {repeats} repeats")
+    results = {}
+    for label, func in (('legacy', legacy_find_total_amount_in_text), ('compiled', find_total_amount_in_text)):
+        seconds = timeit.timeit(lambda: [func(text) for text in texts], number=repeats)
+        results[label] = seconds
+        print(f"{label:<10}{seconds / (repeats * len(texts)) * 1e6:>10.2f} us/receipt")
+    print(f"speedup   {results['legacy'] / results['compiled']:>10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Change log behind GET /api/sync.
+
+Writes in app.py record what they changed (expenses, splits, payments,
+balance rows, memberships) here in their own transaction, so a change is
+logged exactly when it commits. Clients keep the change_id of the last
+entry they saw as their cursor and fetch only what came after it, for the
+groups they belong to.
+
+Entries older than CHANGE_LOG_RETENTION_DAYS are pruned as new ones are
+written. The newest entry is always kept, so a cursor is still usable as
+long as it is not older than the oldest entry left.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+CHANGE_LOG_RETENTION_DAYS = float(os.environ.get('CHANGE_LOG_RETENTION_DAYS', '30'))
+SYNC_PAGE_SIZE = 500
+
+
+def record(conn, group_id, changes, now=None):
+    """
+    Log (entity, entity_key, op, data) changes for a group and prune old
+    entries. entity_key identifies the row within its entity, e.g.
+    '<expense_id>:<user_id>' for a split. The caller commits.
+    """
+    now = now or datetime.now().isoformat()
+    conn.executemany(
+        """
+        INSERT INTO change_log (group_id, entity, entity_key, op, data, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (group_id, entity, str(entity_key), op, json.dumps(data, separators=(',', ':')), now)
+            for entity, entity_key, op, data in changes
+        ]
+    )
+    prune(conn, now)
+
+
+def prune(conn, now=None):
+    """Drop entries past retention, except the newest. Returns how many went."""
+    now = datetime.fromisoformat(now) if now else datetime.now()
+    cutoff = (now - timedelta(days=CHANGE_LOG_RETENTION_DAYS)).isoformat()
+    return conn.execute(
+        """
+        DELETE FROM change_log
+        WHERE created_at < ? AND change_id < (SELECT MAX(change_id) FROM change_log)
+        """,
+        (cutoff,)
+    ).rowcount
+
+
+def latest_cursor(conn):
+    return conn.execute('SELECT MAX(change_id) FROM change_log').fetchone()[0] or 0
+
+
+def cursor_expired(conn, since):
+    """True if entries after since may have been pruned (or the log was reset)."""
+    oldest, newest = conn.execute('SELECT MIN(change_id), MAX(change_id) FROM change_log').fetchone()
+    if oldest is None:
+        return since != 0
+    return since < oldest - 1 or since > newest
+
+
+def changes_for_user(conn, user_id, since, limit=SYNC_PAGE_SIZE):
+    """Up to limit entries after since in the user's groups, and whether more remain."""
+    rows = conn.execute(
+        """
+        SELECT change_id, group_id, entity, entity_key, op, data, created_at
+        FROM change_log
+        WHERE change_id > ?
+          AND group_id IN (SELECT group_id FROM members WHERE user_id = ? AND deleted_at IS NULL)
+        ORDER BY change_id
+        LIMIT ?
+        """,
+        (since, user_id, limit + 1)
+    ).fetchall()
+    changes = [
+        {
+            'change_id': row['change_id'],
+            'group_id': row['group_id'],
+            'entity': row['entity'],
+            'key': row['entity_key'],
+            'op': row['op'],
+            'data': json.loads(row['data']),
+            'created_at': row['created_at']
+        }
+        for row in rows[:limit]
+    ]
+    return changes, len(rows) > limit
+
+
+if __name__ == '__main__':
+    import sys
+
+    import db
+
+    if sys.argv[1:] == ['prune']:
+        conn = db.get_pool().acquire()
+        removed = prune(conn)
+        conn.commit()
+        conn.close()
+        print(f'Removed {removed} change log entries older than {CHANGE_LOG_RETENTION_DAYS:g} days.')
+    else:
+        print('Usage: python3 change_log.py prune')
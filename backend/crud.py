@@ -1,13 +1,11 @@
-import sqlite3
 from datetime import datetime
 from collections import defaultdict
 
-DB_NAME = "test.db"
+from db import get_db
 
 def get_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+    # Pooled connection (foreign keys are enabled by the pool)
+    return get_db()
 
 def create_user(username, email, password_hash):
     conn = get_connection()
@@ -131,4 +129,74 @@ def get_net_balances():
         net[borrower] -= amount  # borrower owes
 
     conn.close()
-    return dict(net)
\ No newline at end of file
+    return dict(net)
+
+
+def apply_balance_changes(conn, group_id, changes, now=None):
+    """
+    Apply (lender, borrower, amount) changes to the signed balance ledger:
+    each one means borrower owes lender `amount` more (negative to reduce).
+    Every pair is a single upsert and the whole batch is one executemany;
+    user_balance_summary is updated by triggers in the same transaction.
+    """
+    now = now or datetime.now().isoformat()
+    rows = []
+    for lender, borrower, amount in changes:
+        if lender == borrower or not amount:
+            continue
+        # Canonical order: positive amount means user_hi owes user_lo
+        signed = amount if lender < borrower else -amount
+        rows.append((group_id, min(lender, borrower), max(lender, borrower), round(signed, 2), now, now))
+    if rows:
+        conn.executemany(
+            """
+            INSERT INTO balance_pairs (group_id, user_lo, user_hi, amount, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(group_id, user_lo, user_hi) DO UPDATE SET
+                amount = ROUND(amount + excluded.amount, 2),
+                updated_at = excluded.updated_at
+            """,
+            rows
+        )
+
+def rebuild_balance_summary(conn):
+    """Recompute user_balance_summary from the balances table (backfill/repair)."""
+    now = datetime.now().isoformat()
+    conn.execute("DELETE FROM user_balance_summary")
+    conn.execute("""
+        INSERT INTO user_balance_summary (user_id, group_id, net, owed_by_me, owed_to_me, updated_at)
+        SELECT user_id, group_id, SUM(owed_to_me) - SUM(owed_by_me), SUM(owed_by_me), SUM(owed_to_me), ?
+        FROM (
+            SELECT lender AS user_id, group_id, 0 AS owed_by_me, amount AS owed_to_me FROM balances
+            UNION ALL
+            SELECT borrower AS user_id, group_id, amount AS owed_by_me, 0 AS owed_to_me FROM balances
+        )
+        GROUP BY user_id, group_id
+    """, (now,))
+
+def get_balance_summary(user_id):
+    """
+    Returns (net, owed_by_me, owed_to_me) for one user across all groups.
+    Positive net = user is owed money
+    """
+    conn = get_connection()
+    row = conn.execute("""
+        SELECT COALESCE(SUM(net), 0), COALESCE(SUM(owed_by_me), 0), COALESCE(SUM(owed_to_me), 0)
+        FROM user_balance_summary
+        WHERE user_id = ?
+    """, (user_id,)).fetchone()
+    conn.close()
+    return float(row[0]), float(row[1]), float(row[2])
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["rebuild-balance-summary"]:
+        conn = get_connection()
+        rebuild_balance_summary(conn)
+        conn.commit()
+        conn.close()
+        print("user_balance_summary rebuilt from balances.")
+    else:
+        print("Usage: python3 crud.py rebuild-balance-summary")
@@ -0,0 +1,257 @@
+"""
+Pooled SQLite connections for Centsible.
+
+Connections are opened once and handed out from a bounded pool instead of
+running sqlite3.connect() on every call. Inside a Flask request the
+connection is bound to the app context (flask.g) and returned to the pool
+on teardown, so helpers called during the same request share it.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, has_app_context
+
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'test.db')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+# Connections idle for longer than this are pinged before being reused
+HEALTH_CHECK_AFTER = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', '30'))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """
+    Thin wrapper around sqlite3.Connection.
+    close() rolls back anything uncommitted and hands the connection back to
+    the pool instead of closing it, so existing call sites keep working.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.closed = False
+        self.last_used = time.monotonic()
+
+    def _checked_out(self):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            # The raw connection may already belong to another thread
+            raise sqlite3.ProgrammingError('connection returned to pool')
+        return raw
+
+    def __getattr__(self, name):
+        return getattr(self._checked_out(), name)
+
+    def __enter__(self):
+        return self._checked_out().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._checked_out().__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._pool.release(self)
+        self._raw = None
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of SQLite connections."""
+
+    def __init__(self, database, max_size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 health_check_after=HEALTH_CHECK_AFTER, on_connect=None):
+        self.database = database
+        self.on_connect = on_connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._idle = deque()
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._metrics = {
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+        }
+
+    def _connect(self):
+        # Connections move between request threads, but only one thread
+        # holds a given connection at a time (enforced by the pool)
+        raw = sqlite3.connect(self.database, check_same_thread=False)
+        raw.row_factory = sqlite3.Row
+        raw.execute('PRAGMA foreign_keys = ON;')
+        if self.on_connect is not None:
+            self.on_connect(raw)
+        with self._lock:
+            self._metrics['connections_created'] += 1
+        return raw
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - conn.last_used < self.health_check_after:
+            return True
+        self._metrics['health_checks'] += 1
+        try:
+            conn._raw.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            self._metrics['health_check_failures'] += 1
+            return False
+
+    def _discard(self, raw):
+        self._metrics['connections_discarded'] += 1
+        try:
+            raw.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds if the pool is exhausted."""
+        started = time.monotonic()
+        waited = False
+        with self._lock:
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if self._is_healthy(conn):
+                        self._in_use += 1
+                        self._record_checkout(started, waited)
+                        return PooledConnection(self, conn._raw)
+                    self._discard(conn._raw)
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available after {self.timeout:.1f}s'
+                    )
+                waited = True
+                self._lock.wait(remaining)
+            self._record_checkout(started, waited)
+
+        # Open the new connection outside the lock
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        return PooledConnection(self, raw)
+
+    def _record_checkout(self, started, waited):
+        self._metrics['checkouts'] += 1
+        if waited:
+            wait_ms = (time.monotonic() - started) * 1000
+            self._metrics['waits'] += 1
+            self._metrics['wait_time_total_ms'] += wait_ms
+            self._metrics['wait_time_max_ms'] = max(self._metrics['wait_time_max_ms'], wait_ms)
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work."""
+        raw = conn._raw
+        healthy = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except sqlite3.Error:
+            healthy = False
+        with self._lock:
+            self._in_use -= 1
+            if healthy and len(self._idle) < self.max_size:
+                # A new wrapper, so the caller's reference goes dead on close
+                idle = PooledConnection(self, raw)
+                idle.last_used = time.monotonic()
+                self._idle.append(idle)
+            else:
+                self._discard(raw)
+            self._lock.notify()
+
+    def close_all(self):
+        """Close idle connections (used on shutdown and in tests)."""
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()._raw)
+
+    def stats(self):
+        """Snapshot of pool size and wait-time metrics."""
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot.update({
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        snapshot['wait_time_total_ms'] = round(snapshot['wait_time_total_ms'], 3)
+        snapshot['wait_time_max_ms'] = round(snapshot['wait_time_max_ms'], 3)
+        return snapshot
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_PATH)
+    return _pool
+
+
+def configure_pool(database=None, **kwargs):
+    """Replace the process-wide pool, e.g. to point at another database file."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(database or DATABASE_PATH, **kwargs)
+    return _pool
+
+
+def get_db():
+    """
+    Get a database connection.
+    Within a Flask app context the same connection is reused until it is
+    closed or the context tears down; otherwise a fresh checkout is returned.
+    """
+    if not has_app_context():
+        return get_pool().acquire()
+    conn = g.get('_db_conn')
+    if conn is None or conn.closed:
+        conn = get_pool().acquire()
+        g._db_conn = conn
+    return conn
+
+
+def close_db(exc=None):
+    """Teardown hook: release the context-bound connection back to the pool."""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.close()
+
+
+def init_app(app):
+    """Bind the pool to a Flask app."""
+    database = app.config.get('DATABASE')
+    if database and get_pool().database != database:
+        configure_pool(database)
+    app.teardown_appcontext(close_db)
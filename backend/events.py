@@ -0,0 +1,236 @@
+"""
+Live updates over Server-Sent Events.
+
+Handlers publish small deltas after their transaction commits; the event
+stream endpoints subscribe to a group's channel ('group:<id>') or a user's
+('user:<id>') and write whatever arrives to the open response.
+
+Delivery goes through a broker. LocalBroker keeps subscribers in this
+process, which is enough for a single app process. Deployments with
+several processes can install anything with the same publish/subscribe
+interface (for example one backed by Redis pub/sub) with set_broker().
+Each channel keeps its last EVENTS_REPLAY_SIZE events, so a client that
+reconnects with Last-Event-ID gets what it missed, or a 'resync' event
+when that is no longer possible.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from itertools import count
+
+EVENTS_REPLAY_SIZE = int(os.environ.get('EVENTS_REPLAY_SIZE', '50'))
+# Events queued for one slow subscriber before it is told to resync
+EVENTS_SUBSCRIBER_QUEUE = int(os.environ.get('EVENTS_SUBSCRIBER_QUEUE', '100'))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+# Streams end after this long and the client reconnects, so a stream does
+# not hold a server thread forever
+EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS', '300'))
+EVENTS_RETRY_MS = 3000
+
+
+def group_channel(group_id):
+    return f'group:{group_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Broker(ABC):
+    """Interface for event delivery. Event ids must increase per broker."""
+
+    @abstractmethod
+    def publish(self, channel, event_type, data):
+        """Deliver an event to the channel's current subscribers."""
+
+    @abstractmethod
+    def subscribe(self, channels, last_event_id=None):
+        """
+        A Subscription to the channels. With last_event_id, events after it
+        are delivered first, or a 'resync' event if they are gone.
+        """
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        """Stop delivering to the subscription."""
+
+    def stats(self):
+        return {}
+
+
+class Subscription:
+    """Queue of events for one stream."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self._queue = queue.Queue(maxsize=EVENTS_SUBSCRIBER_QUEUE)
+        self._overflowed = False
+
+    def deliver(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Dropping events silently would leave the client wrong
+            self._overflowed = True
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout."""
+        if self._overflowed:
+            self._overflowed = False
+            self._drain()
+            return resync_event()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+def resync_event():
+    """Tells the client to reload from the regular endpoints."""
+    return {'id': None, 'type': 'resync', 'data': {}}
+
+
+class LocalBroker(Broker):
+    """In-process broker. Event ids are '<broker start>-<sequence>'."""
+
+    def __init__(self, replay_size=EVENTS_REPLAY_SIZE):
+        self.replay_size = replay_size
+        self._epoch = str(int(time.time() * 1000))
+        self._sequence = count(1)
+        self._subscribers = {}  # channel -> set of Subscriptions
+        self._recent = {}  # channel -> deque of recent events
+        self._evicted = {}  # channel -> sequence of the newest event no longer kept
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def publish(self, channel, event_type, data):
+        with self._lock:
+            event = {'id': f'{self._epoch}-{next(self._sequence)}', 'type': event_type, 'data': data}
+            recent = self._recent.setdefault(channel, deque(maxlen=self.replay_size))
+            if len(recent) == recent.maxlen:
+                self._evicted[channel] = self._sequence_of(recent[0])
+            recent.append(event)
+            subscribers = list(self._subscribers.get(channel, ()))
+            self._published += 1
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, channels, last_event_id=None):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+            if last_event_id:
+                missed = self._missed(channels, last_event_id)
+                for event in missed if missed is not None else [resync_event()]:
+                    subscription.deliver(event)
+        return subscription
+
+    def _missed(self, channels, last_event_id):
+        """Events after last_event_id, or None if some may have been dropped."""
+        epoch, _, sequence = last_event_id.partition('-')
+        if epoch != self._epoch or not sequence.isdigit():
+            return None  # from before a restart
+        last = int(sequence)
+        missed = []
+        for channel in channels:
+            if self._evicted.get(channel, 0) > last:
+                return None
+            missed.extend(event for event in self._recent.get(channel, ()) if self._sequence_of(event) > last)
+        return sorted(missed, key=self._sequence_of)
+
+    @staticmethod
+    def _sequence_of(event):
+        return int(event['id'].rsplit('-', 1)[1])
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._subscribers),
+                'subscriptions': len({s for subs in self._subscribers.values() for s in subs}),
+                'published': self._published,
+            }
+
+
+_broker = LocalBroker()
+
+
+def get_broker():
+    return _broker
+
+
+def set_broker(broker):
+    """Install another Broker implementation (e.g. one shared between processes)."""
+    global _broker
+    _broker = broker
+
+
+def publish(channel, event_type, data):
+    return _broker.publish(channel, event_type, data)
+
+
+def format_event(event):
+    """One SSE message."""
+    lines = []
+    if event['id']:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(channels, last_event_id=None, transform=None):
+    """
+    Generator of SSE text for a streaming response. transform(event) may
+    rewrite an event for this subscriber, or return None to skip it.
+    """
+    subscription = _broker.subscribe(channels, last_event_id)
+    deadline = time.monotonic() + EVENTS_MAX_STREAM_SECONDS
+    try:
+        yield f'retry: {EVENTS_RETRY_MS}\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = subscription.get(timeout=min(EVENTS_HEARTBEAT_SECONDS, remaining))
+            if event is None:
+                # Comment line: keeps proxies from timing out the connection
+                yield ': keep-alive\n\n'
+                continue
+            if transform is not None and event['type'] != 'resync':
+                event = transform(event)
+                if event is None:
+                    continue
+            yield format_event(event)
+    finally:
+        subscription.close()
+
+
+def stats():
+    return _broker.stats()
@@ -7,6 +7,8 @@ Creates the database schema
 import sqlite3
 import os
 
+from migrations import migrate
+
 def init_database():
     """Initialize the database with schema"""
     
@@ -26,6 +28,11 @@ def init_database():
     print("Database schema created successfully!")
     
     conn.commit()
+
+    # Apply versioned migrations (indexes, newer tables)
+    applied = migrate(conn)
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
     conn.close()
     print("Database initialization complete!")
 
@@ -0,0 +1,103 @@
+"""
+Group join-code allocation.
+
+Codes are not drawn at random and retried on collision. Each code length
+has a counter row in join_code_counters, and the next counter value goes
+through a keyed Feistel permutation of the 36^length code space.
+Consecutive groups therefore get unrelated-looking codes that never
+collide with each other. A code costs one UPDATE ... RETURNING and one
+index lookup on the caller's connection, inside the caller's transaction.
+The lookup guards against codes handed out randomly before this allocator
+existed.
+
+Once JOIN_CODE_MAX_FILL of a length's space is used, allocation moves on
+to the next length. That way a guessed code rarely belongs to a group.
+"""
+
+import hashlib
+import hmac
+import secrets
+import string
+
+ALPHABET = string.digits + string.ascii_uppercase
+JOIN_CODE_MIN_LENGTH = 4
+JOIN_CODE_MAX_LENGTH = 8
+# Move to longer codes once this share of a length's codes is in use
+JOIN_CODE_MAX_FILL = 0.5
+# Even, so the alternating halves end up back in their original sizes
+FEISTEL_ROUNDS = 4
+
+
+def _round_value(seed, length, round_number, value):
+    message = f'{length}:{round_number}:{value}'.encode('ascii')
+    digest = hmac.new(seed.encode('ascii'), message, hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def permute(index, length, seed):
+    """
+    Keyed bijection on [0, 36**length): an alternating Feistel network over
+    the high and low halves of the code's digits.
+    """
+    high = len(ALPHABET) ** ((length + 1) // 2)
+    low = len(ALPHABET) ** (length // 2)
+    left, right = divmod(index, low)
+    for round_number in range(FEISTEL_ROUNDS):
+        left, right = right, (left + _round_value(seed, length, round_number, right)) % high
+        high, low = low, high
+    return left * low + right
+
+
+def encode(value, length):
+    digits = []
+    for _ in range(length):
+        value, digit = divmod(value, len(ALPHABET))
+        digits.append(ALPHABET[digit])
+    return ''.join(reversed(digits))
+
+
+def capacity(length):
+    """How many codes of this length are handed out before moving to the next."""
+    return max(1, int(len(ALPHABET) ** length * JOIN_CODE_MAX_FILL))
+
+
+def allocate(conn):
+    """
+    Reserve an unused join code. Runs on the caller's connection and
+    transaction, so the code is released again if the group insert rolls back.
+    """
+    while True:
+        # Current length: the longest opened so far (a primary-key lookup)
+        current = conn.execute('SELECT MAX(length) FROM join_code_counters').fetchone()[0]
+        length = current or JOIN_CODE_MIN_LENGTH
+        reserved = conn.execute(
+            """
+            UPDATE join_code_counters SET next_index = next_index + 1
+            WHERE length = ? AND next_index < ?
+            RETURNING next_index - 1, seed
+            """,
+            (length, capacity(length))
+        ).fetchall()
+        if not reserved:
+            # No counter yet, or this length is full: open the next one
+            next_length = length if current is None else length + 1
+            if next_length > JOIN_CODE_MAX_LENGTH:
+                raise RuntimeError('Join code space exhausted')
+            conn.execute(
+                'INSERT OR IGNORE INTO join_code_counters (length, next_index, seed) VALUES (?, 0, ?)',
+                (next_length, secrets.token_hex(16))
+            )
+            continue
+
+        index, seed = reserved[0]
+        code = encode(permute(index, length, seed), length)
+        # Codes from the old random allocator can sit anywhere in the 4-character space
+        if conn.execute('SELECT 1 FROM groups WHERE join_code = ?', (code,)).fetchone() is None:
+            return code
+
+
+def is_valid(code):
+    return (
+        JOIN_CODE_MIN_LENGTH <= len(code) <= JOIN_CODE_MAX_LENGTH
+        and all(char in ALPHABET for char in code)
+    )
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for Centsible.
+
+schema.sql creates the base tables for a fresh database. Everything added
+after that (new tables, columns, indexes) lives here as a numbered
+migration so existing databases can be brought up to date. Applied
+versions are recorded in the schema_migrations table.
+
+Usage:
+    python3 migrations.py            # apply pending migrations
+    python3 migrations.py --status   # list applied and pending versions
+"""
+
+import sys
+from datetime import datetime
+
+from db import get_db
+from crud import rebuild_balance_summary
+
+
+def _attachments_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS expense_attachments (
+            attachment_id INTEGER PRIMARY KEY NOT NULL,
+            expense_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            original_filename TEXT,
+            mime_type TEXT,
+            is_receipt INTEGER DEFAULT 0,
+            ocr_total NUMERIC,
+            created_at TEXT,
+            FOREIGN KEY (expense_id) REFERENCES expenses(expense_id) ON DELETE CASCADE
+        )
+        """
+    )
+
+
+def _hot_path_indexes(conn):
+    # Partial indexes only cover active rows; every membership query in
+    # app.py filters on deleted_at IS NULL so the planner can use them.
+    statements = [
+        'CREATE INDEX IF NOT EXISTS idx_members_user_active ON members(user_id, group_id) WHERE deleted_at IS NULL',
+        'CREATE INDEX IF NOT EXISTS idx_members_group_active ON members(group_id, user_id) WHERE deleted_at IS NULL',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_group_created ON expenses(group_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_expense_splits_expense ON expense_splits(expense_id)',
+        'CREATE INDEX IF NOT EXISTS idx_expense_splits_user_status ON expense_splits(user_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_balances_group_pair ON balances(group_id, lender, borrower)',
+        'CREATE INDEX IF NOT EXISTS idx_balances_lender ON balances(lender)',
+        'CREATE INDEX IF NOT EXISTS idx_balances_borrower ON balances(borrower)',
+        'CREATE INDEX IF NOT EXISTS idx_payments_group_paid ON payments(group_id, paid_at)',
+        'CREATE INDEX IF NOT EXISTS idx_expense_attachments_expense ON expense_attachments(expense_id)',
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+def _user_balance_summary(conn):
+    # Per-user, per-group running totals maintained alongside balances so
+    # /api/balance does not have to aggregate the whole balances table
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_balance_summary (
+            user_id INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            net NUMERIC NOT NULL DEFAULT 0,
+            owed_by_me NUMERIC NOT NULL DEFAULT 0,
+            owed_to_me NUMERIC NOT NULL DEFAULT 0,
+            updated_at TEXT,
+            PRIMARY KEY (user_id, group_id),
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (group_id) REFERENCES groups(group_id)
+        )
+        """
+    )
+    rebuild_balance_summary(conn)
+
+
+def _signed_balance_pairs(conn):
+    # One row per unordered pair of users in a group. amount > 0 means
+    # user_hi owes user_lo; amount < 0 means user_lo owes user_hi.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS balance_pairs (
+            pair_id INTEGER PRIMARY KEY NOT NULL,
+            group_id INTEGER NOT NULL,
+            user_lo INTEGER NOT NULL,
+            user_hi INTEGER NOT NULL,
+            amount NUMERIC NOT NULL DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT,
+            UNIQUE (group_id, user_lo, user_hi),
+            CHECK (user_lo < user_hi),
+            FOREIGN KEY (group_id) REFERENCES groups(group_id),
+            FOREIGN KEY (user_lo) REFERENCES users(id),
+            FOREIGN KEY (user_hi) REFERENCES users(id)
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO balance_pairs (group_id, user_lo, user_hi, amount, created_at, updated_at)
+        SELECT group_id, MIN(lender, borrower), MAX(lender, borrower),
+               ROUND(SUM(CASE WHEN lender < borrower THEN amount ELSE -amount END), 2),
+               MIN(created_at), MAX(updated_at)
+        FROM balances
+        WHERE lender != borrower
+        GROUP BY group_id, MIN(lender, borrower), MAX(lender, borrower)
+        """
+    )
+    conn.execute('DROP TABLE balances')
+
+    # Read-only compatibility view with the old lender/borrower shape
+    conn.execute(
+        """
+        CREATE VIEW balances AS
+        SELECT pair_id AS balance_id,
+               group_id,
+               CASE WHEN amount > 0 THEN user_lo ELSE user_hi END AS lender,
+               CASE WHEN amount > 0 THEN user_hi ELSE user_lo END AS borrower,
+               ABS(amount) AS amount,
+               created_at,
+               updated_at
+        FROM balance_pairs
+        WHERE amount != 0
+        """
+    )
+    # Expression index so lender/borrower lookups through the view stay indexed
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_balance_pairs_borrower ON balance_pairs(
+            CASE WHEN amount > 0 THEN user_hi ELSE user_lo END,
+            group_id
+        )
+        """
+    )
+    # Older scripts (sqlite.py, crud.py) still write lender/borrower rows
+    conn.execute(
+        """
+        CREATE TRIGGER balances_insert INSTEAD OF INSERT ON balances
+        BEGIN
+            INSERT INTO balance_pairs (group_id, user_lo, user_hi, amount, created_at, updated_at)
+            VALUES (
+                NEW.group_id,
+                MIN(NEW.lender, NEW.borrower),
+                MAX(NEW.lender, NEW.borrower),
+                CASE WHEN NEW.lender < NEW.borrower THEN NEW.amount ELSE -NEW.amount END,
+                NEW.created_at,
+                NEW.updated_at
+            )
+            ON CONFLICT (group_id, user_lo, user_hi) DO UPDATE SET
+                amount = ROUND(amount + excluded.amount, 2),
+                updated_at = excluded.updated_at;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER balances_update INSTEAD OF UPDATE OF amount ON balances
+        BEGIN
+            UPDATE balance_pairs
+            SET amount = CASE WHEN NEW.lender < NEW.borrower THEN NEW.amount ELSE -NEW.amount END,
+                updated_at = NEW.updated_at
+            WHERE pair_id = OLD.balance_id;
+        END
+        """
+    )
+
+    # Keep user_balance_summary in step with every pair change
+    for event, old_amount in (('INSERT', '0'), ('UPDATE OF amount', 'OLD.amount')):
+        trigger_name = 'balance_pairs_summary_' + event.split()[0].lower()
+        conn.execute(
+            f"""
+            CREATE TRIGGER {trigger_name} AFTER {event} ON balance_pairs
+            BEGIN
+                INSERT INTO user_balance_summary (user_id, group_id, net, owed_by_me, owed_to_me, updated_at)
+                VALUES
+                    (NEW.user_lo, NEW.group_id,
+                     NEW.amount - {old_amount},
+                     MAX(-NEW.amount, 0) - MAX(-{old_amount}, 0),
+                     MAX(NEW.amount, 0) - MAX({old_amount}, 0),
+                     NEW.updated_at),
+                    (NEW.user_hi, NEW.group_id,
+                     {old_amount} - NEW.amount,
+                     MAX(NEW.amount, 0) - MAX({old_amount}, 0),
+                     MAX(-NEW.amount, 0) - MAX(-{old_amount}, 0),
+                     NEW.updated_at)
+                ON CONFLICT (user_id, group_id) DO UPDATE SET
+                    net = net + excluded.net,
+                    owed_by_me = owed_by_me + excluded.owed_by_me,
+                    owed_to_me = owed_to_me + excluded.owed_to_me,
+                    updated_at = excluded.updated_at;
+            END
+            """
+        )
+    rebuild_balance_summary(conn)
+
+
+def _activity_feed_indexes(conn):
+    # Activity feeds order by the displayed date (expense date, falling back
+    # to created_at) and page by keyset, so index that exact expression
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_expenses_group_activity
+        ON expenses(group_id, COALESCE(NULLIF(date, ''), created_at), expense_id)
+        """
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_payments_group_activity ON payments(group_id, paid_at, paid_by, paid_to)'
+    )
+
+
+def _ocr_jobs(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ocr_jobs (
+            job_id TEXT PRIMARY KEY NOT NULL,
+            user_id INTEGER NOT NULL,
+            attachment_id INTEGER,
+            status TEXT NOT NULL,
+            detected_total NUMERIC,
+            error TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (attachment_id) REFERENCES expense_attachments(attachment_id) ON DELETE SET NULL
+        )
+        """
+    )
+
+
+def _ocr_cache(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            content_hash TEXT PRIMARY KEY NOT NULL,
+            detected_total NUMERIC,
+            error TEXT,
+            text TEXT,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # Eviction walks entries oldest-first by age (TTL) and by last use (LRU)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_created ON ocr_cache(created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used_at)')
+
+
+def _attachment_blobs(conn):
+    # Attachments point at content-addressed blobs (see attachment_store.py);
+    # ref_count is the number of expense_attachments rows using each blob
+    conn.execute('ALTER TABLE expense_attachments ADD COLUMN content_hash TEXT')
+    conn.execute('ALTER TABLE expense_attachments ADD COLUMN size_bytes INTEGER')
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS attachment_blobs (
+            content_hash TEXT PRIMARY KEY NOT NULL,
+            file_path TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_expense_attachments_hash ON expense_attachments(content_hash)'
+    )
+    # Garbage collection looks for blobs nobody references
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_attachment_blobs_unreferenced ON attachment_blobs(ref_count) WHERE ref_count <= 0'
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER expense_attachments_blob_insert AFTER INSERT ON expense_attachments
+        WHEN NEW.content_hash IS NOT NULL
+        BEGIN
+            UPDATE attachment_blobs SET ref_count = ref_count + 1 WHERE content_hash = NEW.content_hash;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER expense_attachments_blob_delete AFTER DELETE ON expense_attachments
+        WHEN OLD.content_hash IS NOT NULL
+        BEGIN
+            UPDATE attachment_blobs SET ref_count = ref_count - 1 WHERE content_hash = OLD.content_hash;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER expense_attachments_blob_update AFTER UPDATE OF content_hash ON expense_attachments
+        WHEN OLD.content_hash IS NOT NEW.content_hash
+        BEGIN
+            UPDATE attachment_blobs SET ref_count = ref_count - 1 WHERE content_hash = OLD.content_hash;
+            UPDATE attachment_blobs SET ref_count = ref_count + 1 WHERE content_hash = NEW.content_hash;
+        END
+        """
+    )
+
+
+def _join_code_counters(conn):
+    # One row per code length: how many codes were handed out and the key
+    # of that length's permutation (see join_codes.py)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS join_code_counters (
+            length INTEGER PRIMARY KEY,
+            next_index INTEGER NOT NULL DEFAULT 0,
+            seed TEXT NOT NULL
+        )
+        """
+    )
+
+
+# Writes that change what a group's read endpoints return: (trigger name,
+# event, group id expression). The group's version is bumped by each one.
+GROUP_VERSION_TRIGGERS = [
+    ('expenses_insert', 'INSERT ON expenses', 'NEW.group_id'),
+    ('expenses_update', 'UPDATE ON expenses', 'NEW.group_id'),
+    ('expenses_delete', 'DELETE ON expenses', 'OLD.group_id'),
+    ('payments_insert', 'INSERT ON payments', 'NEW.group_id'),
+    ('payments_update', 'UPDATE ON payments', 'NEW.group_id'),
+    ('payments_delete', 'DELETE ON payments', 'OLD.group_id'),
+    ('members_insert', 'INSERT ON members', 'NEW.group_id'),
+    ('members_update', 'UPDATE ON members', 'NEW.group_id'),
+    ('balance_pairs_insert', 'INSERT ON balance_pairs', 'NEW.group_id'),
+    ('balance_pairs_update', 'UPDATE ON balance_pairs', 'NEW.group_id'),
+    ('attachments_update', 'UPDATE OF file_path, mime_type, content_hash, ocr_total ON expense_attachments',
+     '(SELECT group_id FROM expenses WHERE expense_id = NEW.expense_id)'),
+]
+
+
+def _group_versions(conn):
+    # Read endpoints derive ETags from this, so it must move on every change
+    conn.execute('ALTER TABLE groups ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+    for name, event, group_id in GROUP_VERSION_TRIGGERS:
+        conn.execute(
+            f"""
+            CREATE TRIGGER group_version_{name} AFTER {event}
+            BEGIN
+                UPDATE groups SET version = version + 1 WHERE group_id = {group_id};
+            END
+            """
+        )
+    # Group details and member names appear in every member's views
+    conn.execute(
+        """
+        CREATE TRIGGER group_version_groups_update
+        AFTER UPDATE OF group_name, group_description, join_code, deleted_at ON groups
+        BEGIN
+            UPDATE groups SET version = version + 1 WHERE group_id = NEW.group_id;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER group_version_users_update AFTER UPDATE OF username, email ON users
+        BEGIN
+            UPDATE groups SET version = version + 1
+            WHERE group_id IN (
+                SELECT group_id FROM members WHERE user_id = NEW.id AND deleted_at IS NULL
+            );
+        END
+        """
+    )
+
+
+def _change_log(conn):
+    # Delta sync log, see change_log.py
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            entity TEXT NOT NULL,
+            entity_key TEXT NOT NULL,
+            op TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (group_id) REFERENCES groups(group_id)
+        )
+        """
+    )
+    # Sync reads a group's entries after a cursor; pruning walks them by age
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_group ON change_log(group_id, change_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log(created_at)')
+
+
+# (version, description, step). Each step receives the connection and runs
+# inside the migration's transaction.
+MIGRATIONS = [
+    (1, 'expense attachments table', _attachments_table),
+    (2, 'indexes for hot endpoint queries', _hot_path_indexes),
+    (3, 'materialized per-user balance summary', _user_balance_summary),
+    (4, 'signed per-pair balance ledger', _signed_balance_pairs),
+    (5, 'activity feed keyset indexes', _activity_feed_indexes),
+    (6, 'background receipt OCR jobs', _ocr_jobs),
+    (7, 'OCR result cache', _ocr_cache),
+    (8, 'content-addressed attachment blobs', _attachment_blobs),
+    (9, 'join code allocator counters', _join_code_counters),
+    (10, 'per-group version counter', _group_versions),
+    (11, 'change log for delta sync', _change_log),
+]
+
+
+def _ensure_migrations_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY NOT NULL,
+            description TEXT,
+            applied_at TEXT
+        )
+        """
+    )
+    conn.commit()
+
+
+def applied_versions(conn):
+    """Return the set of migration versions already applied."""
+    _ensure_migrations_table(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def is_current(conn):
+    """True if the newest migration is applied (a primary-key lookup)."""
+    _ensure_migrations_table(conn)
+    latest = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()[0]
+    return latest == MIGRATIONS[-1][0]
+
+
+def migrate(conn=None):
+    """Apply pending migrations in order. Returns the versions applied."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db()
+    newly_applied = []
+    try:
+        applied = applied_versions(conn)
+        for version, description, step in MIGRATIONS:
+            if version in applied:
+                continue
+            # BEGIN IMMEDIATE takes the write lock up front so two processes
+            # starting at once cannot both apply the same version
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                already = conn.execute(
+                    'SELECT 1 FROM schema_migrations WHERE version = ?', (version,)
+                ).fetchone()
+                if already:
+                    conn.rollback()
+                    continue
+                step(conn)
+                conn.execute(
+                    'INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)',
+                    (version, description, datetime.now().isoformat())
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            newly_applied.append(version)
+    finally:
+        if own_conn:
+            conn.close()
+    return newly_applied
+
+
+def print_status(conn):
+    applied = applied_versions(conn)
+    for version, description, _ in MIGRATIONS:
+        marker = 'applied' if version in applied else 'pending'
+        print(f"{version:>4}  {marker:<8} {description}")
+
+
+if __name__ == '__main__':
+    connection = get_db()
+    try:
+        if '--status' in sys.argv:
+            print_status(connection)
+        else:
+            versions = migrate(connection)
+            if versions:
+                print(f"Applied migrations: {', '.join(str(v) for v in versions)}")
+            else:
+                print("Database is up to date.")
+    finally:
+        connection.close()
@@ -0,0 +1,115 @@
+"""
+Persistent OCR result cache keyed by the SHA-256 of the uploaded file.
+
+The same receipt is often uploaded twice (once for the amount preview and
+again as the expense attachment), so OCR results are stored in the
+ocr_cache table and reused. Entries expire after OCR_CACHE_TTL_DAYS and
+the least recently used ones are evicted once the table grows past
+OCR_CACHE_MAX_ENTRIES.
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '5000'))
+OCR_CACHE_TTL_DAYS = float(os.environ.get('OCR_CACHE_TTL_DAYS', '30'))
+
+_lock = threading.Lock()
+_metrics = {
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evictions': 0,
+}
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _expiry_cutoff():
+    return (datetime.now() - timedelta(days=OCR_CACHE_TTL_DAYS)).isoformat()
+
+
+def _count(name, amount=1):
+    with _lock:
+        _metrics[name] += amount
+
+
+def lookup(conn, content_hash):
+    """
+    Return the cached result for a hash as a dict, or None.
+    A hit refreshes the entry's LRU timestamp; the caller commits.
+    """
+    row = conn.execute(
+        'SELECT content_hash, detected_total, error, text FROM ocr_cache WHERE content_hash = ? AND created_at >= ?',
+        (content_hash, _expiry_cutoff())
+    ).fetchone()
+    if not row:
+        _count('misses')
+        return None
+    conn.execute(
+        'UPDATE ocr_cache SET last_used_at = ?, hits = hits + 1 WHERE content_hash = ?',
+        (datetime.now().isoformat(), content_hash)
+    )
+    _count('hits')
+    result = dict(row)
+    if result['detected_total'] is not None:
+        result['detected_total'] = float(result['detected_total'])
+    return result
+
+
+def store(conn, content_hash, detected_total, error, text):
+    """Cache an OCR result and evict stale entries. The caller commits."""
+    now = datetime.now().isoformat()
+    conn.execute(
+        """
+        INSERT INTO ocr_cache (content_hash, detected_total, error, text, created_at, last_used_at, hits)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+        ON CONFLICT(content_hash) DO UPDATE SET
+            detected_total = excluded.detected_total,
+            error = excluded.error,
+            text = excluded.text,
+            created_at = excluded.created_at,
+            last_used_at = excluded.last_used_at
+        """,
+        (content_hash, detected_total, error, text, now, now)
+    )
+    _count('stores')
+    evict(conn)
+
+
+def evict(conn):
+    """Drop expired entries, then the least recently used beyond the size cap."""
+    removed = conn.execute('DELETE FROM ocr_cache WHERE created_at < ?', (_expiry_cutoff(),)).rowcount
+    overflow = conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0] - OCR_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        removed += conn.execute(
+            """
+            DELETE FROM ocr_cache WHERE content_hash IN (
+                SELECT content_hash FROM ocr_cache ORDER BY last_used_at LIMIT ?
+            )
+            """,
+            (overflow,)
+        ).rowcount
+    if removed:
+        _count('evictions', removed)
+    return removed
+
+
+def stats():
+    """Hit/miss counters for /metrics."""
+    with _lock:
+        snapshot = dict(_metrics)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 3) if lookups else None
+    snapshot['max_entries'] = OCR_CACHE_MAX_ENTRIES
+    snapshot['ttl_days'] = OCR_CACHE_TTL_DAYS
+    return snapshot
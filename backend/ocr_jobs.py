@@ -0,0 +1,364 @@
+"""
+Background receipt OCR jobs.
+
+Request handlers queue a job and return immediately; OCR runs in a bounded
+pool of worker processes, each with its own easyocr model. Workers start on
+the first job, or up front via warm_up() (OCR_WARM_UP=1 at app startup). Job state lives
+in the ocr_jobs table so any app process can answer status requests, and a
+finished job fills in expense_attachments.ocr_total for its attachment.
+Files whose content hash is already in ocr_cache finish immediately
+without touching the worker pool.
+
+Jobs are micro-batched: a dispatcher thread collects jobs arriving within
+OCR_BATCH_WINDOW_MS (up to OCR_BATCH_SIZE) and hands them to a worker as
+one batch, which runs the first OCR pass through easyocr's batched
+recognition. While every worker is busy, jobs keep accumulating, so
+batches grow under load and stay small when the queue is quiet.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from uuid import uuid4
+
+import db
+import ocr_cache
+from receipt_ocr import scan_receipts, warm_up as _load_model
+
+OCR_JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', '2'))
+# Jobs waiting or running at once; beyond this new jobs are refused
+OCR_MAX_PENDING_JOBS = int(os.environ.get('OCR_MAX_PENDING_JOBS', '100'))
+# Largest batch sent to a worker, and how long to wait for it to fill
+OCR_BATCH_SIZE = int(os.environ.get('OCR_BATCH_SIZE', '8'))
+OCR_BATCH_WINDOW_MS = float(os.environ.get('OCR_BATCH_WINDOW_MS', '20'))
+
+
+class OcrQueueFull(Exception):
+    pass
+
+
+_executor = None
+_dispatcher = None
+_queue = queue.Queue()
+# One permit per worker; the dispatcher only forms a batch when a worker is free
+_free_workers = None
+_lock = threading.Lock()
+_pending = 0
+_latencies = deque(maxlen=500)  # (queue_wait_ms, run_ms, total_ms) of recent jobs
+_metrics = {
+    'submitted': 0,
+    'succeeded': 0,
+    'failed': 0,
+    'rejected': 0,
+    # Two-pass OCR: jobs answered from the footer band vs. needing the full page
+    'fast_path_hits': 0,
+    'fast_path_misses': 0,
+    'batches': 0,
+    'batched_jobs': 0,
+}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn keeps worker processes independent of the server's threads;
+        # each worker loads its own OCR model as soon as it starts
+        _executor = ProcessPoolExecutor(
+            max_workers=OCR_JOB_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_load_model
+        )
+    return _executor
+
+
+def _noop():
+    return None
+
+
+def warm_up():
+    """
+    Start every OCR worker now so their models load in the background
+    instead of on the first receipt. Returns without waiting.
+    """
+    executor = _get_executor()
+    # Workers are spawned on demand, one per submission that finds none idle
+    return [executor.submit(_noop) for _ in range(OCR_JOB_WORKERS)]
+
+
+def _run_batch(file_paths):
+    """Runs inside a worker process. Returns one result tuple per file."""
+    started = time.time()
+    try:
+        results = scan_receipts(file_paths)
+    except Exception as exc:
+        results = [(None, f'OCR failed: {exc}', None, None)] * len(file_paths)
+    finished = time.time()
+    return [result + (started, finished) for result in results]
+
+
+def _start_dispatcher():
+    global _dispatcher, _free_workers
+    with _lock:
+        if _dispatcher is None:
+            _free_workers = threading.Semaphore(OCR_JOB_WORKERS)
+            _dispatcher = threading.Thread(target=_dispatch, name='ocr-dispatcher', daemon=True)
+            _dispatcher.start()
+
+
+def _dispatch():
+    """Collect queued jobs into batches and send each batch to a worker."""
+    while True:
+        _free_workers.acquire()
+        job = _queue.get()
+        if job is None:
+            return
+        batch = [job]
+        deadline = time.monotonic() + OCR_BATCH_WINDOW_MS / 1000.0
+        stop = False
+        while len(batch) < OCR_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            try:
+                job = _queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                stop = True
+                break
+            batch.append(job)
+        _submit_batch(batch)
+        if stop:
+            return
+
+
+def _submit_batch(batch):
+    with _lock:
+        _metrics['batches'] += 1
+        _metrics['batched_jobs'] += len(batch)
+    try:
+        future = _get_executor().submit(_run_batch, [job['file_path'] for job in batch])
+    except Exception:
+        _free_workers.release()
+        for job in batch:
+            _finish_job(job, None)
+        return
+    future.add_done_callback(partial(_finish_batch, batch))
+
+
+def _finish_batch(batch, future):
+    """Fan a worker's batch result back out to its jobs."""
+    _free_workers.release()
+    try:
+        results = future.result()
+    except Exception as exc:
+        now = time.time()
+        results = [(None, f'OCR failed: {exc}', None, None, now, now)] * len(batch)
+    for job, result in zip(batch, results):
+        _finish_job(job, result)
+
+
+def submit_job(user_id, file_path, attachment_id=None, cleanup=False, content_hash=None):
+    """
+    Queue OCR for a file and return the new job id.
+    If the file's content is already cached the job is finished before
+    this returns. If cleanup is set the file is deleted once the job finishes.
+    Pass content_hash when the caller already hashed the file.
+    """
+    global _pending
+    job_id = uuid4().hex
+    submitted_at = time.time()
+    if content_hash is None:
+        try:
+            content_hash = ocr_cache.hash_file(file_path)
+        except OSError:
+            content_hash = None
+
+    if content_hash is not None:
+        conn = db.get_pool().acquire()
+        try:
+            cached = ocr_cache.lookup(conn, content_hash)
+            if cached is not None:
+                _insert_job(conn, job_id, user_id, attachment_id)
+                _record_result(
+                    conn, job_id, attachment_id,
+                    cached['detected_total'], cached['error'], submitted_at, time.time()
+                )
+                conn.commit()
+        finally:
+            conn.close()
+        if cached is not None:
+            if cleanup and os.path.exists(file_path):
+                os.remove(file_path)
+            with _lock:
+                _metrics['submitted'] += 1
+                _metrics['failed' if cached['error'] else 'succeeded'] += 1
+            return job_id
+
+    with _lock:
+        if _pending >= OCR_MAX_PENDING_JOBS:
+            _metrics['rejected'] += 1
+            raise OcrQueueFull('Too many receipts are being scanned right now. Please try again shortly.')
+        _pending += 1
+        _metrics['submitted'] += 1
+
+    conn = db.get_pool().acquire()
+    try:
+        _insert_job(conn, job_id, user_id, attachment_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+    _start_dispatcher()
+    _queue.put({
+        'job_id': job_id,
+        'attachment_id': attachment_id,
+        'file_path': file_path,
+        'cleanup': cleanup,
+        'submitted_at': submitted_at,
+        'content_hash': content_hash,
+    })
+    return job_id
+
+
+def _insert_job(conn, job_id, user_id, attachment_id):
+    conn.execute(
+        'INSERT INTO ocr_jobs (job_id, user_id, attachment_id, status, created_at) VALUES (?, ?, ?, ?, ?)',
+        (job_id, user_id, attachment_id, 'queued', datetime.now().isoformat())
+    )
+
+
+def _record_result(conn, job_id, attachment_id, amount, error, started, finished):
+    if amount is None and not error:
+        error = 'Unable to detect a total'
+    status = 'failed' if error else 'succeeded'
+    conn.execute(
+        'UPDATE ocr_jobs SET status = ?, detected_total = ?, error = ?, started_at = ?, finished_at = ? WHERE job_id = ?',
+        (
+            status,
+            amount,
+            error,
+            datetime.fromtimestamp(started).isoformat(),
+            datetime.fromtimestamp(finished).isoformat(),
+            job_id
+        )
+    )
+    if attachment_id is not None and amount is not None:
+        # Never overwrite a total the user confirmed themselves
+        conn.execute(
+            'UPDATE expense_attachments SET ocr_total = ? WHERE attachment_id = ? AND ocr_total IS NULL',
+            (amount, attachment_id)
+        )
+    return status
+
+
+def _finish_job(job, result):
+    """
+    Record a job's result. result is (amount, error, text, fast_path,
+    started, finished), or None if the job never reached a worker.
+    """
+    global _pending
+    if result is None:
+        now = time.time()
+        result = (None, 'OCR workers are unavailable', None, None, now, now)
+    amount, error, text, fast_path, started, finished = result
+    job_id = job['job_id']
+    attachment_id = job['attachment_id']
+    file_path = job['file_path']
+    content_hash = job['content_hash']
+    submitted_at = job['submitted_at']
+
+    conn = db.get_pool().acquire()
+    try:
+        status = _record_result(conn, job_id, attachment_id, amount, error, started, finished)
+        # Only cache results where OCR actually ran; "OCR unavailable" and
+        # crashes should be retried next time
+        if content_hash is not None and text is not None:
+            ocr_cache.store(conn, content_hash, amount, error, text)
+        conn.commit()
+    finally:
+        conn.close()
+
+    if job['cleanup'] and file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+    with _lock:
+        _pending -= 1
+        _metrics[status] += 1
+        if fast_path is not None:
+            _metrics['fast_path_hits' if fast_path else 'fast_path_misses'] += 1
+        _latencies.append((
+            (started - submitted_at) * 1000,
+            (finished - started) * 1000,
+            (finished - submitted_at) * 1000
+        ))
+
+
+def get_job(job_id, user_id):
+    """Return a job owned by user_id as a dict, or None."""
+    conn = db.get_db()
+    row = conn.execute(
+        'SELECT job_id, attachment_id, status, detected_total, error, created_at, started_at, finished_at '
+        'FROM ocr_jobs WHERE job_id = ? AND user_id = ?',
+        (job_id, user_id)
+    ).fetchone()
+    conn.close()
+    if not row:
+        return None
+    job = dict(row)
+    if job['detected_total'] is not None:
+        job['detected_total'] = float(job['detected_total'])
+    return job
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def stats():
+    """Queue depth and per-job latency (over recent jobs) for /metrics."""
+    with _lock:
+        snapshot = dict(_metrics)
+        snapshot['pending'] = _pending
+        snapshot['workers'] = OCR_JOB_WORKERS
+        latencies = list(_latencies)
+    two_pass_jobs = snapshot['fast_path_hits'] + snapshot['fast_path_misses']
+    snapshot['fast_path_hit_rate'] = (
+        round(snapshot['fast_path_hits'] / two_pass_jobs, 3) if two_pass_jobs else None
+    )
+    snapshot['batch_size'] = OCR_BATCH_SIZE
+    snapshot['batch_window_ms'] = OCR_BATCH_WINDOW_MS
+    snapshot['mean_batch_size'] = (
+        round(snapshot['batched_jobs'] / snapshot['batches'], 2) if snapshot['batches'] else None
+    )
+    for label, index in (('queue_wait_ms', 0), ('run_ms', 1), ('total_ms', 2)):
+        values = [entry[index] for entry in latencies]
+        snapshot[label] = {
+            'p50': _percentile(values, 50),
+            'p95': _percentile(values, 95),
+            'p99': _percentile(values, 99),
+            'max': round(max(values), 1) if values else None,
+        }
+    return snapshot
+
+
+def shutdown(wait=True):
+    """Stop the dispatcher and worker pool (tests and clean shutdown)."""
+    global _executor, _dispatcher
+    if _dispatcher is not None:
+        # Jobs already queued ahead of the sentinel are still dispatched
+        _queue.put(None)
+        if wait:
+            _dispatcher.join()
+        _dispatcher = None
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -0,0 +1,179 @@
+"""
+Password hashing off the request threads.
+
+bcrypt is deliberately slow (about 250 ms at cost 12), so hashing and
+checking run in a small pool of worker processes instead of the request
+worker. At most PASSWORD_MAX_PENDING operations are queued or running; a
+request that cannot get a slot within PASSWORD_QUEUE_TIMEOUT seconds gets
+PasswordBusy (503) rather than piling up behind a burst of logins.
+
+The cost factor is BCRYPT_ROUNDS. Hashes made at another cost are
+upgraded after a successful login (see rehash_in_background), so changing
+it takes effect as users sign in. PASSWORD_WORKERS=0 runs bcrypt inline.
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+import db
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_MAX_PENDING = int(os.environ.get('PASSWORD_MAX_PENDING', str(PASSWORD_WORKERS * 4 or 4)))
+PASSWORD_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_QUEUE_TIMEOUT', '5'))
+# $2b$12$... : the cost sits between the second and third $
+COST_RE = re.compile(r'^\$2[aby]?\$(\d{2})\$')
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+_latencies = deque(maxlen=500)  # (queue_wait_ms, total_ms) of recent operations
+_metrics = {'hashed': 0, 'checked': 0, 'rehashed': 0, 'rejected': 0}
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def _replace(new_password, current_hash, rounds):
+    """Hash new_password unless it matches current_hash (None then). One trip to the pool."""
+    if _check(new_password, current_hash):
+        return None
+    return _hash(new_password, rounds)
+
+
+def _timed(func, *args):
+    """Runs in the worker; reports when the work actually started."""
+    started = time.time()
+    return func(*args), started
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            # spawn keeps workers independent of the server's threads and locks
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _slots = threading.BoundedSemaphore(PASSWORD_MAX_PENDING)
+        return _executor, _slots
+
+
+def _run(metric, func, *args):
+    """Run func(*args) in the pool and wait for the result."""
+    submitted = time.time()
+    if PASSWORD_WORKERS <= 0:
+        result = func(*args)
+        finished = time.time()
+        _record(metric, submitted, submitted, finished)
+        return result
+
+    executor, slots = _get_executor()
+    if not slots.acquire(timeout=PASSWORD_QUEUE_TIMEOUT):
+        with _lock:
+            _metrics['rejected'] += 1
+        raise PasswordBusy('Too many sign-ins in progress. Please try again shortly.')
+    try:
+        result, started = executor.submit(_timed, func, *args).result()
+    finally:
+        slots.release()
+    _record(metric, submitted, started, time.time())
+    return result
+
+
+def _record(metric, submitted, started, finished):
+    with _lock:
+        _metrics[metric] += 1
+        _latencies.append(((started - submitted) * 1000, (finished - submitted) * 1000))
+
+
+def hash_password(password):
+    """bcrypt hash of password at the configured cost."""
+    return _run('hashed', _hash, password, BCRYPT_ROUNDS)
+
+
+def verify_password(password, hashed):
+    """Check a password against its hash."""
+    return _run('checked', _check, password, hashed)
+
+
+def replace_password(new_password, current_hash):
+    """New hash for new_password, or None if it is the current password."""
+    return _run('hashed', _replace, new_password, current_hash, BCRYPT_ROUNDS)
+
+
+def needs_rehash(hashed):
+    match = COST_RE.match(hashed or '')
+    return match is None or int(match.group(1)) != BCRYPT_ROUNDS
+
+
+def rehash_in_background(user_id, password, old_hash):
+    """
+    After a successful login, re-hash at the configured cost without making
+    the user wait. The row is only updated if the hash did not change meanwhile.
+    """
+    def work():
+        try:
+            new_hash = _run('rehashed', _hash, password, BCRYPT_ROUNDS)
+        except PasswordBusy:
+            return  # try again on a later login
+        conn = db.get_pool().acquire()
+        try:
+            conn.execute(
+                'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                (new_hash, user_id, old_hash)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=work, name='password-rehash', daemon=True)
+    thread.start()
+    return thread
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def stats():
+    """Operation counts and latency (over recent operations) for /metrics."""
+    with _lock:
+        snapshot = dict(_metrics)
+        latencies = list(_latencies)
+    snapshot.update({'workers': PASSWORD_WORKERS, 'max_pending': PASSWORD_MAX_PENDING, 'rounds': BCRYPT_ROUNDS})
+    for label, index in (('queue_wait_ms', 0), ('total_ms', 1)):
+        values = [entry[index] for entry in latencies]
+        snapshot[label] = {'p50': _percentile(values, 50), 'p99': _percentile(values, 99)}
+    return snapshot
+
+
+def shutdown(wait=True):
+    """Stop the worker pool (tests and clean shutdown)."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
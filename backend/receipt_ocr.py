@@ -0,0 +1,512 @@
+"""
+Receipt OCR for Centsible.
+
+Runs easyocr over an uploaded receipt image or PDF and looks for the final
+total next to keywords such as "Total" or "Balance Due". Kept separate from
+app.py so OCR worker processes can import it without the Flask app.
+"""
+
+import importlib.util
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+except ImportError:
+    convert_from_path = None
+    pdfinfo_from_path = None
+
+# easyocr (and torch behind it) is slow to import and the reader downloads
+# its model on first use, so both are deferred until a receipt is scanned
+# or warm_up() is called.
+_reader = None
+_reader_error = None
+_reader_lock = threading.Lock()
+
+# Preprocessing applied before OCR. Phone photos are far larger than easyocr
+# needs; capping the long edge keeps detection fast and memory bounded.
+OCR_PREPROCESS = os.environ.get('OCR_PREPROCESS', 'true').lower() in ('1', 'true')
+OCR_MAX_EDGE = int(os.environ.get('OCR_MAX_EDGE', '1600'))
+# Percent of darkest/lightest pixels clipped by autocontrast (0 disables it)
+OCR_CONTRAST_CUTOFF = float(os.environ.get('OCR_CONTRAST_CUTOFF', '1'))
+EXIF_ORIENTATION = 0x0112
+# Two-pass OCR: recognize the bottom OCR_FOOTER_FRACTION of the page first
+# and fall back to the whole page only when no total is found there
+OCR_TWO_PASS = os.environ.get('OCR_TWO_PASS', 'true').lower() in ('1', 'true')
+OCR_FOOTER_FRACTION = float(os.environ.get('OCR_FOOTER_FRACTION', '0.4'))
+# PDF pages are rendered at this DPI (pdf2image defaults to 200) and at most
+# OCR_PDF_MAX_PAGES pages are read, starting from the last one
+OCR_PDF_DPI = int(os.environ.get('OCR_PDF_DPI', '150'))
+OCR_PDF_MAX_PAGES = int(os.environ.get('OCR_PDF_MAX_PAGES', '10'))
+
+RECEIPT_KEYWORDS = [
+    'total amount',
+    'grand total',
+    'balance due',
+    'amount due',
+    'net total',
+    'final amount',
+    'payable amount',
+    'total'
+]
+# Words to exclude - these are intermediate totals, not final totals
+EXCLUDE_KEYWORDS = [
+    'subtotal',
+    'sub-total',
+    'sub total'
+]
+
+
+def ocr_available():
+    """True when easyocr is installed and its reader has not failed to load."""
+    if _reader_error is not None:
+        return False
+    return _reader is not None or importlib.util.find_spec('easyocr') is not None
+
+
+def get_reader():
+    """
+    Return the shared easyocr reader, creating it on first call.
+    Returns None if easyocr is missing or the model could not be loaded.
+    """
+    global _reader, _reader_error
+    if _reader is not None or _reader_error is not None:
+        return _reader
+    with _reader_lock:
+        if _reader is None and _reader_error is None:
+            try:
+                import easyocr
+                _reader = easyocr.Reader(['en'])
+            except ImportError:
+                _reader_error = 'OCR is unavailable (easyocr not installed)'
+            except Exception as exc:
+                _reader_error = f'OCR model failed to load: {exc}'
+    return _reader
+
+
+def warm_up(background=False):
+    """
+    Load the OCR model ahead of the first scan.
+    With background=True the load runs on a daemon thread and the thread is returned.
+    """
+    if background:
+        thread = threading.Thread(target=get_reader, name='ocr-warm-up', daemon=True)
+        thread.start()
+        return thread
+    return get_reader() is not None
+
+
+def _keyword_pattern(words):
+    # Longest first so overlapping keywords resolve to the most specific one
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+# Built once at import: a single alternation that finds exclusions and
+# keywords in one scan of a line. Exclusions come first so "subtotal" is
+# never read as "total".
+TOTAL_LINE_RE = re.compile(
+    f'(?P<exclude>{_keyword_pattern(EXCLUDE_KEYWORDS)})|(?P<keyword>{_keyword_pattern(RECEIPT_KEYWORDS)})',
+    re.IGNORECASE
+)
+# Every keyword and exclusion contains one of these words, so a line without
+# any of them can be skipped without running the regex
+_last_words = {phrase.split()[-1] for phrase in RECEIPT_KEYWORDS + EXCLUDE_KEYWORDS}
+KEYWORD_ANCHORS = sorted(
+    word for word in _last_words if not any(other != word and other in word for other in _last_words)
+)
+# Thousands separators are matched in place and stripped from the match only
+AMOUNT_RE = re.compile(r'-?\d[\d,]*(?:\.\d{1,2})?')
+
+
+def extract_amount_from_line(line):
+    """Extract decimal amount from a string."""
+    if not line:
+        return None
+    for match in AMOUNT_RE.finditer(line):
+        value = float(match.group().replace(',', ''))
+        if value >= 0:
+            return round(value, 2)
+    return None
+
+
+def _line_bounds(text, start):
+    end = text.find('\n', start)
+    return start, len(text) if end == -1 else end
+
+
+def _amount_near(text, line_start):
+    """Amount on the line starting at line_start, else on the next non-blank line."""
+    start, end = _line_bounds(text, line_start)
+    amount = extract_amount_from_line(text[start:end])
+    if amount is not None:
+        return amount
+    while end < len(text):
+        start, end = _line_bounds(text, end + 1)
+        line = text[start:end]
+        if line.strip():
+            return extract_amount_from_line(line)
+    return None
+
+
+def _candidate_line_starts(text):
+    """
+    Start offsets of lines that may hold a keyword, found with plain
+    substring searches for KEYWORD_ANCHORS over the lowercased text.
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few non-ASCII characters change length when lowercased, which
+        # would shift offsets; check every line instead
+        starts = [0]
+        position = text.find('\n')
+        while position != -1:
+            starts.append(position + 1)
+            position = text.find('\n', position + 1)
+        return starts
+    starts = set()
+    for anchor in KEYWORD_ANCHORS:
+        position = lowered.find(anchor)
+        while position != -1:
+            starts.add(text.rfind('\n', 0, position) + 1)
+            position = lowered.find(anchor, position + len(anchor))
+    return sorted(starts)
+
+
+def find_total_amount_in_text(text):
+    """
+    Search multiline text for keywords and return the amount next to them.
+    Candidate lines are located with fast substring searches, then each is
+    classified with a single pass of TOTAL_LINE_RE.
+    """
+    if not text:
+        return None
+    for line_start in _candidate_line_starts(text):
+        start, end = _line_bounds(text, line_start)
+        line = text[start:end]
+        kinds = {match.lastgroup for match in TOTAL_LINE_RE.finditer(line)}
+        # Skip lines that contain excluded keywords (like subtotal)
+        if 'keyword' not in kinds or 'exclude' in kinds:
+            continue
+        amount = _amount_near(text, line_start)
+        if amount is not None:
+            return amount
+    return None
+
+
+def group_rows(results):
+    """
+    Turn easyocr results [(bbox, text, confidence), ...] into text lines by
+    visual row. Boxes whose vertical centres are within half a box height
+    of each other are joined left to right, so "TOTAL" and "$27.50" printed
+    on the same row end up on the same line even though easyocr returns
+    them as separate boxes.
+    """
+    boxes = []
+    for bbox, text, _ in results:
+        ys = [point[1] for point in bbox]
+        xs = [point[0] for point in bbox]
+        boxes.append(((min(ys) + max(ys)) / 2.0, max(ys) - min(ys), min(xs), text))
+    boxes.sort(key=lambda box: box[0])
+
+    rows = []
+    for box in boxes:
+        row = rows[-1] if rows else None
+        if row is not None and abs(box[0] - row['center']) <= max(box[1], row['height']) / 2.0:
+            row['boxes'].append(box)
+            row['center'] = sum(b[0] for b in row['boxes']) / len(row['boxes'])
+            row['height'] = max(row['height'], box[1])
+        else:
+            rows.append({'center': box[0], 'height': box[1], 'boxes': [box]})
+    return '\n'.join(
+        ' '.join(box[3] for box in sorted(row['boxes'], key=lambda b: b[2]))
+        for row in rows
+    )
+
+
+def preprocess_image(image, max_edge=None, contrast_cutoff=None):
+    """
+    Prepare an image for OCR: apply the EXIF orientation, convert to
+    grayscale, shrink so the long edge is at most max_edge and stretch the
+    contrast. Returns a new image; the input is left untouched.
+    """
+    max_edge = OCR_MAX_EDGE if max_edge is None else max_edge
+    contrast_cutoff = OCR_CONTRAST_CUTOFF if contrast_cutoff is None else contrast_cutoff
+
+    # exif_transpose always copies, so only call it when there is a rotation
+    if image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+    # Palette/transparent images are flattened onto white before going gray
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA') and image.getchannel('A').getextrema()[0] < 255:
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert('RGBA'))
+    # Single-channel images resize about three times faster than RGB
+    image = image.convert('L')
+    if max_edge and max(image.size) > max_edge:
+        scale = max_edge / max(image.size)
+        size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+        # reducing_gap=1 box-reduces by a whole factor before the Lanczos pass
+        image = image.resize(size, Image.LANCZOS, reducing_gap=1.0)
+    if contrast_cutoff:
+        image = ImageOps.autocontrast(image, cutoff=contrast_cutoff)
+    return image
+
+
+def _prepare(image):
+    return preprocess_image(image) if OCR_PREPROCESS else image
+
+
+def _image_for_ocr(image):
+    """Convert a PIL image into the numpy array passed to easyocr."""
+    import numpy as np
+    return np.array(_prepare(image))
+
+
+def _open_for_ocr(file_path):
+    """Open an image file, letting JPEG decode at reduced size when possible."""
+    img = Image.open(file_path)
+    if OCR_PREPROCESS and OCR_MAX_EDGE and img.format == 'JPEG':
+        # Decoding at 1/2, 1/4 or 1/8 scale is much cheaper than a full decode;
+        # draft never goes below the requested size
+        img.draft('RGB', (OCR_MAX_EDGE, OCR_MAX_EDGE))
+    return img
+
+
+def _pdf_page_count(file_path):
+    return int(pdfinfo_from_path(file_path)['Pages'])
+
+
+def _pdf_text_layer(file_path):
+    """
+    Text embedded in the PDF, one string per page, or None when there is
+    no text layer (or poppler's pdftotext is not installed).
+    """
+    if shutil.which('pdftotext') is None:
+        return None
+    result = subprocess.run(
+        ['pdftotext', '-layout', '-q', file_path, '-'],
+        capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    # pdftotext separates pages with form feeds
+    return result.stdout.split('\f')
+
+
+def _render_pdf_page(file_path, page_number):
+    images = convert_from_path(
+        file_path, dpi=OCR_PDF_DPI, fmt='png', grayscale=True,
+        first_page=page_number, last_page=page_number
+    )
+    return _prepare(images[0]) if images else None
+
+
+def _pdf_pages_last_first(file_path):
+    """
+    Yield rendered PDF pages from the last page backwards.
+    The next page renders on a helper thread while the caller runs OCR on
+    the current one, so at most two pages are held in memory.
+    """
+    page_numbers = list(range(_pdf_page_count(file_path), 0, -1))[:OCR_PDF_MAX_PAGES]
+    if not page_numbers:
+        return
+    with ThreadPoolExecutor(max_workers=1) as renderer:
+        upcoming = renderer.submit(_render_pdf_page, file_path, page_numbers[0])
+        for index in range(len(page_numbers)):
+            page = upcoming.result()
+            if index + 1 < len(page_numbers):
+                upcoming = renderer.submit(_render_pdf_page, file_path, page_numbers[index + 1])
+            if page is not None:
+                yield page
+
+
+def _load_image(file_path):
+    """An image receipt ready for OCR, loaded so it outlives the open file."""
+    with _open_for_ocr(file_path) as img:
+        page = _prepare(img)
+        # Without preprocessing _prepare hands back img, which closes below
+        return page.copy() if page is img else page
+
+
+def _load_pages(file_path):
+    """Yield the receipt's pages as images ready for OCR."""
+    if file_path.lower().endswith('.pdf'):
+        yield from _pdf_pages_last_first(file_path)
+        return
+    yield _load_image(file_path)
+
+
+def footer_region(image, fraction=None):
+    """Bottom part of the page, where receipt totals almost always are."""
+    fraction = OCR_FOOTER_FRACTION if fraction is None else fraction
+    width, height = image.size
+    return image.crop((0, int(height * (1 - fraction)), width, height))
+
+
+def _recognize(reader, image):
+    import numpy as np
+    # easyOCR returns [(bbox, text, confidence), ...]
+    return group_rows(reader.readtext(np.array(image)))
+
+
+def _recognize_batch(reader, images):
+    """
+    Recognize several images with one batched easyocr call. easyocr needs
+    equally sized inputs, so each image is padded with white to the
+    largest width and height rather than stretched.
+    """
+    import numpy as np
+    if len(images) == 1:
+        return [_recognize(reader, images[0])]
+    width = max(image.size[0] for image in images)
+    height = max(image.size[1] for image in images)
+    arrays = []
+    for image in images:
+        canvas = Image.new('L', (width, height), 255)
+        canvas.paste(image.convert('L'), (0, 0))
+        arrays.append(np.array(canvas))
+    batch_results = reader.readtext_batched(arrays)
+    return [group_rows(results) for results in batch_results]
+
+
+def run_receipt_ocr(file_path):
+    """Run OCR against a receipt file and try to detect the total amount."""
+    amount, error, _, _ = scan_receipt(file_path)
+    return amount, error
+
+
+def _scan_page(reader, page, two_pass):
+    """OCR one page. Returns (amount, text, answered_from_footer)."""
+    if two_pass:
+        footer_text = _recognize(reader, footer_region(page))
+        amount = find_total_amount_in_text(footer_text)
+        if amount is not None:
+            return amount, footer_text, True
+    text = _recognize(reader, page)
+    return find_total_amount_in_text(text), text, False
+
+
+def scan_receipt(file_path, two_pass=None, reader=None):
+    """
+    Run OCR against a receipt file and look for the total.
+    Returns (amount, error, text, fast_path). text is None when OCR could
+    not run. With two-pass OCR the footer band is recognized first and the
+    full page only if no total was found there; fast_path says which pass
+    answered (None when two-pass was off or OCR was skipped).
+
+    PDFs with a text layer are read without OCR when it contains a total.
+    Otherwise pages are OCR'd from the last one backwards, stopping at the
+    first page with a total.
+    """
+    two_pass = OCR_TWO_PASS if two_pass is None else two_pass
+    is_pdf = file_path.lower().endswith('.pdf')
+    if is_pdf:
+        if convert_from_path is None:
+            return None, 'PDF OCR requires pdf2image; please install it.', None, None
+        try:
+            page_texts = _pdf_text_layer(file_path)
+        except (OSError, subprocess.SubprocessError):
+            page_texts = None
+        if page_texts is not None:
+            for page_text in reversed(page_texts):
+                amount = find_total_amount_in_text(page_text)
+                if amount is not None:
+                    return amount, None, page_text, None
+            # The text layer may leave out the total (e.g. a scanned page
+            # with a typed header), so OCR the rendered pages as well
+
+    reader = reader or get_reader()
+    if reader is None:
+        return None, _reader_error, None, None
+
+    fast_path = None
+    texts = []
+    try:
+        for page in _load_pages(file_path):
+            amount, text, from_footer = _scan_page(reader, page, two_pass)
+            if two_pass and fast_path is None:
+                fast_path = from_footer
+            texts.append(text)
+            if amount is not None:
+                return amount, None, text, fast_path
+    except Exception as exc:
+        return None, f'OCR failed: {exc}', None, fast_path
+
+    return None, 'Could not find a recognizable total on the receipt.', '\n'.join(reversed(texts)), fast_path
+
+
+def scan_receipts(file_paths, two_pass=None, reader=None):
+    """
+    scan_receipt for several files at once. The first pass (footer band,
+    or whole page without two-pass) of every image goes through one
+    batched recognition call; the full-page fallback runs per receipt.
+    PDFs are scanned one by one. Returns one result tuple per file, in order.
+    """
+    two_pass = OCR_TWO_PASS if two_pass is None else two_pass
+    results = [None] * len(file_paths)
+    loaded = []
+    regions = []
+    for index, file_path in enumerate(file_paths):
+        if file_path.lower().endswith('.pdf') or len(file_paths) == 1:
+            results[index] = scan_receipt(file_path, two_pass=two_pass, reader=reader)
+            continue
+        reader = reader or get_reader()
+        if reader is None:
+            results[index] = (None, _reader_error, None, None)
+            continue
+        try:
+            page = _load_image(file_path)
+            region = footer_region(page) if two_pass else page
+        except Exception as exc:
+            results[index] = (None, f'OCR failed: {exc}', None, None)
+            continue
+        loaded.append((index, page))
+        regions.append(region)
+    if not loaded:
+        return results
+
+    try:
+        first_pass = _recognize_batch(reader, regions)
+    except Exception:
+        # Fall back to scanning the receipts one at a time
+        for index, _ in loaded:
+            results[index] = scan_receipt(file_paths[index], two_pass=two_pass, reader=reader)
+        return results
+
+    for (index, page), text in zip(loaded, first_pass):
+        amount = find_total_amount_in_text(text)
+        if amount is not None:
+            results[index] = (amount, None, text, True if two_pass else None)
+            continue
+        if two_pass:
+            try:
+                amount, text, _ = _scan_page(reader, page, False)
+            except Exception as exc:
+                results[index] = (None, f'OCR failed: {exc}', None, False)
+                continue
+        if amount is None:
+            results[index] = (None, 'Could not find a recognizable total on the receipt.', text, False if two_pass else None)
+        else:
+            results[index] = (amount, None, text, False)
+    return results
+
+if __name__ == '__main__':
+    # python3 receipt_ocr.py --warm-up   downloads/loads the model ahead of time
+    if '--warm-up' in sys.argv:
+        started = time.perf_counter()
+        if warm_up():
+            print(f"OCR model loaded in {time.perf_counter() - started:.1f}s")
+        else:
+            print(_reader_error)
+            sys.exit(1)
+    else:
+        print('Usage: python3 receipt_ocr.py --warm-up')
@@ -96,4 +96,5 @@ CREATE TABLE IF NOT EXISTS expense_attachments (
     ocr_total NUMERIC,
     created_at TEXT,
     FOREIGN KEY (expense_id) REFERENCES expenses(expense_id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+-- Indexes and later schema changes are applied by migrations.py
@@ -0,0 +1,100 @@
+import unittest
+
+from testing import AppTestCase
+
+
+class ActivityPaginationTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.signup(name) for name in ('a', 'b')]
+        group = self.client.post('/api/groups', json={'group_name': 'Flat'}, headers=self.users[0][0]).get_json()
+        self.group_id = group['group_id']
+        self.client.post('/api/groups/join', json={'join_code': group['join_code']}, headers=self.users[1][0])
+
+        (a_headers, a_id), (b_headers, b_id) = self.users
+        for i in range(7):
+            # Several expenses share a date to exercise the tie-breaker
+            self.client.post('/api/expenses', headers=a_headers, json={
+                'amount': 10, 'description': f'expense {i}', 'group_id': self.group_id, 'paid_by': a_id,
+                'split_method': 'equal', 'participants': [a_id, b_id],
+                'split_details': {str(a_id): 5, str(b_id): 5}, 'date': f'2024-01-0{1 + i // 3}'
+            })
+        for i in range(3):
+            self.client.post('/api/payments', headers=b_headers, json={
+                'amount': 1, 'paid_by': b_id, 'paid_to': a_id, 'group_id': self.group_id, 'description': 'cash'
+            })
+
+    def _get(self, query=''):
+        response = self.client.get(f'/api/activity{query}', headers=self.users[1][0])
+        return response.status_code, response.get_json()
+
+    def test_pages_cover_full_history_in_order(self):
+        status, full = self._get('?limit=100')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(full['activities']), 10)
+        self.assertIsNone(full['next_cursor'])
+        dates = [a['date'] for a in full['activities']]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+        seen = []
+        cursor = None
+        while True:
+            query = '?limit=3' + (f'&cursor={cursor}' if cursor else '')
+            status, page = self._get(query)
+            self.assertEqual(status, 200)
+            self.assertLessEqual(len(page['activities']), 3)
+            seen.extend(a['id'] for a in page['activities'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [a['id'] for a in full['activities']])
+
+    def test_page_includes_splits(self):
+        status, page = self._get('?limit=100')
+        expense = next(a for a in page['activities'] if a['type'] == 'expense')
+        self.assertEqual(len(expense['splits']), 2)
+
+    def test_limit_is_bounded(self):
+        status, page = self._get('?limit=1')
+        self.assertEqual(len(page['activities']), 1)
+        self.assertIsNotNone(page['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        status, body = self._get('?cursor=not-a-cursor')
+        self.assertEqual(status, 400)
+
+    def _get_group(self, query=''):
+        response = self.client.get(f'/api/groups/{self.group_id}/activity{query}', headers=self.users[0][0])
+        return response.status_code, response.get_json()
+
+    def test_group_activity_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            status, page = self._get_group('?limit=4' + (f'&cursor={cursor}' if cursor else ''))
+            self.assertEqual(status, 200)
+            seen.extend(a['id'] for a in page['activities'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+
+    def test_group_activity_type_filter(self):
+        status, page = self._get_group('?type=payment')
+        self.assertEqual(status, 200)
+        self.assertEqual({a['type'] for a in page['activities']}, {'payment'})
+        self.assertEqual(len(page['activities']), 3)
+
+    def test_group_activity_date_range_is_inclusive(self):
+        status, page = self._get_group('?type=expense&from=2024-01-02&to=2024-01-03')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(a['date'] for a in page['activities']), ['2024-01-02'] * 3 + ['2024-01-03'])
+
+    def test_group_activity_rejects_bad_filters(self):
+        self.assertEqual(self._get_group('?type=refund')[0], 400)
+        self.assertEqual(self._get_group('?from=yesterday')[0], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
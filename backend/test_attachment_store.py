@@ -0,0 +1,281 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import attachment_store
+import db
+import thumbnails
+from testing import AppTestCase
+
+import app as centsible
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'
+
+
+class AttachmentStoreTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload_root = tempfile.mkdtemp()
+        for module in (attachment_store, centsible):
+            patcher = mock.patch.object(module, 'UPLOAD_ROOT', self.upload_root)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(thumbnails.shutdown)
+
+        self.headers, self.user_id = self.signup('a')
+        group = self.client.post('/api/groups', json={'group_name': 'Flat'}, headers=self.headers).get_json()
+        self.group_id = group['group_id']
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_root, ignore_errors=True)
+
+    def _post_expense(self, content, filename):
+        return self.client.post('/api/expenses', headers=self.headers, data={
+            'amount': '10', 'description': 'x', 'group_id': str(self.group_id),
+            'paid_by': str(self.user_id), 'split_method': 'equal',
+            'participants': json.dumps([self.user_id]),
+            'split_details': json.dumps({str(self.user_id): 10}),
+            'attachment': (io.BytesIO(content), filename),
+        }, content_type='multipart/form-data')
+
+    def _expense_with_attachment(self, content, filename='receipt.png'):
+        response = self._post_expense(content, filename)
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()
+
+    def _blob_files(self):
+        found = []
+        for directory, _, files in os.walk(os.path.join(self.upload_root, 'blobs')):
+            found.extend(os.path.join(directory, name) for name in files)
+        return found
+
+    def test_identical_uploads_share_one_blob(self):
+        content = PNG_HEADER + b'same receipt bytes' * 100
+        first = self._expense_with_attachment(content)
+        second = self._expense_with_attachment(content, filename='copy.PNG')
+        self.assertEqual(len(self._blob_files()), 1)
+        self.assertEqual(first['attachment']['url'], second['attachment']['url'])
+
+        conn = db.get_pool().acquire()
+        self.assertEqual(conn.execute('SELECT ref_count FROM attachment_blobs').fetchone()[0], 2)
+        report = attachment_store.storage_report(conn)
+        conn.close()
+        self.assertEqual(report['stored_bytes'], len(content))
+        self.assertEqual(report['bytes_saved'], len(content))
+
+    def test_gc_removes_unreferenced_blobs(self):
+        self._expense_with_attachment(PNG_HEADER + b'kept')
+        self._expense_with_attachment(PNG_HEADER + b'dropped')
+        conn = db.get_pool().acquire()
+        conn.execute(
+            'DELETE FROM expense_attachments WHERE content_hash = ?',
+            (attachment_store.hashlib.sha256(PNG_HEADER + b'dropped').hexdigest(),)
+        )
+        conn.commit()
+        with mock.patch.object(attachment_store, 'GC_GRACE_SECONDS', -1):
+            summary = attachment_store.collect_garbage(conn)
+        remaining = [row[0] for row in conn.execute('SELECT size_bytes FROM attachment_blobs')]
+        conn.close()
+        self.assertEqual(summary['blob_rows'], 1)
+        self.assertEqual(summary['files'], 1)
+        self.assertEqual(remaining, [len(PNG_HEADER + b'kept')])
+        self.assertEqual(len(self._blob_files()), 1)
+
+    def test_staged_upload_is_moved_into_the_store(self):
+        self._expense_with_attachment(PNG_HEADER + b'streamed')
+        self.assertEqual(os.listdir(os.path.join(self.upload_root, 'blobs', 'tmp')), [])
+        conn = db.get_pool().acquire()
+        mime_type = conn.execute('SELECT mime_type FROM expense_attachments').fetchone()[0]
+        conn.close()
+        self.assertEqual(mime_type, 'image/png')
+
+    def test_oversized_upload_is_rejected(self):
+        with mock.patch.object(attachment_store, 'MAX_IMAGE_BYTES', 1024):
+            response = self._post_expense(PNG_HEADER + b'x' * 4096, 'big.png')
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('error', response.get_json())
+        self.assertEqual(self._blob_files(), [])
+
+    def test_content_must_match_an_allowed_type(self):
+        for content, filename in ((b'MZ\x90\x00 not an image at all', 'receipt.png'),
+                                  (PNG_HEADER + b'image', 'receipt.pdf'),
+                                  (PNG_HEADER + b'image', 'receipt.exe')):
+            with self.subTest(filename=filename):
+                response = self._post_expense(content, filename)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['error'], attachment_store.UnsupportedUpload.description)
+        self.assertEqual(self._blob_files(), [])
+
+    def test_uploads_are_served_immutable_with_hash_etag(self):
+        content = PNG_HEADER + b'served' * 50
+        url = self._expense_with_attachment(content)['attachment']['url']
+        path = '/uploads/' + url.split('/uploads/', 1)[1]
+
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, content)
+        self.assertEqual(response.headers['ETag'], '"%s"' % attachment_store.hashlib.sha256(content).hexdigest())
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        response.close()
+
+        repeat = self.client.get(path, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.data, b'')
+
+        partial = self.client.get(path, headers={'Range': 'bytes=0-7'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.data, PNG_HEADER[:8])
+        partial.close()
+
+    def test_proxy_offload_sends_no_body(self):
+        url = self._expense_with_attachment(PNG_HEADER + b'offloaded')['attachment']['url']
+        filename = url.split('/uploads/', 1)[1]
+        with mock.patch.object(centsible, 'UPLOADS_ACCEL_PREFIX', '/protected-uploads/'):
+            response = self.client.get('/uploads/' + filename)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/protected-uploads/' + filename)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.data, b'')
+
+    def test_staging_files_are_not_served(self):
+        os.makedirs(os.path.join(self.upload_root, 'blobs', 'tmp'))
+        with open(os.path.join(self.upload_root, 'blobs', 'tmp', 'upload-x.png'), 'wb') as f:
+            f.write(PNG_HEADER)
+        for path in ('blobs/tmp/upload-x.png', 'blobs/./tmp/upload-x.png', 'blobs//tmp/upload-x.png',
+                     'blobs/aa/../tmp/upload-x.png', '../app.py'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get('/uploads/' + path).status_code, 404)
+
+    def test_kept_originals_are_not_served(self):
+        os.makedirs(os.path.join(self.upload_root, 'originals', 'ab'))
+        with open(os.path.join(self.upload_root, 'originals', 'ab', 'photo.jpg'), 'wb') as f:
+            f.write(b'\xff\xd8\xff')
+        for path in ('originals/ab/photo.jpg', './originals/ab/photo.jpg'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get('/uploads/' + path).status_code, 404)
+
+    def _png(self, size=(1200, 1600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_thumbnail_is_generated_after_upload(self):
+        attachment = self._expense_with_attachment(self._png())['attachment']
+        thumbnails.shutdown(wait=True)
+        content_hash = attachment_store.hashlib.sha256(self._png()).hexdigest()
+        path = os.path.join(self.upload_root, thumbnails.thumbnail_relative_path(content_hash, 'image/png'))
+        with Image.open(path) as thumb:
+            self.assertEqual(thumb.format, 'WEBP')
+            self.assertEqual(max(thumb.size), thumbnails.THUMBNAIL_MAX_EDGE)
+
+        response = self.client.get(attachment['thumbnail_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertLess(len(response.data), os.path.getsize(os.path.join(self.upload_root, attachment['url'].split('/uploads/', 1)[1])))
+        response.close()
+
+    def test_thumbnail_is_generated_lazily_and_listed_in_feeds(self):
+        attachment = self._expense_with_attachment(self._png())['attachment']
+        thumbnails.shutdown(wait=True)
+        shutil.rmtree(os.path.join(self.upload_root, 'thumbs'))
+
+        activity = self.client.get(f'/api/groups/{self.group_id}/activity', headers=self.headers).get_json()
+        listed = activity['activities'][0]['attachments'][0]
+        self.assertEqual(listed['thumbnail_url'], attachment['thumbnail_url'])
+
+        response = self.client.get(listed['thumbnail_url'])
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertTrue(os.path.isdir(os.path.join(self.upload_root, 'thumbs')))
+
+        wrong_key = listed['thumbnail_url'].rsplit('/', 1)[0] + '/' + '0' * 64
+        self.assertEqual(self.client.get(wrong_key).status_code, 404)
+
+    def test_concurrent_thumbnail_requests_render_once(self):
+        attachment = self._expense_with_attachment(self._png())['attachment']
+        thumbnails.shutdown(wait=True)
+        shutil.rmtree(os.path.join(self.upload_root, 'thumbs'))
+
+        release = threading.Event()
+        renders = []
+        real_generate = thumbnails.generate
+
+        def slow_generate(*args):
+            renders.append(args)
+            release.wait(10)
+            return real_generate(*args)
+
+        statuses = []
+        with mock.patch.object(thumbnails, 'generate', side_effect=slow_generate):
+            with mock.patch.object(thumbnails, 'THUMBNAIL_REQUEST_WAIT', 0):
+                # Not ready in time: the client is asked to come back
+                response = self.client.get(attachment['thumbnail_url'])
+                self.assertEqual(response.status_code, 503)
+                self.assertIn('Retry-After', response.headers)
+            requests = [
+                threading.Thread(target=lambda: statuses.append(self.client.get(attachment['thumbnail_url']).status_code))
+                for _ in range(2)
+            ]
+            for thread in requests:
+                thread.start()
+            release.set()
+            for thread in requests:
+                thread.join(10)
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(len(renders), 1)
+
+    def _noisy_photo(self, fmt='JPEG'):
+        image = Image.effect_noise((1600, 1200), 40).convert('RGB')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **({'exif': exif, 'quality': 98} if fmt == 'JPEG' else {}))
+        return buffer.getvalue()
+
+    def test_ingest_transcoding_strips_metadata_and_caps_resolution(self):
+        original = self._noisy_photo()
+        with mock.patch.multiple(attachment_store, TRANSCODE_IMAGES=True, TRANSCODE_MAX_EDGE=800):
+            attachment = self._expense_with_attachment(original, filename='photo.jpg')['attachment']
+        stored = os.path.join(self.upload_root, attachment['url'].split('/uploads/', 1)[1])
+        self.assertLess(os.path.getsize(stored), len(original))
+        with Image.open(stored) as img:
+            self.assertEqual(img.format, 'JPEG')
+            # Orientation was applied to the pixels before the EXIF was dropped
+            self.assertEqual(img.size, (600, 800))
+            self.assertEqual(len(img.getexif()), 0)
+        # Originals are not kept unless the policy asks for it
+        self.assertFalse(os.path.exists(os.path.join(self.upload_root, 'originals')))
+
+    def test_reencode_moves_existing_attachments_to_smaller_blobs(self):
+        original = self._noisy_photo('PNG')
+        self._expense_with_attachment(original)
+        conn = db.get_pool().acquire()
+        with mock.patch.multiple(attachment_store, TRANSCODE_MAX_EDGE=800, KEEP_ORIGINALS=True):
+            summary = attachment_store.reencode(conn, workers=1)
+        row = conn.execute('SELECT file_path, mime_type, size_bytes FROM expense_attachments').fetchone()
+        conn.close()
+        self.assertEqual(summary['files'], 1)
+        self.assertEqual(summary['bytes_before'], len(original))
+        self.assertGreater(summary['bytes_saved'], 0)
+        self.assertEqual(row['mime_type'], 'image/jpeg')
+        self.assertTrue(row['file_path'].endswith('.jpg'))
+        self.assertEqual(row['size_bytes'], summary['bytes_after'])
+        kept = os.path.join(
+            self.upload_root, 'originals',
+            attachment_store.blob_relative_path(attachment_store.hashlib.sha256(original).hexdigest(), '.png')[len('blobs/'):]
+        )
+        self.assertTrue(os.path.exists(kept))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import time
+import unittest
+from unittest import mock
+
+import jwt
+
+import auth
+from testing import AppTestCase
+
+import app as centsible
+
+
+class AuthTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        body = self.signup_response('a').get_json()
+        self.token = body['token']
+        self.user_id = body['user']['id']
+
+    def _token(self, **payload):
+        return jwt.encode(payload, centsible.app.config['SECRET_KEY'], algorithm='HS256')
+
+    def test_verify_is_served_from_cache(self):
+        first = self.client.post('/auth/verify', json={'token': self.token})
+        self.assertEqual(first.status_code, 200)
+        with mock.patch.object(auth, 'get_db', side_effect=AssertionError('database queried')), \
+                mock.patch.object(auth.jwt, 'decode', side_effect=AssertionError('token decoded again')):
+            second = self.client.post('/auth/verify', json={'token': self.token})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.get_json()['user'], {'id': self.user_id, 'name': 'a', 'email': 'a@example.com'})
+
+    def test_protected_routes_reject_bad_tokens(self):
+        expired = self._token(user_id=self.user_id, exp=time.time() - 10)
+        cases = [
+            ({}, 'Authorization token required'),
+            ({'Authorization': 'Bearer not-a-token'}, 'Invalid token'),
+            ({'Authorization': f'Bearer {expired}'}, 'Token expired'),
+        ]
+        for headers, message in cases:
+            with self.subTest(message=message):
+                response = self.client.get('/api/groups', headers=headers)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response.get_json()['error'], message)
+
+        unknown = self._token(user_id=9999, exp=time.time() + 60)
+        response = self.client.get('/api/groups', headers={'Authorization': f'Bearer {unknown}'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile_update_refreshes_cached_profile(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        self.assertEqual(self.client.get('/api/groups', headers=headers).status_code, 200)
+        response = self.client.put('/api/users/profile', json={'name': 'renamed'}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        verified = self.client.post('/auth/verify', json={'token': self.token}).get_json()
+        self.assertEqual(verified['user']['name'], 'renamed')
+
+
+class ExpiringLRUTests(unittest.TestCase):
+    def test_entries_expire(self):
+        cache = auth.ExpiringLRU(10)
+        cache.put('token', 1, time.time() + 60)
+        self.assertEqual(cache.get('token'), 1)
+        with mock.patch.object(auth.time, 'time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = auth.ExpiringLRU(2)
+        expires = time.time() + 60
+        cache.put('a', 1, expires)
+        cache.put('b', 2, expires)
+        cache.get('a')
+        cache.put('c', 3, expires)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
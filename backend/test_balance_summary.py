@@ -0,0 +1,83 @@
+import unittest
+
+import db
+from crud import get_balance_summary, get_net_balances, get_user_balances, rebuild_balance_summary
+from testing import AppTestCase
+
+
+class BalanceSummaryTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.signup(name) for name in ('a', 'b', 'c')]
+        group = self.client.post('/api/groups', json={'group_name': 'Flat'}, headers=self.users[0][0]).get_json()
+        self.group_id = group['group_id']
+        for headers, _ in self.users[1:]:
+            self.client.post('/api/groups/join', json={'join_code': group['join_code']}, headers=headers)
+
+    def _expense(self, payer_index, amount):
+        headers, payer = self.users[payer_index]
+        ids = [uid for _, uid in self.users]
+        share = round(amount / len(ids), 2)
+        details = {str(uid): share for uid in ids}
+        details[str(payer)] = round(amount - share * (len(ids) - 1), 2)
+        response = self.client.post('/api/expenses', headers=headers, json={
+            'amount': amount, 'description': 'x', 'group_id': self.group_id, 'paid_by': payer,
+            'split_method': 'equal', 'participants': ids, 'split_details': details
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def _assert_matches_full_scan(self):
+        net = get_net_balances()
+        for _, user_id in self.users:
+            owed_by_me = sum(a for lender, b, a in get_user_balances(user_id) if b == user_id)
+            owed_to_me = sum(a for lender, b, a in get_user_balances(user_id) if lender == user_id)
+            summary = get_balance_summary(user_id)
+            self.assertAlmostEqual(summary[0], net.get(user_id, 0.0), places=6)
+            self.assertAlmostEqual(summary[1], owed_by_me, places=6)
+            self.assertAlmostEqual(summary[2], owed_to_me, places=6)
+
+    def test_summary_tracks_expenses_and_payments(self):
+        self._expense(0, 30)
+        self._expense(1, 90)   # reverses the a/b balance
+        self._expense(2, 12)
+        headers, b_id = self.users[1]
+        self.client.post('/api/payments', headers=headers, json={
+            'amount': 4, 'paid_by': self.users[2][1], 'paid_to': b_id,
+            'group_id': self.group_id, 'description': 'cash'
+        })
+        self._assert_matches_full_scan()
+
+        response = self.client.get('/api/balance', headers=headers).get_json()
+        self.assertAlmostEqual(response['net_balance'], round(get_net_balances()[b_id], 2))
+
+    def test_each_pair_is_one_signed_row(self):
+        self._expense(0, 30)   # b and c owe a 10 each
+        self._expense(1, 60)   # a and c owe b 20 each; a/b flips to a owes b 10
+        conn = db.get_pool().acquire()
+        pairs = conn.execute('SELECT COUNT(*) FROM balance_pairs WHERE group_id = ?', (self.group_id,)).fetchone()[0]
+        a_id, b_id = self.users[0][1], self.users[1][1]
+        row = conn.execute(
+            'SELECT lender, borrower, amount FROM balances WHERE group_id = ? AND ? IN (lender, borrower) AND ? IN (lender, borrower)',
+            (self.group_id, a_id, b_id)
+        ).fetchone()
+        conn.close()
+        self.assertEqual(pairs, 3)
+        self.assertEqual((row['lender'], row['borrower'], float(row['amount'])), (b_id, a_id, 10.0))
+        self._assert_matches_full_scan()
+
+    def test_rebuild_matches_incremental_summary(self):
+        self._expense(0, 45)
+        self._expense(1, 15)
+        before = [get_balance_summary(uid) for _, uid in self.users]
+        conn = db.get_pool().acquire()
+        rebuild_balance_summary(conn)
+        conn.commit()
+        conn.close()
+        after = [get_balance_summary(uid) for _, uid in self.users]
+        for old, new in zip(before, after):
+            for x, y in zip(old, new):
+                self.assertAlmostEqual(x, y, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
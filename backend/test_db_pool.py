@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import db
+from db import ConnectionPool, PoolTimeout
+from testing import AppTestCase, DatabaseTestCase
+
+import app as centsible
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.pool = ConnectionPool(self.db_path, max_size=2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close_all()
+        os.remove(self.db_path)
+
+    def test_connections_are_reused(self):
+        conn = self.pool.acquire()
+        raw = conn._raw
+        conn.close()
+        again = self.pool.acquire()
+        self.assertIs(again._raw, raw)
+        again.close()
+        self.assertEqual(self.pool.stats()['connections_created'], 1)
+
+    def test_close_rolls_back_uncommitted_work(self):
+        conn = self.pool.acquire()
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+        conn.execute('INSERT INTO t VALUES (1)')
+        conn.close()
+        conn = self.pool.acquire()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone()[0], 0)
+        conn.close()
+
+    def test_pool_is_bounded(self):
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+        first.close()
+        second.close()
+
+    def test_waiter_gets_released_connection(self):
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.pool.timeout = 2
+        threading.Timer(0.05, first.close).start()
+        third = self.pool.acquire()
+        stats = self.pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_time_max_ms'], 0)
+        second.close()
+        third.close()
+
+    def test_idle_connections_are_health_checked(self):
+        self.pool.health_check_after = 0
+        conn = self.pool.acquire()
+        conn.close()
+        self.pool.acquire().close()
+        self.assertEqual(self.pool.stats()['health_checks'], 1)
+
+    def test_closed_connection_cannot_be_used(self):
+        conn = self.pool.acquire()
+        conn.close()
+        other = self.pool.acquire()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.commit()
+        conn.close()  # closing twice is harmless
+        self.assertEqual(other.execute('SELECT 1').fetchone()[0], 1)
+        other.close()
+
+
+class RequestConnectionTests(DatabaseTestCase):
+    def test_get_db_checks_out_again_after_close(self):
+        with Flask(__name__).app_context():
+            first = db.get_db()
+            first.close()
+            second = db.get_db()
+            self.assertIsNot(second, first)
+            self.assertEqual(second.execute('SELECT COUNT(*) FROM users').fetchone()[0], 0)
+            self.assertIs(db.get_db(), second)
+
+
+class MetricsTests(AppTestCase):
+    def test_metrics_are_off_unless_enabled(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with mock.patch.object(centsible, 'METRICS_ENABLED', True):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        pool = response.get_json()['db_pool']
+        self.assertIn('in_use', pool)
+        self.assertNotIn('database', pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import json
+import unittest
+from unittest import mock
+
+import events
+from testing import AppTestCase
+
+import app as centsible
+
+
+def parse_event(chunk):
+    fields = dict(line.split(': ', 1) for line in chunk.decode('utf-8').strip().split('\n'))
+    return fields.get('id'), fields['event'], json.loads(fields['data'])
+
+
+class EventStreamTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        broker_patch = mock.patch.object(events, '_broker', events.LocalBroker())
+        broker_patch.start()
+        self.addCleanup(broker_patch.stop)
+
+        self.alice, self.alice_id = self.signup('Alice', 'alice@example.com')
+        self.bob, self.bob_id = self.signup('Bob', 'bob@example.com')
+        group = self.client.post('/api/groups', json={'group_name': 'Trip'}, headers=self.alice).get_json()
+        self.group_id = group['group_id']
+        self.join_code = group['join_code']
+
+    def _open(self, path, headers):
+        response = self.client.get(path, headers=headers)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        # Subscribes and sends the reconnect delay
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        return chunks
+
+    def _add_dinner(self):
+        return self.client.post('/api/expenses', headers=self.alice, json={
+            'amount': 30, 'description': 'Dinner', 'group_id': self.group_id, 'paid_by': self.alice_id,
+            'split_method': 'equal', 'participants': [self.alice_id, self.bob_id],
+            'split_details': {str(self.alice_id): 15, str(self.bob_id): 15}
+        })
+
+    def test_group_stream_carries_deltas(self):
+        self.client.post('/api/groups/join', json={'join_code': self.join_code}, headers=self.bob)
+        stream = self._open(f'/api/groups/{self.group_id}/events', self.bob)
+
+        self.assertEqual(self._add_dinner().status_code, 201)
+        _, event_type, data = parse_event(next(stream))
+        self.assertEqual(event_type, 'expense_added')
+        self.assertEqual(data['activity']['description'], 'Dinner')
+        self.assertFalse(data['activity']['is_my_expense'])
+        self.assertEqual(len(data['activity']['splits']), 2)
+        self.assertEqual(data['balances'], [{
+            'lender_id': self.alice_id, 'lender_name': 'Alice',
+            'borrower_id': self.bob_id, 'borrower_name': 'Bob', 'amount': 15.0
+        }])
+
+        self.client.post('/api/payments', headers=self.bob, json={
+            'amount': 15, 'paid_by': self.bob_id, 'paid_to': self.alice_id,
+            'group_id': self.group_id, 'description': 'Cash'
+        })
+        _, event_type, data = parse_event(next(stream))
+        self.assertEqual(event_type, 'payment_recorded')
+        self.assertTrue(data['activity']['is_my_payment'])
+        self.assertEqual(data['balances'][0]['amount'], 0.0)
+
+    def test_user_stream_carries_totals(self):
+        stream = self._open('/api/events', self.bob)
+        self.client.post('/api/groups/join', json={'join_code': self.join_code}, headers=self.bob)
+        _, event_type, data = parse_event(next(stream))
+        self.assertEqual(event_type, 'member_joined')
+        self.assertEqual(data['member']['user_id'], self.bob_id)
+
+        self._add_dinner()
+        _, event_type, data = parse_event(next(stream))
+        self.assertEqual(event_type, 'expense_added')
+        self.assertEqual(data['balance'], {'net_balance': -15.0, 'owed_by_me': 15.0, 'owed_to_me': 0.0})
+
+    def test_publish_failure_keeps_committed_write(self):
+        self.client.post('/api/groups/join', json={'join_code': self.join_code}, headers=self.bob)
+        with mock.patch.object(centsible, 'load_activity_item', side_effect=RuntimeError('boom')):
+            self.assertEqual(self._add_dinner().status_code, 201)
+        activity = self.client.get(f'/api/groups/{self.group_id}/activity', headers=self.alice).get_json()
+        self.assertEqual(len(activity['activities']), 1)
+
+    def test_group_stream_requires_membership(self):
+        response = self.client.get(f'/api/groups/{self.group_id}/events', headers=self.bob)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get('/api/events').status_code, 401)
+
+    def test_reconnect_replays_missed_events(self):
+        self.client.post('/api/groups/join', json={'join_code': self.join_code}, headers=self.bob)
+        stream = self._open(f'/api/groups/{self.group_id}/events', self.alice)
+        self._add_dinner()
+        last_id, _, _ = parse_event(next(stream))
+
+        self._add_dinner()
+        headers = {**self.alice, 'Last-Event-ID': last_id}
+        event_id, event_type, data = parse_event(next(self._open(f'/api/groups/{self.group_id}/events', headers)))
+        self.assertEqual(event_type, 'expense_added')
+        self.assertNotEqual(event_id, last_id)
+
+        headers = {**self.alice, 'Last-Event-ID': '1-1'}
+        _, event_type, _ = parse_event(next(self._open(f'/api/groups/{self.group_id}/events', headers)))
+        self.assertEqual(event_type, 'resync')
+
+
+class LocalBrokerTests(unittest.TestCase):
+    def test_broker_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            events.Broker()
+
+    def test_evicted_events_force_resync(self):
+        broker = events.LocalBroker(replay_size=2)
+        seen = broker.publish('group:2', 'expense_added', {})
+        for _ in range(3):
+            broker.publish('group:1', 'expense_added', {})
+        self.assertEqual(broker.subscribe(['group:1'], seen['id']).get(0)['type'], 'resync')
+        # Another channel's traffic does not count as missed
+        self.assertIsNone(broker.subscribe(['group:2'], seen['id']).get(0))
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        broker = events.LocalBroker()
+        subscription = broker.subscribe(['user:1'])
+        with mock.patch.object(subscription, '_queue', events.queue.Queue(maxsize=1)):
+            broker.publish('user:1', 'expense_added', {})
+            broker.publish('user:1', 'expense_added', {})
+            self.assertEqual(subscription.get(0)['type'], 'resync')
+            self.assertIsNone(subscription.get(0))
+        subscription.close()
+        self.assertEqual(broker.stats()['subscriptions'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
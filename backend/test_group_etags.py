@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+
+from testing import AppTestCase
+
+import app as centsible
+
+
+class GroupETagTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.alice_id = self.signup('Alice', 'alice@example.com')
+        self.bob, self.bob_id = self.signup('Bob', 'bob@example.com')
+        group = self.client.post('/api/groups', json={'group_name': 'Trip'}, headers=self.alice).get_json()
+        self.group_id = group['group_id']
+        self.join_code = group['join_code']
+        self.paths = [
+            '/api/groups',
+            f'/api/groups/{self.group_id}/members',
+            f'/api/groups/{self.group_id}/balances',
+            f'/api/groups/{self.group_id}/activity',
+        ]
+
+    def _etags(self, headers):
+        etags = {}
+        for path in self.paths:
+            response = self.client.get(path, headers=headers)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+            etags[path] = response.headers['ETag']
+        return etags
+
+    def _assert_all_changed(self, before, headers):
+        after = self._etags(headers)
+        for path in self.paths:
+            self.assertNotEqual(before[path], after[path], path)
+        return after
+
+    def test_unchanged_group_answers_not_modified(self):
+        etags = self._etags(self.alice)
+        for path, etag in etags.items():
+            with self.subTest(path=path):
+                self.assertTrue(etag.startswith('W/'))
+                with mock.patch.object(centsible, 'fetch_activity_page', side_effect=AssertionError('queried')):
+                    response = self.client.get(path, headers={**self.alice, 'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers['ETag'], etag)
+                self.assertEqual(response.data, b'')
+
+    def test_writes_change_etags(self):
+        etags = self._etags(self.alice)
+        self.client.post('/api/groups/join', json={'join_code': self.join_code}, headers=self.bob)
+        etags = self._assert_all_changed(etags, self.alice)
+
+        self.client.post('/api/expenses', headers=self.alice, json={
+            'amount': 30, 'description': 'Dinner', 'group_id': self.group_id, 'paid_by': self.alice_id,
+            'split_method': 'equal', 'participants': [self.alice_id, self.bob_id],
+            'split_details': {str(self.alice_id): 15, str(self.bob_id): 15}
+        })
+        etags = self._assert_all_changed(etags, self.alice)
+
+        self.client.post('/api/payments', headers=self.bob, json={
+            'amount': 5, 'paid_by': self.bob_id, 'paid_to': self.alice_id,
+            'group_id': self.group_id, 'description': 'Cash'
+        })
+        etags = self._assert_all_changed(etags, self.alice)
+
+        # Member names show up in every group view
+        self.client.put('/api/users/profile', json={'name': 'Robert'}, headers=self.bob)
+        self._assert_all_changed(etags, self.alice)
+
+    def test_etags_depend_on_user_and_query(self):
+        self.client.post('/api/groups/join', json={'join_code': self.join_code}, headers=self.bob)
+        alice = self._etags(self.alice)
+        bob = self._etags(self.bob)
+        self.assertNotEqual(alice['/api/groups'], bob['/api/groups'])
+
+        path = f'/api/groups/{self.group_id}/activity'
+        response = self.client.get(path + '?type=payment', headers={**self.alice, 'If-None-Match': alice[path]})
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_group_changes_group_list(self):
+        etag = self.client.get('/api/groups', headers=self.alice).headers['ETag']
+        self.client.post('/api/groups', json={'group_name': 'Flat'}, headers=self.alice)
+        response = self.client.get('/api/groups', headers={**self.alice, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['groups']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+import db
+import join_codes
+from testing import AppTestCase
+
+
+class JoinCodeTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conn = db.get_pool().acquire()
+        self.conn.execute(
+            "INSERT INTO users (id, username, email, password_hash) VALUES (1, 'a', 'a@example.com', 'x')"
+        )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _create_group(self, code):
+        self.conn.execute(
+            "INSERT INTO groups (group_name, join_code, created_by) VALUES ('g', ?, 1)", (code,)
+        )
+
+    def test_permutation_is_a_bijection(self):
+        for length in (1, 2, 3):
+            with self.subTest(length=length):
+                space = len(join_codes.ALPHABET) ** length
+                values = {join_codes.permute(index, length, 'seed') for index in range(space)}
+                self.assertEqual(values, set(range(space)))
+
+    def test_codes_are_unique_and_well_formed(self):
+        codes = []
+        for _ in range(500):
+            code = join_codes.allocate(self.conn)
+            self._create_group(code)
+            codes.append(code)
+        self.conn.commit()
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(len(code) == 4 and join_codes.is_valid(code) for code in codes))
+        # Not handed out in order
+        self.assertNotEqual(codes, sorted(codes))
+
+    def test_codes_from_the_random_allocator_are_skipped(self):
+        seed = 'fixed'
+        self.conn.execute("INSERT INTO join_code_counters (length, next_index, seed) VALUES (4, 0, ?)", (seed,))
+        taken = join_codes.encode(join_codes.permute(0, 4, seed), 4)
+        self._create_group(taken)
+        code = join_codes.allocate(self.conn)
+        self.assertNotEqual(code, taken)
+        self.assertEqual(code, join_codes.encode(join_codes.permute(1, 4, seed), 4))
+
+    def test_length_grows_as_the_space_fills(self):
+        with mock.patch.multiple(join_codes, JOIN_CODE_MIN_LENGTH=1, JOIN_CODE_MAX_FILL=0.5):
+            codes = [join_codes.allocate(self.conn) for _ in range(join_codes.capacity(1) + 1)]
+        self.assertEqual({len(code) for code in codes[:-1]}, {1})
+        self.assertEqual(len(codes[-1]), 2)
+
+    def test_group_created_and_joined_through_api(self):
+        self.conn.commit()
+        owner, _ = self.signup('o')
+        joiner, _ = self.signup('j')
+        group = self.client.post('/api/groups', json={'group_name': 'Flat'}, headers=owner).get_json()
+        self.assertTrue(join_codes.is_valid(group['join_code']))
+        response = self.client.post(
+            '/api/groups/join', json={'join_code': group['join_code'].lower()}, headers=joiner
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
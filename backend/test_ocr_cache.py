@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import db
+import ocr_cache
+import ocr_jobs
+from testing import DatabaseTestCase
+
+
+class OcrCacheTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conn = db.get_pool().acquire()
+        self.conn.execute(
+            "INSERT INTO users (id, username, email, password_hash) VALUES (1, 'a', 'a@example.com', 'x')"
+        )
+        self.conn.commit()
+
+        fd, self.receipt_path = tempfile.mkstemp(suffix='.png')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'receipt bytes')
+
+    def tearDown(self):
+        self.conn.close()
+        ocr_jobs.shutdown()
+        if os.path.exists(self.receipt_path):
+            os.remove(self.receipt_path)
+
+    def test_lookup_after_store(self):
+        digest = ocr_cache.hash_file(self.receipt_path)
+        before = ocr_cache.stats()
+        self.assertIsNone(ocr_cache.lookup(self.conn, digest))
+        ocr_cache.store(self.conn, digest, 12.5, None, 'TOTAL 12.50')
+        cached = ocr_cache.lookup(self.conn, digest)
+        self.assertEqual(cached['detected_total'], 12.5)
+        self.assertEqual(cached['text'], 'TOTAL 12.50')
+
+        after = ocr_cache.stats()
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertEqual(after['misses'], before['misses'] + 1)
+
+    def test_expired_entries_are_ignored_and_evicted(self):
+        ocr_cache.store(self.conn, 'old', 1.0, None, 'TOTAL 1.00')
+        self.conn.execute("UPDATE ocr_cache SET created_at = '2000-01-01T00:00:00'")
+        self.assertIsNone(ocr_cache.lookup(self.conn, 'old'))
+        self.assertEqual(ocr_cache.evict(self.conn), 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        limit = ocr_cache.OCR_CACHE_MAX_ENTRIES
+        ocr_cache.OCR_CACHE_MAX_ENTRIES = 2
+        try:
+            ocr_cache.store(self.conn, 'a', 1.0, None, '')
+            ocr_cache.store(self.conn, 'b', 2.0, None, '')
+            self.conn.execute("UPDATE ocr_cache SET last_used_at = '2001-01-01T00:00:00' WHERE content_hash = 'a'")
+            ocr_cache.store(self.conn, 'c', 3.0, None, '')
+        finally:
+            ocr_cache.OCR_CACHE_MAX_ENTRIES = limit
+        remaining = {row[0] for row in self.conn.execute('SELECT content_hash FROM ocr_cache')}
+        self.assertEqual(remaining, {'b', 'c'})
+
+    def test_cached_receipt_finishes_without_worker(self):
+        digest = ocr_cache.hash_file(self.receipt_path)
+        ocr_cache.store(self.conn, digest, 42.0, None, 'TOTAL 42.00')
+        self.conn.commit()
+
+        job_id = ocr_jobs.submit_job(1, self.receipt_path, cleanup=True)
+        job = ocr_jobs.get_job(job_id, 1)
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['detected_total'], 42.0)
+        self.assertFalse(os.path.exists(self.receipt_path))
+        self.assertIsNone(ocr_jobs._executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import ocr_jobs
+import receipt_ocr
+from testing import AppTestCase
+
+import app as centsible
+
+
+class OcrJobTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.signup(name) for name in ('a', 'b')]
+
+    def tearDown(self):
+        ocr_jobs.shutdown()
+
+    def _wait_for(self, job_id, user_id, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with centsible.app.app_context():
+                job = ocr_jobs.get_job(job_id, user_id)
+            if job['status'] != 'queued':
+                return job
+            time.sleep(0.1)
+        self.fail('OCR job did not finish')
+
+    def test_job_runs_in_worker_and_records_result(self):
+        _, user_id = self.users[0]
+        fd, receipt_path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        before = ocr_jobs.stats()
+
+        job_id = ocr_jobs.submit_job(user_id, receipt_path, cleanup=True)
+        job = self._wait_for(job_id, user_id)
+
+        # easyocr is optional, so accept either outcome but require a result
+        self.assertIn(job['status'], ('succeeded', 'failed'))
+        if job['status'] == 'failed':
+            self.assertTrue(job['error'])
+        self.assertIsNotNone(job['finished_at'])
+        self.assertFalse(os.path.exists(receipt_path))
+
+        after = ocr_jobs.stats()
+        self.assertEqual(after['submitted'], before['submitted'] + 1)
+        self.assertEqual(after['pending'], 0)
+        self.assertIsNotNone(after['total_ms']['max'])
+
+    def test_status_endpoint_is_owner_only(self):
+        (owner_headers, owner_id), (other_headers, _) = self.users
+        job_id = ocr_jobs.submit_job(owner_id, os.path.join(tempfile.gettempdir(), 'missing.png'))
+        self._wait_for(job_id, owner_id)
+
+        response = self.client.get(f'/api/ocr-jobs/{job_id}', headers=owner_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['job_id'], job_id)
+        response = self.client.get(f'/api/ocr-jobs/{job_id}', headers=other_headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_jobs_arriving_together_share_a_batch(self):
+        _, user_id = self.users[0]
+        window = ocr_jobs.OCR_BATCH_WINDOW_MS
+        ocr_jobs.OCR_BATCH_WINDOW_MS = 500
+        before = ocr_jobs.stats()
+        try:
+            job_ids = [
+                ocr_jobs.submit_job(user_id, os.path.join(tempfile.gettempdir(), f'missing-{i}.png'))
+                for i in range(3)
+            ]
+            for job_id in job_ids:
+                self._wait_for(job_id, user_id)
+        finally:
+            ocr_jobs.OCR_BATCH_WINDOW_MS = window
+        after = ocr_jobs.stats()
+        self.assertEqual(after['batches'], before['batches'] + 1)
+        self.assertEqual(after['batched_jobs'], before['batched_jobs'] + 3)
+
+    def test_full_queue_is_rejected(self):
+        _, user_id = self.users[0]
+        limit = ocr_jobs.OCR_MAX_PENDING_JOBS
+        ocr_jobs.OCR_MAX_PENDING_JOBS = 0
+        try:
+            with self.assertRaises(ocr_jobs.OcrQueueFull):
+                ocr_jobs.submit_job(user_id, 'receipt.png')
+        finally:
+            ocr_jobs.OCR_MAX_PENDING_JOBS = limit
+        self.assertGreaterEqual(ocr_jobs.stats()['rejected'], 1)
+
+
+class ReceiptOcrLoadingTests(unittest.TestCase):
+    def test_importing_app_does_not_load_model(self):
+        code = 'import sys, app; print("easyocr" in sys.modules)'
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(output.strip(), 'False')
+
+    def test_background_warm_up_loads_once(self):
+        thread = receipt_ocr.warm_up(background=True)
+        thread.join(120)
+        reader = receipt_ocr.get_reader()
+        self.assertIs(receipt_ocr.get_reader(), reader)
+        self.assertEqual(receipt_ocr.ocr_available(), reader is not None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import threading
+import unittest
+from unittest import mock
+
+import db
+import passwords
+from testing import AppTestCase
+
+import app as centsible
+
+
+class PasswordTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        # Low cost keeps the tests fast; the pool is used as in production
+        patcher = mock.patch.object(passwords, 'BCRYPT_ROUNDS', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _stored_hash(self):
+        conn = db.get_pool().acquire()
+        value = conn.execute('SELECT password_hash FROM users').fetchone()[0]
+        conn.close()
+        return value
+
+    def test_hash_and_verify_in_pool(self):
+        hashed = passwords.hash_password('secret1')
+        self.assertTrue(hashed.startswith('$2b$04$'))
+        self.assertTrue(passwords.verify_password('secret1', hashed))
+        self.assertFalse(passwords.verify_password('wrong', hashed))
+        self.assertIsNone(passwords.replace_password('secret1', hashed))
+        self.assertTrue(passwords.verify_password('other1', passwords.replace_password('other1', hashed)))
+        self.assertGreaterEqual(passwords.stats()['checked'], 2)
+
+    def test_login_rehashes_when_cost_changes(self):
+        self.assertEqual(self.signup_response('a').status_code, 201)
+        self.assertFalse(passwords.needs_rehash(self._stored_hash()))
+
+        threads = []
+        real_rehash = passwords.rehash_in_background
+
+        def capture(*args):
+            threads.append(real_rehash(*args))
+            return threads[-1]
+
+        with mock.patch.object(passwords, 'BCRYPT_ROUNDS', 5), \
+                mock.patch.object(passwords, 'rehash_in_background', side_effect=capture):
+            response = self.client.post('/auth/login', json={'email': 'a@example.com', 'password': 'secret1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(threads), 1)
+            threads[0].join(timeout=30)
+            self.assertTrue(self._stored_hash().startswith('$2b$05$'))
+            response = self.client.post('/auth/login', json={'email': 'a@example.com', 'password': 'secret1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(threads), 1)
+
+    def test_no_connection_held_while_hashing(self):
+        in_use = []
+
+        def hash_racing_signup(password):
+            in_use.append(db.get_pool().stats()['in_use'])
+            # Another signup for the same email commits meanwhile
+            conn = db.get_pool().acquire()
+            conn.execute(
+                "INSERT INTO users (username, email, password_hash, created_at, updated_at) "
+                "VALUES ('b', 'a@example.com', 'x', '', '')"
+            )
+            conn.commit()
+            conn.close()
+            return passwords.hash_password(password)
+
+        with mock.patch.object(centsible, 'hash_password', side_effect=hash_racing_signup):
+            response = self.signup_response('a')
+        self.assertEqual(in_use, [0])
+        self.assertEqual(response.status_code, 409)
+
+    def test_password_update_releases_connection_while_hashing(self):
+        token = self.signup_response('a').get_json()['token']
+        in_use = []
+
+        def replace(password, current_hash):
+            in_use.append(db.get_pool().stats()['in_use'])
+            return passwords.replace_password(password, current_hash)
+
+        with mock.patch.object(centsible, 'replace_password', side_effect=replace):
+            response = self.client.put('/api/users/password', json={'new_password': 'secret2'},
+                                       headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(in_use, [0])
+        self.assertTrue(passwords.verify_password('secret2', self._stored_hash()))
+
+    def test_full_pool_answers_503(self):
+        exhausted = threading.BoundedSemaphore(1)
+        exhausted.acquire()
+        with mock.patch.object(passwords, '_get_executor', return_value=(None, exhausted)), \
+                mock.patch.object(passwords, 'PASSWORD_QUEUE_TIMEOUT', 0.01):
+            response = self.signup_response('a')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('error', response.get_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import re
+import unittest
+
+import db
+from testing import AppTestCase
+
+
+class EndpointQueryPlanTests(AppTestCase):
+    """Exercise every endpoint and check each issued query against EXPLAIN QUERY PLAN."""
+
+    def setUp(self):
+        self.statements = []
+        super().setUp()
+        # Only queries issued by the endpoints are checked
+        del self.statements[:]
+
+    def pool_options(self):
+        return {'on_connect': lambda raw: raw.set_trace_callback(self.statements.append)}
+
+    def _exercise_endpoints(self):
+        alice, alice_id = self.signup('Alice', 'alice@example.com')
+        bob, bob_id = self.signup('Bob', 'bob@example.com')
+        group = self.client.post('/api/groups', json={'group_name': 'Trip'}, headers=alice).get_json()
+        group_id = group['group_id']
+        self.client.post('/api/groups/join', json={'join_code': group['join_code']}, headers=bob)
+        self.client.post('/api/expenses', headers=alice, json={
+            'amount': 30, 'description': 'Dinner', 'group_id': group_id, 'paid_by': alice_id,
+            'split_method': 'equal', 'participants': [alice_id, bob_id],
+            'split_details': {str(alice_id): 15, str(bob_id): 15}
+        })
+        self.client.post('/api/payments', headers=bob, json={
+            'amount': 5, 'paid_by': bob_id, 'paid_to': alice_id, 'group_id': group_id, 'description': 'Cash'
+        })
+        self.client.post('/auth/login', json={'email': 'alice@example.com', 'password': 'secret1'})
+        self.client.post('/auth/verify', json={'token': alice['Authorization'].split(' ')[1]})
+        self.client.put('/api/users/profile', json={'name': 'Alicia'}, headers=alice)
+        self.client.put('/api/users/password', json={'new_password': 'secret2'}, headers=alice)
+        for path in ('/api/balance', '/api/unpaid-expenses', '/api/activity', '/api/groups',
+                     f'/api/groups/{group_id}/members', f'/api/groups/{group_id}/balances',
+                     f'/api/groups/{group_id}/activity', '/api/sync?since=0'):
+            response = self.client.get(path, headers=bob)
+            self.assertEqual(response.status_code, 200, path)
+
+    def test_endpoint_queries_use_indexes(self):
+        self._exercise_endpoints()
+        queries = {
+            s for s in self.statements
+            if re.match(r'\s*(SELECT|UPDATE|DELETE)\b', s, re.IGNORECASE)
+        }
+        self.assertTrue(queries)
+
+        conn = db.get_pool().acquire()
+        try:
+            offenders = []
+            for query in queries:
+                plan = [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}')]
+                # Views/subqueries materialized from an indexed search are fine to scan
+                materialized = {d.split()[1] for d in plan if d.startswith(('MATERIALIZE', 'CO-ROUTINE'))}
+                for detail in plan:
+                    # SCAN without an index is a full table scan
+                    if (detail.startswith('SCAN') and 'INDEX' not in detail
+                            and 'CONSTANT ROW' not in detail
+                            and detail.split()[1] not in materialized):
+                        offenders.append(f"{detail}\n    {' '.join(query.split())}")
+        finally:
+            conn.close()
+        self.assertEqual(offenders, [], 'Full table scans:\n' + '\n'.join(offenders))
+
+
+if __name__ == '__main__':
+    unittest.main()
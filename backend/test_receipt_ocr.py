@@ -1,6 +1,19 @@
+import importlib.util
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from app import extract_amount_from_line, find_total_amount_in_text
+from PIL import Image
+
+import receipt_ocr
+from receipt_ocr import (
+    EXIF_ORIENTATION, extract_amount_from_line, find_total_amount_in_text, footer_region, group_rows,
+    preprocess_image, scan_receipt, scan_receipts
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'receipt_texts.json')
 
 
 class ReceiptOcrParsingTests(unittest.TestCase):
@@ -46,6 +59,197 @@ class ReceiptOcrParsingTests(unittest.TestCase):
         """
         self.assertEqual(find_total_amount_in_text(text), 54.0)
 
+    def test_regression_corpus(self):
+        with open(CORPUS_PATH) as f:
+            corpus = json.load(f)
+        for case in corpus:
+            with self.subTest(case['name']):
+                self.assertEqual(find_total_amount_in_text(case['text']), case['expected'])
+
+
+class RowGroupingTests(unittest.TestCase):
+    def test_boxes_on_same_row_are_joined(self):
+        results = [
+            ([[300, 102], [380, 102], [380, 120], [300, 120]], '$27.50', 0.9),
+            ([[10, 100], [90, 100], [90, 118], [10, 118]], 'TOTAL', 0.9),
+            ([[10, 60], [90, 60], [90, 78], [10, 78]], 'Tax', 0.9),
+            ([[300, 61], [380, 61], [380, 79], [300, 79]], '$2.00', 0.9),
+        ]
+        self.assertEqual(group_rows(results), 'Tax $2.00\nTOTAL $27.50')
+        self.assertEqual(find_total_amount_in_text(group_rows(results)), 27.5)
+
+
+class ReceiptImagePreprocessingTests(unittest.TestCase):
+    def test_large_photo_is_capped_and_grayscale(self):
+        image = Image.new('RGB', (3000, 4000), (200, 180, 160))
+        prepared = preprocess_image(image, max_edge=1600)
+        self.assertEqual(prepared.mode, 'L')
+        self.assertEqual(prepared.size, (1200, 1600))
+        self.assertEqual(image.size, (3000, 4000))
+
+    def test_small_image_is_not_upscaled(self):
+        prepared = preprocess_image(Image.new('RGB', (300, 200)), max_edge=1600)
+        self.assertEqual(prepared.size, (300, 200))
+
+    def test_exif_orientation_is_applied(self):
+        image = Image.new('RGB', (400, 200), (255, 255, 255))
+        exif = image.getexif()
+        exif[EXIF_ORIENTATION] = 6  # rotated 90 degrees clockwise
+        image.info['exif'] = exif.tobytes()
+        prepared = preprocess_image(image, max_edge=0)
+        self.assertEqual(prepared.size, (200, 400))
+
+    def test_transparent_background_becomes_white(self):
+        image = Image.new('RGBA', (10, 10), (0, 0, 0, 0))
+        prepared = preprocess_image(image, contrast_cutoff=0)
+        self.assertEqual(prepared.getpixel((5, 5)), 255)
+
+
+class FakeReader:
+    """Stands in for easyocr.Reader: returns footer_text for crops, page_text for full pages."""
+
+    def __init__(self, footer_text, page_text):
+        self.footer_text = footer_text
+        self.page_text = page_text
+        self.calls = []
+
+    def readtext(self, array):
+        self.calls.append(array.shape)
+        text = self.footer_text if array.shape[0] < 1000 else self.page_text
+        return [
+            ([[0, i * 20], [100, i * 20], [100, i * 20 + 15], [0, i * 20 + 15]], line, 0.9)
+            for i, line in enumerate(text.splitlines())
+        ]
+
+    def readtext_batched(self, arrays):
+        self.batched_calls = getattr(self, 'batched_calls', 0) + 1
+        return [self.readtext(array) for array in arrays]
+
+
+@unittest.skipIf(importlib.util.find_spec('numpy') is None, 'numpy is not installed')
+class TwoPassOcrTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        Image.new('L', (750, 1000), 255).save(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_total_in_footer_skips_full_page(self):
+        reader = FakeReader('Total: $12.00', 'Milk 2.00\nTotal: $12.00')
+        amount, error, _, fast_path = scan_receipt(self.path, two_pass=True, reader=reader)
+        self.assertEqual(amount, 12.0)
+        self.assertIsNone(error)
+        self.assertTrue(fast_path)
+        self.assertEqual(len(reader.calls), 1)
+
+    def test_falls_back_to_full_page(self):
+        reader = FakeReader('Thank you!', 'Grand Total 30.50\nThank you!')
+        amount, _, _, fast_path = scan_receipt(self.path, two_pass=True, reader=reader)
+        self.assertEqual(amount, 30.5)
+        self.assertFalse(fast_path)
+        self.assertEqual(len(reader.calls), 2)
+
+
+@unittest.skipIf(importlib.util.find_spec('numpy') is None, 'numpy is not installed')
+class BatchedOcrTests(unittest.TestCase):
+    def setUp(self):
+        self.paths = []
+        for width in (700, 750, 800):
+            fd, path = tempfile.mkstemp(suffix='.png')
+            os.close(fd)
+            Image.new('L', (width, 1000), 255).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def test_footers_are_recognized_in_one_batch(self):
+        reader = FakeReader('TOTAL 5.00', '')
+        results = scan_receipts(self.paths, two_pass=True, reader=reader)
+        self.assertEqual([result[0] for result in results], [5.0, 5.0, 5.0])
+        self.assertEqual(reader.batched_calls, 1)
+        self.assertEqual(len(reader.calls), 3)
+
+    def test_misses_fall_back_per_receipt(self):
+        reader = FakeReader('', 'Balance Due 7.25')
+        results = scan_receipts(self.paths, two_pass=True, reader=reader)
+        self.assertEqual([result[0] for result in results], [7.25] * 3)
+        self.assertEqual([result[3] for result in results], [False] * 3)
+        self.assertEqual(len(reader.calls), 6)
+
+    def test_without_preprocessing(self):
+        reader = FakeReader('', 'Balance Due 7.25')
+        with mock.patch.object(receipt_ocr, 'OCR_PREPROCESS', False):
+            results = scan_receipts(self.paths, two_pass=True, reader=reader)
+        self.assertEqual([result[:2] for result in results], [(7.25, None)] * 3)
+
+    def test_unreadable_file_fails_alone(self):
+        fd, broken = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        self.addCleanup(os.remove, broken)
+        reader = FakeReader('TOTAL 5.00', '')
+        results = scan_receipts([self.paths[0], broken, self.paths[1]], two_pass=True, reader=reader)
+        self.assertEqual([results[0][0], results[2][0]], [5.0, 5.0])
+        self.assertTrue(results[1][1].startswith('OCR failed'))
+        self.assertEqual(reader.batched_calls, 1)
+
+
+class PdfReceiptTests(unittest.TestCase):
+    def setUp(self):
+        # pdf2image/poppler are optional; the helpers that call them are patched
+        patcher = mock.patch.object(receipt_ocr, 'convert_from_path', object())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_text_layer_skips_ocr(self):
+        pages = ['Invoice page 1\nItems...', 'Amount Due: $410.20\n']
+        with mock.patch.object(receipt_ocr, '_pdf_text_layer', return_value=pages), \
+                mock.patch.object(receipt_ocr, 'get_reader') as get_reader:
+            amount, error, _, _ = scan_receipt('invoice.pdf')
+        self.assertEqual(amount, 410.2)
+        self.assertIsNone(error)
+        get_reader.assert_not_called()
+
+    @unittest.skipIf(importlib.util.find_spec('numpy') is None, 'numpy is not installed')
+    def test_pages_are_read_last_first_and_stop_early(self):
+        rendered = []
+
+        def render(path, page_number):
+            rendered.append(page_number)
+            return Image.new('L', (750, 1000), 255)
+
+        reader = FakeReader('', 'Total: $9.99')
+        with mock.patch.object(receipt_ocr, '_pdf_text_layer', return_value=None), \
+                mock.patch.object(receipt_ocr, '_pdf_page_count', return_value=5), \
+                mock.patch.object(receipt_ocr, '_render_pdf_page', side_effect=render):
+            amount, _, _, _ = scan_receipt('invoice.pdf', two_pass=False, reader=reader)
+        self.assertEqual(amount, 9.99)
+        self.assertEqual(len(reader.calls), 1)
+        # the last page, plus at most one page rendered ahead
+        self.assertEqual(rendered[0], 5)
+        self.assertLessEqual(len(rendered), 2)
+
+    @unittest.skipIf(importlib.util.find_spec('numpy') is None, 'numpy is not installed')
+    def test_text_layer_without_total_falls_back_to_ocr(self):
+        pages = ['ACME Hardware\nInvoice 1042\n']
+        reader = FakeReader('', 'Total: $12.50')
+        with mock.patch.object(receipt_ocr, '_pdf_text_layer', return_value=pages), \
+                mock.patch.object(receipt_ocr, '_pdf_page_count', return_value=1), \
+                mock.patch.object(receipt_ocr, '_render_pdf_page', return_value=Image.new('L', (750, 1000), 255)):
+            amount, error, _, _ = scan_receipt('invoice.pdf', two_pass=False, reader=reader)
+        self.assertEqual(amount, 12.5)
+        self.assertIsNone(error)
+        self.assertEqual(len(reader.calls), 1)
+
+
+class FooterRegionTests(unittest.TestCase):
+    def test_footer_is_bottom_band(self):
+        image = Image.new('L', (100, 1000))
+        self.assertEqual(footer_region(image, 0.4).size, (100, 400))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from datetime import datetime, timedelta
+
+import change_log
+import db
+from testing import AppTestCase
+
+
+class SyncTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.alice_id = self.signup('Alice', 'alice@example.com')
+        self.bob, self.bob_id = self.signup('Bob', 'bob@example.com')
+        group = self.client.post('/api/groups', json={'group_name': 'Trip'}, headers=self.alice).get_json()
+        self.group_id = group['group_id']
+        self.client.post('/api/groups/join', json={'join_code': group['join_code']}, headers=self.bob)
+
+    def _sync(self, headers, since=None, **params):
+        query = {'since': since, **params} if since is not None else params
+        return self.client.get('/api/sync', query_string=query, headers=headers)
+
+    def _add_dinner(self):
+        return self.client.post('/api/expenses', headers=self.alice, json={
+            'amount': 30, 'description': 'Dinner', 'group_id': self.group_id, 'paid_by': self.alice_id,
+            'split_method': 'equal', 'participants': [self.alice_id, self.bob_id],
+            'split_details': {str(self.alice_id): 15, str(self.bob_id): 15}
+        })
+
+    def test_returns_only_changes_after_cursor(self):
+        cursor = self._sync(self.bob).get_json()['cursor']
+        self._add_dinner()
+        body = self._sync(self.bob, cursor).get_json()
+        self.assertEqual(
+            [(change['entity'], change['op']) for change in body['changes']],
+            [('expense', 'insert'), ('split', 'insert'), ('split', 'insert'), ('balance', 'update')]
+        )
+        self.assertEqual(body['changes'][0]['data']['description'], 'Dinner')
+        self.assertEqual(body['changes'][-1]['key'], f'{self.alice_id}:{self.bob_id}')
+        self.assertEqual(body['changes'][-1]['data']['amount'], 15.0)
+
+        self.client.post('/api/payments', headers=self.bob, json={
+            'amount': 5, 'paid_by': self.bob_id, 'paid_to': self.alice_id,
+            'group_id': self.group_id, 'description': 'Cash'
+        })
+        body = self._sync(self.bob, body['cursor']).get_json()
+        self.assertEqual([change['entity'] for change in body['changes']], ['payment', 'balance'])
+        self.assertEqual(body['changes'][-1]['data']['amount'], 10.0)
+        self.assertEqual(self._sync(self.bob, body['cursor']).get_json()['changes'], [])
+
+    def test_only_the_callers_groups(self):
+        carol, _ = self.signup('Carol', 'carol@example.com')
+        self._add_dinner()
+        body = self._sync(carol, '0').get_json()
+        self.assertEqual(body['changes'], [])
+        self.assertEqual(body['cursor'], '0')
+
+    def test_joining_lists_group_for_reload(self):
+        body = self._sync(self.bob, '0').get_json()
+        self.assertEqual(body['reload_groups'], [self.group_id])
+        self.assertEqual(
+            [(change['entity'], change['data']['username']) for change in body['changes']],
+            [('member', 'Alice'), ('member', 'Bob')]
+        )
+
+    def test_pages(self):
+        self._add_dinner()
+        first = self._sync(self.bob, '0', limit=3).get_json()
+        self.assertTrue(first['has_more'])
+        rest = self._sync(self.bob, first['cursor']).get_json()
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(first['changes']) + len(rest['changes']), 6)
+
+    def test_pruned_cursor_is_gone(self):
+        self._add_dinner()
+        conn = db.get_pool().acquire()
+        old = (datetime.now() - timedelta(days=change_log.CHANGE_LOG_RETENTION_DAYS + 1)).isoformat()
+        conn.execute('UPDATE change_log SET created_at = ?', (old,))
+        self.assertEqual(change_log.prune(conn), 5)
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(self._sync(self.bob, '0').status_code, 410)
+        cursor = self._sync(self.bob).get_json()['cursor']
+        self.assertEqual(self._sync(self.bob, cursor).status_code, 200)
+        self.assertEqual(self._sync(self.bob, 'abc').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Shared fixtures for the unit tests: a fresh, fully migrated SQLite file
+behind the connection pool for each test, and helpers for tests that go
+through the Flask app.
+"""
+
+import os
+import tempfile
+import unittest
+
+import db
+from migrations import migrate
+
+import app as centsible
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Points the pool at a temporary database with schema.sql and every
+    migration applied. Subclasses call super().setUp() first; the pool is
+    reset and the file removed after their tearDown.
+    """
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.remove, self.db_path)
+        db.configure_pool(self.db_path, **self.pool_options())
+        self.addCleanup(db.configure_pool)
+        conn = db.get_pool().acquire()
+        with open(SCHEMA_PATH) as f:
+            conn.executescript(f.read())
+        migrate(conn)
+        conn.close()
+
+    def pool_options(self):
+        """Extra configure_pool() arguments, e.g. an on_connect hook."""
+        return {}
+
+
+class AppTestCase(DatabaseTestCase):
+    """DatabaseTestCase with a test client for the app and signup helpers."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = centsible.app.test_client()
+
+    def signup_response(self, name, email=None, password='secret1'):
+        return self.client.post('/auth/signup', json={
+            'name': name, 'email': email or f'{name.lower()}@example.com', 'password': password
+        })
+
+    def signup(self, name, email=None):
+        """Register a user; returns (auth headers, user id)."""
+        body = self.signup_response(name, email).get_json()
+        return {'Authorization': f"Bearer {body['token']}"}, body['user']['id']
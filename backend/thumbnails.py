@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Thumbnails and previews for expense attachments.
+
+Activity feeds only show small previews, so each image attachment gets a
+WebP thumbnail and each PDF a PNG preview of its first page, stored under
+uploads/thumbs/<aa>/<hash>-<edge>.<ext>. They are generated in the
+background right after upload and on first request for attachments that
+predate the pipeline (see serve_thumbnail in app.py). Thumbnails are keyed
+by content hash, so deduplicated attachments share one.
+
+Usage:
+    python3 thumbnails.py backfill   # generate missing thumbnails
+    python3 thumbnails.py gc         # remove thumbnails of deleted blobs
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+import attachment_store
+from db import get_db
+
+try:
+    from pdf2image import convert_from_path
+except ImportError:  # PDF previews need pdf2image and poppler
+    convert_from_path = None
+
+THUMBNAIL_MAX_EDGE = int(os.environ.get('THUMBNAIL_MAX_EDGE', '320'))
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', '75'))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '1'))
+# How long a thumbnail request waits for one that is being generated
+THUMBNAIL_REQUEST_WAIT = float(os.environ.get('THUMBNAIL_REQUEST_WAIT', '5'))
+# Low DPI is plenty for a first-page preview a few hundred pixels tall
+PDF_PREVIEW_DPI = 50
+
+_executor = None
+_executor_lock = threading.Lock()
+# Thumbnails being generated, so repeated uploads of a file queue it once
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def thumbnail_key(row):
+    """Content hash of the attachment, or a stable stand-in for pre-dedup uploads."""
+    return row['content_hash'] or hashlib.sha256(row['file_path'].encode('utf-8')).hexdigest()
+
+
+def thumbnail_relative_path(key, mime_type, edge=None):
+    """Where a thumbnail lives relative to UPLOAD_ROOT, or None if the type has none."""
+    edge = edge or THUMBNAIL_MAX_EDGE
+    if mime_type == 'application/pdf':
+        extension = '.png'
+    elif mime_type and mime_type.startswith('image/'):
+        extension = '.webp'
+    else:
+        return None
+    return '/'.join(['thumbs', key[:2], f'{key}-{edge}{extension}'])
+
+
+def _render_image(source_path, edge):
+    with Image.open(source_path) as img:
+        if img.format == 'JPEG':
+            # Let the decoder downscale by a power of two while reading
+            img.draft('RGB', (edge, edge))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        img.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=2.0)
+        return img
+
+
+def _render_pdf(source_path, edge):
+    if convert_from_path is None:
+        return None
+    pages = convert_from_path(source_path, dpi=PDF_PREVIEW_DPI, first_page=1, last_page=1)
+    if not pages:
+        return None
+    img = pages[0].convert('RGB')
+    img.thumbnail((edge, edge), Image.LANCZOS)
+    return img
+
+
+def generate(source_path, key, mime_type, edge=None):
+    """
+    Write the thumbnail for an attachment if it is not there yet.
+    Returns its path relative to UPLOAD_ROOT, or None when the file cannot
+    be previewed (unsupported format, corrupt file, no PDF renderer).
+    """
+    edge = edge or THUMBNAIL_MAX_EDGE
+    relative_path = thumbnail_relative_path(key, mime_type, edge)
+    if relative_path is None:
+        return None
+    destination = os.path.join(attachment_store.UPLOAD_ROOT, relative_path)
+    if os.path.exists(destination):
+        return relative_path
+
+    try:
+        if mime_type == 'application/pdf':
+            img = _render_pdf(source_path, edge)
+        else:
+            img = _render_image(source_path, edge)
+    except Exception as e:
+        print(f"Thumbnail failed for {source_path}: {e}")
+        return None
+    if img is None:
+        return None
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    extension = os.path.splitext(destination)[1]
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=extension)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if extension == '.png':
+                img.save(out, 'PNG', optimize=True)
+            else:
+                img.save(out, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+        os.replace(temp_path, destination)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return relative_path
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+        return _executor
+
+
+def schedule(source_path, key, mime_type):
+    """Generate a thumbnail in the background. Returns the future, or None if there is nothing to do."""
+    relative_path = thumbnail_relative_path(key, mime_type)
+    if relative_path is None or os.path.exists(os.path.join(attachment_store.UPLOAD_ROOT, relative_path)):
+        return None
+    with _in_flight_lock:
+        future = _in_flight.get(relative_path)
+        if future is None:
+            future = _get_executor().submit(generate, source_path, key, mime_type)
+            _in_flight[relative_path] = future
+    future.add_done_callback(lambda _: _forget(relative_path))
+    return future
+
+
+def _forget(relative_path):
+    with _in_flight_lock:
+        _in_flight.pop(relative_path, None)
+
+
+def shutdown(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def backfill(conn):
+    """Generate thumbnails for every attachment that lacks one."""
+    created = 0
+    rows = conn.execute(
+        'SELECT file_path, mime_type, content_hash FROM expense_attachments'
+    ).fetchall()
+    seen = set()
+    for row in rows:
+        key = thumbnail_key(row)
+        relative_path = thumbnail_relative_path(key, row['mime_type'])
+        if relative_path is None or relative_path in seen:
+            continue
+        seen.add(relative_path)
+        if os.path.exists(os.path.join(attachment_store.UPLOAD_ROOT, relative_path)):
+            continue
+        source = os.path.join(attachment_store.UPLOAD_ROOT, row['file_path'])
+        if os.path.exists(source) and generate(source, key, row['mime_type']):
+            created += 1
+    return created
+
+
+def collect_garbage(conn, dry_run=False):
+    """Remove thumbnails whose attachment content is gone. Returns (files, bytes)."""
+    live = {thumbnail_key(row) for row in conn.execute('SELECT file_path, content_hash FROM expense_attachments')}
+    now = time.time()
+    files = freed = 0
+    for directory, _, names in os.walk(os.path.join(attachment_store.UPLOAD_ROOT, 'thumbs')):
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.split('-', 1)[0] in live or not attachment_store._is_old(path, now):
+                continue
+            files += 1
+            freed += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+    return files, freed
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'backfill'
+    connection = get_db()
+    try:
+        if command == 'backfill':
+            print(f"Generated {backfill(connection)} thumbnails.")
+        elif command == 'gc':
+            removed, freed = collect_garbage(connection, dry_run='--dry-run' in sys.argv)
+            print(f"Removed {removed} thumbnails ({freed} bytes).")
+        else:
+            print('Usage: python3 thumbnails.py [backfill|gc [--dry-run]]')
+            sys.exit(1)
+    finally:
+        connection.close()
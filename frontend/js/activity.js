@@ -1,5 +1,6 @@
 // Activity page functionality
 let cachedActivities = [];
+let nextActivityCursor = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     
@@ -80,7 +81,7 @@ function displayUserInfo(user) {
     });
 }
 
-async function loadActivityData() {
+async function loadActivityData(cursor = null) {
     const token = localStorage.getItem('token');
     
     if (!token) {
@@ -90,7 +91,10 @@ async function loadActivityData() {
     }
     
     try {
-        const response = await fetch('http://localhost:5000/api/activity', {
+        const url = cursor
+            ? `http://localhost:5000/api/activity?cursor=${encodeURIComponent(cursor)}`
+            : 'http://localhost:5000/api/activity';
+        const response = await fetch(url, {
             method: 'GET',
             headers: {
                 'Authorization': `Bearer ${token}`,
@@ -106,7 +110,11 @@ async function loadActivityData() {
         }
         
         const activityData = await response.json();
-        displayActivityData(activityData);
+        if (cursor) {
+            appendActivityData(activityData);
+        } else {
+            displayActivityData(activityData);
+        }
         
     } catch (error) {
         console.error('Failed to load activity data:', error);
@@ -144,6 +152,44 @@ function displayActivityData(activityData) {
         const activityElement = createActivityElement(activity);
         activityList.appendChild(activityElement);
     });
+    updateLoadMoreButton(activityData.next_cursor);
+}
+
+function appendActivityData(activityData) {
+    // Add an older page below the items already shown
+    const activityList = document.getElementById('activity-list');
+    const activities = Array.isArray(activityData.activities) ? activityData.activities : [];
+    cachedActivities = cachedActivities.concat(activities);
+    activities.forEach((activity) => {
+        activityList.appendChild(createActivityElement(activity));
+    });
+    updateLoadMoreButton(activityData.next_cursor);
+}
+
+function updateLoadMoreButton(cursor) {
+    nextActivityCursor = cursor || null;
+    const activityList = document.getElementById('activity-list');
+    let button = document.getElementById('load-more-activity-btn');
+    if (!nextActivityCursor) {
+        if (button) {
+            button.remove();
+        }
+        return;
+    }
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'load-more-activity-btn';
+        button.className = 'btn btn-outline';
+        button.textContent = 'Load more';
+        button.addEventListener('click', () => {
+            button.disabled = true;
+            loadActivityData(nextActivityCursor).finally(() => {
+                button.disabled = false;
+            });
+        });
+    }
+    // Keep the button after the last activity
+    activityList.appendChild(button);
 }
 
 function getCategoryImagePath(category) {
@@ -529,13 +575,21 @@ function createAttachmentItem(attachment) {
     
     const preview = document.createElement('div');
     preview.className = 'activity-attachment-preview';
-    if (attachment.mime_type && attachment.mime_type.startsWith('image/')) {
+    const fallbackIcon = attachment.mime_type === 'application/pdf' ? '📄' : '📎';
+    // Prefer the small server-side thumbnail; fall back to the original image
+    const previewUrl = attachment.thumbnail_url
+        || (attachment.mime_type && attachment.mime_type.startsWith('image/') ? attachment.url : null);
+    if (previewUrl) {
         const img = document.createElement('img');
-        img.src = attachment.url;
+        img.src = previewUrl;
+        img.loading = 'lazy';
         img.alt = attachment.file_name || 'Attachment preview';
+        img.onerror = () => {
+            preview.textContent = fallbackIcon;
+        };
         preview.appendChild(img);
     } else {
-        preview.textContent = attachment.mime_type === 'application/pdf' ? '📄' : '📎';
+        preview.textContent = fallbackIcon;
     }
     
     const meta = document.createElement('div');
@@ -62,6 +62,9 @@ async function checkAuthentication() {
         // Load unpaid expenses alerts
         loadUnpaidExpenses();
         
+        // Keep them current without reloading the page
+        startLiveUpdates(data.user);
+        
     } catch (error) {
         console.error('Authentication check failed:', error);
         // On network error, allow user to stay but show warning
@@ -121,6 +124,34 @@ async function loadBalanceData() {
     }
 }
 
+function startLiveUpdates(user) {
+    const stream = openEventStream('/api/events', {
+        expense_added: applyDashboardEvent,
+        payment_recorded: applyDashboardEvent,
+        member_joined: event => {
+            // Only a group the user just joined changes the dropdowns
+            if (user && event.member && event.member.user_id === user.id) {
+                loadGroupsData();
+            }
+        },
+        resync: () => {
+            loadBalanceData();
+            loadGroupsData();
+            loadUnpaidExpenses();
+        }
+    });
+    window.addEventListener('pagehide', () => stream.close());
+}
+
+function applyDashboardEvent(event) {
+    // Totals come with the event when the user's balances moved
+    if (event.balance) {
+        displayBalanceData(event.balance);
+        // The alerts group debts per person, so only that list is re-fetched
+        loadUnpaidExpenses();
+    }
+}
+
 function displayBalanceData(balanceData) {
     // Update main balance
     const balanceAmount = document.querySelector('.balance-amount');
@@ -258,6 +289,26 @@ function logout() {
     window.location.href = 'login.html';
 }
 
+// Poll a background OCR job until it finishes (or we give up)
+async function waitForOcrJob(statusUrl, token, maxAttempts = 60) {
+    for (let attempt = 0; attempt < maxAttempts; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(statusUrl, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        const job = await response.json();
+        if (!response.ok) {
+            return job;
+        }
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+    }
+    return { error: 'Receipt scan is taking too long. Please enter the amount manually.' };
+}
+
 function setupReceiptAttachmentHandlers() {
     const fileInput = document.getElementById('expenseReceipt');
     const receiptCheckbox = document.getElementById('expenseReceiptIsReceipt');
@@ -297,7 +348,10 @@ function setupReceiptAttachmentHandlers() {
                 },
                 body: formData
             });
-            const data = await response.json();
+            let data = await response.json();
+            if (response.status === 202 && data.status_url) {
+                data = await waitForOcrJob(data.status_url, token);
+            }
             if (response.ok && typeof data.detected_total === 'number') {
                 receiptAttachmentState.detectedTotal = data.detected_total;
                 const amountInput = document.getElementById('expenseAmount');
@@ -8,6 +8,10 @@ document.addEventListener('DOMContentLoaded', function() {
 let currentGroupId = null;
 let currentGroupName = null;
 let currentGroupActivities = [];
+let nextGroupActivityCursor = null;
+let currentMembers = [];
+let currentBalanceRows = [];
+let groupEventStream = null;
 
 async function checkAuthentication() {
     const token = localStorage.getItem('token');
@@ -63,11 +67,86 @@ async function loadGroupDetails() {
         titleElement.textContent = currentGroupName;
     }
     
+    // Open the live stream before the first load so nothing committed in
+    // between is missed
+    startLiveUpdates();
+    
     // Load balances and activity
     await loadBalances();
     await loadActivity();
 }
 
+function startLiveUpdates() {
+    groupEventStream = openEventStream(`/api/groups/${currentGroupId}/events`, {
+        expense_added: applyGroupEvent,
+        payment_recorded: applyGroupEvent,
+        member_joined: applyGroupEvent,
+        // Missed too much to patch in place
+        resync: () => {
+            loadBalances();
+            loadActivity();
+        }
+    });
+    window.addEventListener('pagehide', () => groupEventStream.close());
+}
+
+function applyGroupEvent(event) {
+    // Events only carry what changed: merge it into what is on screen
+    const balanceRows = event.balances || [];
+    if (event.member && !currentMembers.some(member => member.member_id === event.member.user_id)) {
+        currentMembers.push({ member_id: event.member.user_id, member_name: event.member.username });
+        currentMembers.sort((a, b) => a.member_name.localeCompare(b.member_name));
+    }
+    balanceRows.forEach(mergeBalanceRow);
+    // Until the first load finishes there is nothing to patch
+    if ((event.member || balanceRows.length > 0) && currentMembers.length > 0) {
+        displayBalances(computeMemberTotals(currentMembers, currentBalanceRows));
+    }
+    if (event.activity) {
+        prependActivity(event.activity);
+    }
+}
+
+function mergeBalanceRow(row) {
+    // One row per pair of members; a settled pair arrives with amount 0
+    const samePair = existing =>
+        (existing.lender_id === row.lender_id && existing.borrower_id === row.borrower_id) ||
+        (existing.lender_id === row.borrower_id && existing.borrower_id === row.lender_id);
+    currentBalanceRows = currentBalanceRows.filter(existing => !samePair(existing));
+    if (row.amount > 0) {
+        currentBalanceRows.push(row);
+    }
+    currentBalanceRows.sort((a, b) => a.lender_id - b.lender_id || a.borrower_id - b.borrower_id);
+}
+
+function computeMemberTotals(members, balanceRows) {
+    // Same totals and breakdowns as /api/groups/<id>/balances
+    const totals = new Map();
+    members.forEach(member => {
+        totals.set(member.member_id, {
+            member_id: member.member_id,
+            member_name: member.member_name,
+            owes: 0,
+            is_owed: 0,
+            owes_breakdown: [],
+            is_owed_breakdown: []
+        });
+    });
+    balanceRows.forEach(row => {
+        const borrower = totals.get(row.borrower_id);
+        if (borrower) {
+            borrower.owes += row.amount;
+            borrower.owes_breakdown.push({ to: row.lender_name, amount: row.amount });
+        }
+        const lender = totals.get(row.lender_id);
+        if (lender) {
+            lender.is_owed += row.amount;
+            lender.is_owed_breakdown.push({ from: row.borrower_name, amount: row.amount });
+        }
+    });
+    return Array.from(totals.values());
+}
+
 async function loadBalances() {
     const token = localStorage.getItem('token');
     const balancesList = document.getElementById('balances-list');
@@ -95,6 +174,11 @@ async function loadBalances() {
         }
         
         const data = await response.json();
+        currentBalanceRows = data.balances || [];
+        currentMembers = (data.members || []).map(member => ({
+            member_id: member.member_id,
+            member_name: member.member_name
+        }));
         
         if (data.members && data.members.length > 0) {
             displayBalances(data.members);
@@ -195,7 +279,7 @@ function displayBalancesError() {
     }
 }
 
-async function loadActivity() {
+async function loadActivity(cursor = null) {
     const token = localStorage.getItem('token');
     const activityList = document.getElementById('activity-list');
     const noActivity = document.getElementById('no-activity');
@@ -207,7 +291,8 @@ async function loadActivity() {
     }
     
     try {
-        const response = await fetch(`http://localhost:5000/api/groups/${currentGroupId}/activity`, {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await fetch(`http://localhost:5000/api/groups/${currentGroupId}/activity${query}`, {
             method: 'GET',
             headers: {
                 'Authorization': `Bearer ${token}`,
@@ -223,8 +308,10 @@ async function loadActivity() {
         
         const data = await response.json();
         
-        if (data.activities && data.activities.length > 0) {
-            displayActivity(data.activities);
+        if (cursor) {
+            appendActivity(data.activities || [], data.next_cursor);
+        } else if (data.activities && data.activities.length > 0) {
+            displayActivity(data.activities, data.next_cursor);
         } else {
             // Show empty state
             if (activityList) {
@@ -240,7 +327,7 @@ async function loadActivity() {
     }
 }
 
-function displayActivity(activities) {
+function displayActivity(activities, nextCursor = null) {
     const activityList = document.getElementById('activity-list');
     const noActivity = document.getElementById('no-activity');
     currentGroupActivities = Array.isArray(activities) ? activities : [];
@@ -257,6 +344,59 @@ function displayActivity(activities) {
         const activityElement = createActivityElement(activity);
         activityList.appendChild(activityElement);
     });
+    updateLoadMoreButton(nextCursor);
+}
+
+function appendActivity(activities, nextCursor) {
+    // Add an older page below the items already shown
+    const activityList = document.getElementById('activity-list');
+    currentGroupActivities = currentGroupActivities.concat(activities);
+    activities.forEach(activity => {
+        activityList.appendChild(createActivityElement(activity));
+    });
+    updateLoadMoreButton(nextCursor);
+}
+
+function prependActivity(activity) {
+    // A live update: the newest item goes on top
+    if (currentGroupActivities.some(existing => existing.id === activity.id)) {
+        return;
+    }
+    const activityList = document.getElementById('activity-list');
+    const noActivity = document.getElementById('no-activity');
+    if (!activityList) return;
+    currentGroupActivities.unshift(activity);
+    activityList.style.display = 'block';
+    if (noActivity) {
+        noActivity.style.display = 'none';
+    }
+    activityList.insertBefore(createActivityElement(activity), activityList.firstChild);
+}
+
+function updateLoadMoreButton(cursor) {
+    nextGroupActivityCursor = cursor || null;
+    const activityList = document.getElementById('activity-list');
+    let button = document.getElementById('load-more-activity-btn');
+    if (!nextGroupActivityCursor) {
+        if (button) {
+            button.remove();
+        }
+        return;
+    }
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'load-more-activity-btn';
+        button.className = 'btn btn-outline';
+        button.textContent = 'Load more';
+        button.addEventListener('click', () => {
+            button.disabled = true;
+            loadActivity(nextGroupActivityCursor).finally(() => {
+                button.disabled = false;
+            });
+        });
+    }
+    // Keep the button after the last activity
+    activityList.appendChild(button);
 }
 
 function getCategoryImagePath(category) {
@@ -576,13 +716,21 @@ function createAttachmentItem(attachment) {
     
     const preview = document.createElement('div');
     preview.className = 'activity-attachment-preview';
-    if (attachment.mime_type && attachment.mime_type.startsWith('image/')) {
+    const fallbackIcon = attachment.mime_type === 'application/pdf' ? '📄' : '📎';
+    // Prefer the small server-side thumbnail; fall back to the original image
+    const previewUrl = attachment.thumbnail_url
+        || (attachment.mime_type && attachment.mime_type.startsWith('image/') ? attachment.url : null);
+    if (previewUrl) {
         const img = document.createElement('img');
-        img.src = attachment.url;
+        img.src = previewUrl;
+        img.loading = 'lazy';
         img.alt = attachment.file_name || 'Attachment preview';
+        img.onerror = () => {
+            preview.textContent = fallbackIcon;
+        };
         preview.appendChild(img);
     } else {
-        preview.textContent = attachment.mime_type === 'application/pdf' ? '📄' : '📎';
+        preview.textContent = fallbackIcon;
     }
     
     const meta = document.createElement('div');
@@ -248,8 +248,9 @@ async function handleJoinGroup() {
     const joinCode = document.getElementById('joinCode').value.trim().toUpperCase();
     
     // Validate join code
-    if (!joinCode || joinCode.length !== 4) {
-        alert('Please enter a valid 4-character join code');
+    // Codes start at 4 characters and grow as more groups are created
+    if (!/^[A-Z0-9]{4,8}$/.test(joinCode)) {
+        alert('Please enter a valid join code (4 to 8 letters or digits)');
         return;
     }
     
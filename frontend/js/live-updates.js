@@ -0,0 +1,86 @@
+// Live updates from the backend's Server-Sent Events streams.
+// EventSource cannot send the Authorization header, so the stream is read
+// with fetch and parsed here. Reconnects with Last-Event-ID so events
+// published while disconnected are replayed.
+function openEventStream(path, handlers) {
+    let lastEventId = null;
+    let retryMs = 3000;
+    let controller = null;
+    let stopped = false;
+
+    function dispatch(message) {
+        if (message.id) {
+            lastEventId = message.id;
+        }
+        const handler = handlers[message.event];
+        if (!handler) return;
+        try {
+            handler(message.data ? JSON.parse(message.data) : {});
+        } catch (error) {
+            console.error(`Failed to handle ${message.event} event:`, error);
+        }
+    }
+
+    function parseBlock(block) {
+        const message = { id: null, event: 'message', data: '' };
+        block.split('\n').forEach(line => {
+            if (!line || line.startsWith(':')) return;  // comments are keep-alives
+            const separator = line.indexOf(':');
+            const field = separator === -1 ? line : line.slice(0, separator);
+            const value = separator === -1 ? '' : line.slice(separator + 1).replace(/^ /, '');
+            if (field === 'id') message.id = value;
+            else if (field === 'event') message.event = value;
+            else if (field === 'data') message.data += (message.data ? '\n' : '') + value;
+            else if (field === 'retry' && /^\d+$/.test(value)) retryMs = parseInt(value, 10);
+        });
+        if (message.data || message.id) {
+            dispatch(message);
+        }
+    }
+
+    async function connect() {
+        const token = localStorage.getItem('token');
+        if (!token || stopped) return;
+        controller = new AbortController();
+        const headers = { 'Authorization': `Bearer ${token}`, 'Accept': 'text/event-stream' };
+        if (lastEventId) {
+            headers['Last-Event-ID'] = lastEventId;
+        }
+        try {
+            const response = await fetch(`http://localhost:5000${path}`, { headers, signal: controller.signal });
+            if (response.status === 401 || response.status === 403) {
+                return;  // not allowed; retrying would not help
+            }
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true }).replace(/\r\n?/g, '\n');
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    parseBlock(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                }
+            }
+        } catch (error) {
+            if (stopped) return;
+            console.warn('Live updates disconnected:', error);
+        }
+        if (!stopped) {
+            setTimeout(connect, retryMs);
+        }
+    }
+
+    connect();
+    return {
+        close() {
+            stopped = true;
+            if (controller) controller.abort();
+        }
+    };
+}